@@ -0,0 +1,252 @@
+import logging
+logger = logging.getLogger(__name__)
+
+logger.debug("Importing admission.py...")
+
+# --- Imports ---
+# utils.py imports the deadline helpers in inference workers too, so starlette is
+# only imported by the body-limit middleware, which runs in the API process
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from metrics import counter
+
+# --- Configuration ---
+# Under a traffic spike every request used to be accepted and queued behind
+# CPU-bound work, so latency grew without bound and clients gave up on
+# results that were still computed. These settings shed load early instead.
+#   ADMISSION_MAX_CONCURRENT:  /classify_email/ requests processed at once; 0 disables
+#                              admission control (default: 0)
+#   ADMISSION_QUEUE_DEPTH:     requests allowed to wait for a slot; beyond that the API
+#                              answers 429 (default: 4 x ADMISSION_MAX_CONCURRENT)
+#   ADMISSION_QUEUE_TIMEOUT_MS: longest wait for a slot before answering 503 (default: 1000)
+#   MAX_REQUEST_BODY_BYTES:    largest accepted request body, answered with 413 beyond
+#                              that; 0 = no limit (default: 10 MiB). The NDJSON stream
+#                              endpoint is exempt, it limits each record instead.
+#   REQUEST_DEADLINE_MS:       default time budget of a request, from arrival; clients may
+#                              send a shorter one in X-Request-Deadline-Ms; 0 = none (default: 0)
+ADMISSION_MAX_CONCURRENT = int(os.environ.get("ADMISSION_MAX_CONCURRENT", 0))
+ADMISSION_QUEUE_DEPTH = int(os.environ.get("ADMISSION_QUEUE_DEPTH", 4 * ADMISSION_MAX_CONCURRENT))
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT_MS", 1000))
+MAX_REQUEST_BODY_BYTES = int(os.environ.get("MAX_REQUEST_BODY_BYTES", 10 * 1024 * 1024))
+REQUEST_DEADLINE_MS = float(os.environ.get("REQUEST_DEADLINE_MS", 0))
+
+DEADLINE_HEADER = "X-Request-Deadline-Ms"
+RETRY_AFTER_MAX_S = 60
+EWMA_ALPHA = 0.2  # Weight of the newest observation in the service time average
+
+# Reasons a request is turned away:
+#   queue_full:        admission queue full (429)
+#   queue_timeout:     no slot within ADMISSION_QUEUE_TIMEOUT_MS (503)
+#   pool_saturated:    inference pool queue full (503)
+#   body_too_large:    body over MAX_REQUEST_BODY_BYTES (413)
+#   deadline_exceeded: deadline passed before the work was done (504), see deadline_exceeded_total
+SHED_REASONS = ("queue_full", "queue_timeout", "pool_saturated", "body_too_large", "deadline_exceeded")
+REQUESTS_SHED = counter("requests_shed_total", "Requests turned away under load, by reason.", labelnames=("reason",))
+DEADLINE_EXCEEDED = counter(
+    "deadline_exceeded_total",
+    "Requests dropped because their deadline passed, by the stage they were about to start.",
+    labelnames=("stage",),
+)
+
+# --- Deadlines ---
+# A deadline is an absolute time.monotonic() value. CLOCK_MONOTONIC is
+# system-wide on Linux, so it is also valid in inference worker processes.
+class DeadlineExceeded(RuntimeError):
+    """Raised when a request's deadline passes before `stage` starts."""
+
+    def __init__(self, stage: str):
+        super().__init__(stage)
+        self.stage = stage
+
+    def __str__(self) -> str:
+        return f"Request deadline exceeded before the {self.stage} stage."
+
+def request_deadline(timeout_ms: Optional[float] = None, default_ms: float = REQUEST_DEADLINE_MS) -> Optional[float]:
+    """
+    Deadline for a request arriving now: the shorter of the client's
+    `timeout_ms` and `default_ms` (each ignored when missing or <= 0).
+    """
+    budgets = [ms for ms in (timeout_ms, default_ms) if ms is not None and ms > 0]
+    if not budgets:
+        return None
+    return time.monotonic() + min(budgets) / 1000
+
+def parse_deadline_header(value: Optional[str]) -> Optional[float]:
+    """Deadline from an X-Request-Deadline-Ms value; raises ValueError for a malformed one."""
+    if value is None:
+        return request_deadline()
+    try:
+        timeout_ms = float(value)
+    except ValueError:
+        timeout_ms = math.nan  # Not a number: same error as the other malformed values
+    if not math.isfinite(timeout_ms) or timeout_ms <= 0:
+        raise ValueError(f"{DEADLINE_HEADER} must be a positive number of milliseconds, got {value!r}")
+    return request_deadline(timeout_ms)
+
+def remaining_s(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else deadline - time.monotonic()
+
+def deadline_exceeded(stage: str) -> DeadlineExceeded:
+    """Counts a request dropped before `stage` and returns the exception to raise."""
+    DEADLINE_EXCEEDED.inc(stage=stage)
+    return DeadlineExceeded(stage)
+
+def check_deadline(deadline: Optional[float], stage: str) -> None:
+    """Raises DeadlineExceeded when `deadline` has passed, so `stage` is not started."""
+    if deadline is not None and time.monotonic() >= deadline:
+        raise deadline_exceeded(stage)
+
+def count_shed(reason: str) -> None:
+    REQUESTS_SHED.inc(reason=reason)
+
+# --- Admission Control ---
+class AdmissionRejected(RuntimeError):
+    """Raised when a request is not admitted; carries the HTTP status and a Retry-After hint."""
+
+    def __init__(self, message: str, status_code: int, reason: str, retry_after_s: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+class AdmissionController:
+    """
+    Lets at most `max_concurrent` requests run and `queue_depth` more wait, in
+    arrival order. A request arriving to a full queue is rejected right away
+    (429); one that waits longer than `queue_timeout_ms`, or past its deadline,
+    gives up its place (503 / DeadlineExceeded). Retry-After is the time the
+    queue ahead needs to drain at the observed service time.
+    Only used from the event loop thread.
+    """
+
+    def __init__(self, max_concurrent: int = ADMISSION_MAX_CONCURRENT, queue_depth: int = ADMISSION_QUEUE_DEPTH,
+                 queue_timeout_ms: float = ADMISSION_QUEUE_TIMEOUT_MS):
+        self.max_concurrent = max(1, max_concurrent)
+        self.queue_depth = max(0, queue_depth)
+        self.queue_timeout_ms = max(0.0, queue_timeout_ms)
+        self.active = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+        self._service_s: Optional[float] = None  # EWMA of the time a request holds its slot
+        self.stats = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_queue_timeout": 0,
+                      "expired_in_queue": 0}
+
+    def retry_after_s(self) -> int:
+        """Seconds until the requests ahead of a new arrival should have drained (1 to RETRY_AFTER_MAX_S)."""
+        ahead = self.active + len(self._waiters)
+        drain_s = ahead * (self._service_s or 1.0) / self.max_concurrent
+        return max(1, min(RETRY_AFTER_MAX_S, math.ceil(drain_s)))
+
+    def _reject(self, message: str, status_code: int, reason: str) -> AdmissionRejected:
+        self.stats[f"rejected_{reason}"] += 1
+        count_shed(reason)
+        return AdmissionRejected(message, status_code, reason, self.retry_after_s())
+
+    async def acquire(self, deadline: Optional[float] = None) -> None:
+        """Waits for a slot. Raises AdmissionRejected or DeadlineExceeded instead of waiting too long."""
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            self.stats["admitted"] += 1
+            return
+        if len(self._waiters) >= self.queue_depth:
+            raise self._reject(f"Too many requests queued ({len(self._waiters)}). Try again later.", 429, "queue_full")
+
+        timeout_s = self.queue_timeout_ms / 1000 if self.queue_timeout_ms > 0 else None
+        deadline_s = remaining_s(deadline)
+        expires_first = deadline_s is not None and (timeout_s is None or deadline_s <= timeout_s)
+        if expires_first:
+            timeout_s = max(0.0, deadline_s)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.stats["queued"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout_s)
+        except BaseException as e:  # Timed out, or the client went away
+            self._leave_queue(waiter)
+            if not isinstance(e, asyncio.TimeoutError):
+                raise
+            if expires_first:
+                self.stats["expired_in_queue"] += 1
+                raise deadline_exceeded("queue")
+            raise self._reject("Timed out waiting for a free slot. Try again later.", 503, "queue_timeout")
+        self.stats["admitted"] += 1
+
+    def _leave_queue(self, waiter: asyncio.Future) -> None:
+        if waiter.done():
+            self.release()  # The slot was handed over just as the wait ended; pass it on
+        else:
+            waiter.cancel()
+            self._waiters.remove(waiter)
+
+    def release(self, service_s: Optional[float] = None) -> None:
+        """Frees a slot, handing it to the oldest waiter that is still waiting."""
+        if service_s is not None:
+            self._service_s = service_s if self._service_s is None else (1 - EWMA_ALPHA) * self._service_s + EWMA_ALPHA * service_s
+        if self._waiters:
+            self._waiters.popleft().set_result(None)  # The slot moves to the waiter; `active` is unchanged
+        else:
+            self.active -= 1
+
+    async def run(self, coro_factory, deadline: Optional[float] = None) -> Any:
+        """Awaits `coro_factory()` while holding a slot."""
+        await self.acquire(deadline)
+        started = time.monotonic()
+        try:
+            return await coro_factory()
+        finally:
+            self.release(time.monotonic() - started)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self.stats)
+        stats.update(max_concurrent=self.max_concurrent, queue_depth=self.queue_depth, active=self.active,
+                     queued_now=len(self._waiters),
+                     service_ms=round(self._service_s * 1000, 3) if self._service_s is not None else None)
+        return stats
+
+# --- Request Body Limit ---
+class BodySizeLimitMiddleware:
+    """
+    ASGI middleware answering 413 for request bodies over `max_bytes`: at once
+    when Content-Length says so, else as soon as the streamed body passes the
+    limit, so an oversized upload is never buffered whole.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_REQUEST_BODY_BYTES, exempt_paths: tuple = ()):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.exempt_paths = frozenset(exempt_paths)
+
+    def _too_large(self):
+        from starlette.exceptions import HTTPException
+
+        count_shed("body_too_large")
+        return HTTPException(status_code=413, detail=f"Request body exceeds MAX_REQUEST_BODY_BYTES ({self.max_bytes} bytes).")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_bytes <= 0 or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+        declared = dict(scope["headers"]).get(b"content-length", b"")
+        too_large = declared.isdigit() and int(declared) > self.max_bytes
+        received = 0
+
+        async def limited_receive():
+            # Raised while the endpoint reads its body; FastAPI passes HTTPExceptions on to the 413 handler
+            nonlocal received
+            if too_large:
+                raise self._too_large()
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise self._too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+logger.debug("admission.py finished importing.")
@@ -1,41 +1,148 @@
-print("Importing api.py...") # Add print statement
+import logging
+import os
 
-# --- Define/Import Pipeline Type FIRST ---
-try:
-    from sklearn.pipeline import Pipeline
-    print("api.py: Imported Pipeline from sklearn.")
-except ImportError:
-    Pipeline = object  # type: ignore
-    print("api.py: Defined fallback Pipeline type.")
+# --- Logging ---
+# Tracing output is logged at DEBUG and is off by default; set LOG_LEVEL=DEBUG
+# (or INFO for lifecycle messages only) to see it.
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "WARNING").strip().upper()
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+logger.debug("Importing api.py...")
 
 # --- Other Imports ---
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
-from typing import List, Dict, Tuple, Any, Optional, Union
-import sys
-import os
+import asyncio
+import hmac
+import json
+import time
+from fastapi import Body, Depends, FastAPI, Header, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Dict, Tuple, Any, Optional, Union, Literal
+
+from result_cache import get_result_cache_stats
+from inference_pool import InferencePool, PoolSaturatedError
+from micro_batcher import MicroBatcher, MICROBATCH_ENABLED
+from metrics import REGISTRY, counter, histogram
+from ndjson_stream import NDJSON_MEDIA_TYPE, NDJSONStreamingResponse, iter_ndjson_lines, stream_in_order
+from model_registry import MODEL_WATCH_INTERVAL_S, set_current
+from admission import (
+    ADMISSION_MAX_CONCURRENT, DEADLINE_HEADER, MAX_REQUEST_BODY_BYTES, AdmissionController, AdmissionRejected,
+    BodySizeLimitMiddleware, DeadlineExceeded, count_shed, deadline_exceeded, parse_deadline_header, remaining_s,
+)
+from profiling import (
+    PROFILE_DIR, PROFILE_FORMAT, PROFILE_SAMPLE_RATE, list_profiles, profile_path, run_profiled, should_sample,
+)
 
-# --- Import from utils (AFTER Pipeline is defined) ---
+# --- Import from utils ---
 try:
     # utils.py should now import without circular dependency issues
-    from utils import process_email_request, load_spacy_model, load_model_pipeline
-    print("api.py: Successfully imported from utils.")
+    from utils import (
+        process_email_request, process_email_batch, get_ner_gate_stats, warm_up,
+        get_model_stats, reload_model, start_model_watcher,
+    )
+    logger.debug("api.py: Successfully imported from utils.")
 except ImportError as e:
-    print(f"ERROR in api.py: Could not import from utils. Details: {e}")
+    logger.error(f"ERROR in api.py: Could not import from utils. Details: {e}")
+    _import_error = str(e)  # `e` is unbound once the except block ends; the dummies run later
     # Define dummy functions if import fails
-    def process_email_request(email_body: str): 
-        return {"error": f"Failed to import processing function: {e}"}
-    def load_spacy_model(): 
-        print("Dummy spacy loader called")
-        return None
-    def load_model_pipeline(): 
-        print("Dummy pipeline loader called")
-        return None
+    def process_email_request(email_body: str, include_offset_map: bool = False, ner_gate: Optional[str] = None, deadline=None):
+        return {"error": f"Failed to import processing function: {_import_error}"}
+    def process_email_batch(email_bodies, batch_size=None, n_process=None, ner_gate=None, deadline=None, deadlines=None):
+        return [{"error": f"Failed to import processing function: {_import_error}"} for _ in email_bodies]
+    def get_ner_gate_stats():
+        return {}
+    def warm_up():
+        logger.debug("Dummy warm-up called")
+        return False
+    def get_model_stats():
+        return {}
+    def reload_model(version=None):
+        raise RuntimeError(f"Failed to import the model reload function: {_import_error}")
+    def start_model_watcher(interval=None):
+        return False
 
 app = FastAPI(title="Email PII Classifier API", version="1.0.0")
 
+# --- Admin Access ---
+# /admin/* endpoints (and profiling a /classify_email/ call on request, see
+# profiling.py) are disabled unless ADMIN_TOKEN is set; callers then send it
+# in the X-Admin-Token header.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+# Set by serve.py: the models are loaded once in its master process, which also
+# watches the model registry and restarts the workers on a new version
+PREFORKED = os.environ.get("SERVE_PREFORKED") == "1"
+
+# Blocking inference runs on this pool (see inference_pool.py for INFERENCE_* settings)
+INFERENCE_POOL = InferencePool()
+
+async def _run_micro_batch(ner_gate: Optional[str], requests: List[Tuple[str, Optional[float]]]) -> List[Any]:
+    """
+    Processes a coalesced batch of (email body, deadline) requests on the
+    inference pool. Each email keeps its own deadline, so an expired one is
+    dropped before the next stage and its caller gets DeadlineExceeded.
+    """
+    email_bodies = [email_body for email_body, _ in requests]
+    deadlines = [deadline for _, deadline in requests]
+    return await INFERENCE_POOL.run(process_email_batch, email_bodies, ner_gate=ner_gate, deadlines=deadlines)
+
+# Coalesces concurrent /classify_email/ calls (see micro_batcher.py for MICROBATCH_* settings)
+MICRO_BATCHER: Optional[MicroBatcher] = (
+    MicroBatcher(_run_micro_batch, max_concurrent_batches=INFERENCE_POOL.workers) if MICROBATCH_ENABLED else None
+)
+
+# Bounds concurrent and queued /classify_email/ requests (see admission.py for
+# ADMISSION_*, MAX_REQUEST_BODY_BYTES and REQUEST_DEADLINE_MS)
+ADMISSION: Optional[AdmissionController] = AdmissionController() if ADMISSION_MAX_CONCURRENT > 0 else None
+# Inside the metrics middleware below, so 413s are counted per endpoint too
+app.add_middleware(BodySizeLimitMiddleware, max_bytes=MAX_REQUEST_BODY_BYTES, exempt_paths=("/classify_email/stream",))
+
+# --- Metrics ---
+HTTP_REQUESTS = counter("http_requests_total", "HTTP requests handled, by endpoint and status code.", labelnames=("endpoint", "status"))
+HTTP_LATENCY = histogram("http_request_duration_seconds", "End-to-end HTTP request latency, by endpoint.", labelnames=("endpoint",))
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template, not raw path, so unknown URLs can't blow up the label set
+        route = request.scope.get("route")
+        endpoint = getattr(route, "path", "unmatched")
+        HTTP_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint)
+        HTTP_REQUESTS.inc(endpoint=endpoint, status=str(status))
+
+def _collect_runtime_metrics():
+    """Scrape-time values for /metrics that live on the pool, cache and batcher objects."""
+    pool = INFERENCE_POOL.get_stats()
+    yield ("inference_pool_in_flight", "gauge", "Inference calls running or queued.", [({}, pool["in_flight"])])
+    yield ("inference_pool_calls_total", "counter", "Inference pool calls, by outcome.",
+           [({"outcome": outcome}, pool[outcome]) for outcome in ("submitted", "completed", "failed", "rejected")])
+    cache = get_result_cache_stats()
+    if cache:
+        yield ("result_cache_entries", "gauge", "Entries in the in-memory result cache.", [({}, cache["entries"])])
+        yield ("result_cache_events_total", "counter", "Result cache events, by kind.",
+               [({"event": event}, value) for event, value in cache.items() if event != "entries"])
+    if MICRO_BATCHER is not None:
+        batcher = MICRO_BATCHER.get_stats()
+        yield ("microbatch_pending", "gauge", "Requests waiting in the micro-batch queue.", [({}, batcher["pending"])])
+        yield ("microbatch_batch_limit", "gauge", "Current adaptive micro-batch size limit.", [({}, batcher["current_batch_limit"])])
+    if ADMISSION is not None:
+        admission = ADMISSION.get_stats()
+        yield ("admission_active", "gauge", "/classify_email/ requests holding an admission slot.", [({}, admission["active"])])
+        yield ("admission_queued", "gauge", "/classify_email/ requests waiting for an admission slot.", [({}, admission["queued_now"])])
+
+REGISTRY.register_collector(_collect_runtime_metrics)
+
 class EmailInput(BaseModel):
     email_body: str = Field(..., example="Hello, my name is Jane Doe and my email is jane.doe@example.com. I have a billing question.")
+    include_offset_map: bool = Field(False, description="Also return the masked <-> original offset map")
+    ner_gate: Optional[Literal["off", "on", "shadow"]] = Field(None, description="NER pre-gate mode for this request (defaults to NER_GATE_MODE)")
 
 class MaskedEntity(BaseModel):
     position: List[int] = Field(..., example=[18, 26])
@@ -47,24 +154,165 @@ class EmailResponse(BaseModel):
     list_of_masked_entities: List[MaskedEntity]
     masked_email: str
     category_of_the_email: str
+    model_version: Optional[str] = None  # Classifier version that produced the category
+    profile_id: Optional[str] = None  # Set when this call was profiled, see GET /admin/profiles
+    # [[masked_start, masked_end, original_start, original_end], ...] per placeholder
+    offset_map: Optional[List[List[int]]] = None
+
+# --- Batch Limits ---
+# A batch is processed as one inference call, so its size is bounded up front
+# (422 beyond these). nlp.pipe worker processes are not a request field: the
+# server always uses SPACY_N_PROCESS.
+#   MAX_BATCH_EMAILS:     most emails accepted in one /classify_email/batch call;
+#                         0 = no limit (default: 1000)
+#   MAX_SPACY_BATCH_SIZE: largest nlp.pipe batch_size a request may ask for (default: 1024)
+MAX_BATCH_EMAILS = int(os.environ.get("MAX_BATCH_EMAILS", 1000))
+MAX_SPACY_BATCH_SIZE = int(os.environ.get("MAX_SPACY_BATCH_SIZE", 1024))
+
+class EmailBatchInput(BaseModel):
+    emails: List[str] = Field(..., max_length=MAX_BATCH_EMAILS or None,
+                              example=["Hi, I was charged twice this month.", "My name is John Smith and I cannot log in."])
+    batch_size: Optional[int] = Field(None, ge=1, le=MAX_SPACY_BATCH_SIZE, description="nlp.pipe batch size (defaults to SPACY_BATCH_SIZE)")
+    ner_gate: Optional[Literal["off", "on", "shadow"]] = Field(None, description="NER pre-gate mode for this batch (defaults to NER_GATE_MODE)")
+
+class EmailError(BaseModel):
+    error: str
+    input_email_body: Optional[Any] = None
+
+class EmailBatchResponse(BaseModel):
+    results: List[Union[EmailResponse, EmailError]]
 
 # --- Load models on startup ---
+# Loading and the warm-up inference run in the background, so /healthz answers
+# while a slow model load is in progress and /readyz turns 200 only once the
+# first request will not pay any cold-start cost.
+READINESS: Dict[str, Any] = {"status": "starting", "detail": None, "warm_up_seconds": None}
+_warm_up_task: Optional[asyncio.Task] = None
+
+async def _load_and_warm_up() -> None:
+    started = time.perf_counter()
+    try:
+        await INFERENCE_POOL.warm_up()  # Process workers load and warm up in their initializer
+        # Thread/inline backends: loads the shared models; process backend: checks a worker end to end
+        ready = await INFERENCE_POOL.run(warm_up)
+    except Exception as e:
+        logger.error(f"Warm-up failed: {e}")
+        ready, READINESS["detail"] = False, str(e)
+    READINESS["warm_up_seconds"] = round(time.perf_counter() - started, 3)
+    if ready:
+        READINESS["status"] = "ready"
+        logger.info(f"FastAPI startup: models loaded and warmed up in {READINESS['warm_up_seconds']}s.")
+        if INFERENCE_POOL.backend != "process" and not PREFORKED:
+            start_model_watcher()  # Process workers each run their own (see inference_pool._init_worker)
+    else:
+        READINESS["status"] = "failed"
+        READINESS["detail"] = READINESS["detail"] or "Model loading or the warm-up inference failed, see the logs."
+
 @app.on_event("startup")
 async def startup_event():
-    print("FastAPI startup: Loading models...")
-    load_spacy_model()       # Load spaCy model
-    load_model_pipeline()    # Load classification pipeline
-    print("FastAPI startup: Model loading complete.")
+    global _warm_up_task
+    INFERENCE_POOL.start()
+    if MICRO_BATCHER is not None:
+        MICRO_BATCHER.start()
+    _warm_up_task = asyncio.create_task(_load_and_warm_up())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if _warm_up_task is not None and not _warm_up_task.done():
+        _warm_up_task.cancel()
+    if MICRO_BATCHER is not None:
+        await MICRO_BATCHER.stop()
+    INFERENCE_POOL.shutdown()
+
+# --- Load Shedding ---
+def request_deadline(x_request_deadline_ms: Optional[str] = Header(None, alias=DEADLINE_HEADER)) -> Optional[float]:
+    """Dependency: the request's time.monotonic() deadline (client header or REQUEST_DEADLINE_MS), or None."""
+    try:
+        return parse_deadline_header(x_request_deadline_ms)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _retry_after() -> Dict[str, str]:
+    return {"Retry-After": str(ADMISSION.retry_after_s() if ADMISSION is not None else 1)}
+
+def _shed(e: Exception) -> HTTPException:
+    """Maps an overload or deadline error to its HTTP error (429/503/504) and counts it."""
+    if isinstance(e, AdmissionRejected):  # Counted by the controller
+        return HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after_s)})
+    if isinstance(e, PoolSaturatedError):
+        count_shed("pool_saturated")
+        return HTTPException(status_code=503, detail=str(e), headers=_retry_after())
+    count_shed("deadline_exceeded")
+    return HTTPException(status_code=504, detail=str(e))
 
 # --- API Endpoint ---
-@app.post("/classify_email/", response_model=Union[EmailResponse, Dict[str, str]])  # Allow dict for error response
-async def classify_email(email_input: EmailInput):
+async def _classify(email_input: EmailInput, deadline: Optional[float] = None, profile: Optional[str] = None) -> dict:
+    """
+    Runs one email through the micro-batcher (when enabled) or the inference
+    pool. Past `deadline` the caller stops waiting: work still queued is never
+    started, and running work stops at its next stage (DeadlineExceeded).
+    With `profile` (a profiling trigger) the call bypasses the micro-batcher
+    and is profiled on its worker; the result then carries "profile_id".
+    """
+    kwargs = dict(include_offset_map=email_input.include_offset_map, ner_gate=email_input.ner_gate, deadline=deadline)
+    if profile is not None:
+        work = INFERENCE_POOL.run(run_profiled, process_email_request, (email_input.email_body,), kwargs, profile)
+    elif MICRO_BATCHER is not None and not email_input.include_offset_map:
+        # Coalesced with other concurrent requests into one process_email_batch call
+        work = MICRO_BATCHER.submit(email_input.ner_gate, (email_input.email_body, deadline))
+    else:
+        work = INFERENCE_POOL.run(process_email_request, email_input.email_body, **kwargs)
+    try:
+        result = await (work if deadline is None else asyncio.wait_for(work, max(0.0, remaining_s(deadline))))
+    except asyncio.TimeoutError:
+        raise deadline_exceeded("inference")
+    if profile is not None:
+        result, profile_id = result
+        result = dict(result, profile_id=profile_id)
+    return result
+
+async def classify_for_ui(email_body: str) -> dict:
+    """
+    In-process handler for the Gradio UI that app.py mounts: the
+    /classify_email/ path (admission control, pool, micro-batcher) without
+    an HTTP hop. Overload and deadline errors come back as {"error": ...}.
+    """
+    try:
+        deadline = parse_deadline_header(None)
+        if ADMISSION is not None:
+            return await ADMISSION.run(lambda: _classify(EmailInput(email_body=email_body), deadline), deadline)
+        return await _classify(EmailInput(email_body=email_body), deadline)
+    except (AdmissionRejected, PoolSaturatedError, DeadlineExceeded) as e:
+        return {"error": _shed(e).detail}
+
+def profile_trigger(profile: bool = False, x_profile: Optional[str] = Header(None),
+                    x_admin_token: Optional[str] = Header(None)) -> Optional[str]:
+    """
+    Dependency: "requested" when an admin asks to profile this call (X-Profile: 1
+    or ?profile=1 plus X-Admin-Token), "sampled" for the PROFILE_SAMPLE_RATE
+    fraction of calls, else None. The hint is a no-op when ADMIN_TOKEN is unset
+    or no token is sent, so the call is just classified; a wrong token gets 401.
+    """
+    requested = profile or (x_profile is not None and x_profile.strip().lower() in ("1", "true", "yes"))
+    if requested and ADMIN_TOKEN and x_admin_token is not None:
+        require_admin(x_admin_token)
+        return "requested"
+    return "sampled" if should_sample() else None
+
+@app.post("/classify_email/", response_model=Union[EmailResponse, Dict[str, str]], response_model_exclude_none=True)  # Allow dict for error response
+async def classify_email(email_input: EmailInput, deadline: Optional[float] = Depends(request_deadline),
+                         profile: Optional[str] = Depends(profile_trigger)):
     """
     Receives email body, performs PII masking and classification.
+    Answers 429/503 with Retry-After when overloaded and 504 when the
+    request's deadline (X-Request-Deadline-Ms) passes first.
     """
     try:
-        print("Received request for /classify_email/")  # Log request
-        result = process_email_request(email_input.email_body)
+        logger.debug("Received request for /classify_email/")  # Log request
+        if ADMISSION is not None:
+            result = await ADMISSION.run(lambda: _classify(email_input, deadline, profile), deadline)
+        else:
+            result = await _classify(email_input, deadline, profile)
 
         if "error" in result:
             # Return a 500 error if processing failed internally
@@ -77,22 +325,204 @@ async def classify_email(email_input: EmailInput):
     except HTTPException as http_exc:
         # Re-raise HTTP exceptions (like the 500 error above)
         raise http_exc
+    except (AdmissionRejected, PoolSaturatedError, DeadlineExceeded) as e:
+        raise _shed(e)
     except Exception as e:
-        print(f"Unexpected error in /classify_email endpoint: {e}")
+        logger.error(f"Unexpected error in /classify_email endpoint: {e}")
         # import traceback # Uncomment for detailed debugging
         # print(traceback.format_exc()) # Uncomment for detailed debugging
         # Return a generic 500 error for other unexpected issues
         raise HTTPException(status_code=500, detail=f"An internal server error occurred: {str(e)}")
 
+@app.post("/classify_email/batch", response_model=EmailBatchResponse, response_model_exclude_none=True)
+async def classify_email_batch(batch_input: EmailBatchInput, deadline: Optional[float] = Depends(request_deadline)):
+    """
+    Receives a list of email bodies, masks PII with nlp.pipe and classifies all
+    of them in one predict call. Results are returned in input order; a failed
+    email gets an error entry instead of failing the whole batch. The deadline
+    applies to the whole batch (504 once it passes).
+    """
+    try:
+        logger.debug("Received request for /classify_email/batch (%d emails)", len(batch_input.emails))  # Log request
+        work = INFERENCE_POOL.run(
+            process_email_batch,
+            batch_input.emails,
+            batch_size=batch_input.batch_size,
+            ner_gate=batch_input.ner_gate,
+            deadline=deadline,
+        )
+        try:
+            results = await (work if deadline is None else asyncio.wait_for(work, max(0.0, remaining_s(deadline))))
+        except asyncio.TimeoutError:
+            raise deadline_exceeded("inference")
+        return EmailBatchResponse(results=[
+            EmailError(**result) if "error" in result else EmailResponse(**result)
+            for result in results
+        ])
+
+    except (PoolSaturatedError, DeadlineExceeded) as e:
+        raise _shed(e)
+    except Exception as e:
+        logger.error(f"Unexpected error in /classify_email/batch endpoint: {e}")
+        raise HTTPException(status_code=500, detail=f"An internal server error occurred: {str(e)}")
+
+async def _classify_stream_record(index: int, record: Tuple[Optional[bytes], Optional[str]]) -> dict:
+    """Classifies one NDJSON record; every failure becomes an inline {"index", "error"} line."""
+    line, error = record
+    if error is None:
+        try:
+            fields = json.loads(line)
+            if not isinstance(fields, dict):
+                raise ValueError("each record must be a JSON object like the /classify_email/ body")
+            result = await _classify(EmailInput(**fields))
+            if "error" not in result:
+                return {"index": index, **result}
+            error = result["error"]
+        except ValidationError as e:
+            error = "Invalid record: " + "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+        except ValueError as e:  # Includes json.JSONDecodeError
+            error = f"Invalid record: {e}"
+        except PoolSaturatedError as e:
+            error = str(e)
+        except Exception as e:
+            logger.error(f"Unexpected error in /classify_email/stream record {index}: {e}")
+            error = f"An internal server error occurred: {str(e)}"
+    return {"index": index, "error": error}
+
+@app.post(
+    "/classify_email/stream",
+    response_class=NDJSONStreamingResponse,
+    openapi_extra={"requestBody": {"required": True, "content": {NDJSON_MEDIA_TYPE: {"schema": {
+        "type": "string", "description": "One /classify_email/ request body (JSON object) per line",
+    }}}}},
+)
+async def classify_email_stream(request: Request):
+    """
+    Reads newline-delimited JSON records (the /classify_email/ body, one per
+    line) as they are uploaded and streams one NDJSON result per record back in
+    input order, tagged with its 0-based "index". A record that fails gets an
+    inline error line instead of ending the stream. Records in flight are
+    bounded by NDJSON_STREAM_WINDOW, so memory does not grow with the upload.
+    """
+    logger.debug("Received request for /classify_email/stream")
+    return NDJSONStreamingResponse(stream_in_order(iter_ndjson_lines(request.stream()), _classify_stream_record))
+
 # --- Root Endpoint ---
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to the Email PII Classifier API. Use the /docs endpoint for details."}
 
-print("api.py finished importing.") # Add print statement
+# --- Health Endpoints ---
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and its event loop is responsive."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness: 200 once the models are loaded and a warm-up inference has
+    succeeded, 503 while starting up (or if that failed).
+    """
+    return JSONResponse(READINESS, status_code=200 if READINESS["status"] == "ready" else 503)
+
+# --- Admin Endpoints ---
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """Dependency for /admin/* endpoints: 404 unless ADMIN_TOKEN is set, 401 for a wrong token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid or missing X-Admin-Token header.")
+
+class ModelReloadInput(BaseModel):
+    version: Optional[str] = Field(None, description="Published version to activate (default: reload what CURRENT points at)")
+
+@app.post("/admin/reload_model", dependencies=[Depends(require_admin)])
+async def admin_reload_model(reload_input: Optional[ModelReloadInput] = Body(None)):
+    """
+    Points the registry's CURRENT at `version` (if given) and loads it off the
+    request path; in-flight requests finish on the old version, later ones get
+    the new one. With INFERENCE_BACKEND=process (or under serve.py) the
+    worker processes (or the serve.py master) switch on their next
+    MODEL_WATCH_INTERVAL_S poll, so this returns 202 right away.
+    """
+    version = reload_input.version if reload_input is not None else None
+    if version is not None:
+        try:
+            set_current(version)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except FileNotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+    if INFERENCE_POOL.backend == "process" or PREFORKED:
+        if MODEL_WATCH_INTERVAL_S <= 0:
+            raise HTTPException(status_code=409, detail="Models here only reload via the registry watcher; MODEL_WATCH_INTERVAL_S is 0.")
+        return JSONResponse({"status": "scheduled", "model_version": version, "within_seconds": MODEL_WATCH_INTERVAL_S}, status_code=202)
+    previous = get_model_stats().get("active_version")
+    try:
+        # On a plain thread, not the inference pool, so loading never takes a request's slot
+        model = await asyncio.get_running_loop().run_in_executor(None, reload_model, version)
+    except (FileNotFoundError, ValueError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reload failed, still serving {previous}: {e}")
+    return {"status": "ready", "model_version": model.version, "previous_version": previous}
+
+@app.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def admin_list_profiles():
+    """Lists the captured request profiles, newest first; fetch one with GET /admin/profiles/{name}."""
+    return {
+        "directory": str(PROFILE_DIR),
+        "format": PROFILE_FORMAT,
+        "sample_rate": PROFILE_SAMPLE_RATE,
+        "profiles": list_profiles(),
+    }
+
+@app.get("/admin/profiles/{name}", dependencies=[Depends(require_admin)])
+async def admin_get_profile(name: str):
+    """Downloads one profile: speedscope JSON (open in https://www.speedscope.app) or collapsed stacks."""
+    try:
+        path = profile_path(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail=f"Profile '{name}' not found (it may have been pruned).")
+    media_type = "application/json" if name.endswith(".json") else "text/plain"
+    return FileResponse(path, media_type=media_type, filename=name)
+
+# --- Stats Endpoint ---
+@app.get("/stats")
+async def read_stats():
+    """
+    Returns runtime counters (NER gate decisions, result cache, inference pool,
+    micro-batcher batch sizes and queueing delay, admission control) and the
+    served model version.
+    With INFERENCE_BACKEND=process the result cache and the models live in the
+    worker processes and their counters are not included here.
+    """
+    return {
+        "ner_gate": get_ner_gate_stats(),
+        "result_cache": get_result_cache_stats(),
+        "inference_pool": INFERENCE_POOL.get_stats(),
+        "micro_batcher": MICRO_BATCHER.get_stats() if MICRO_BATCHER is not None else {},
+        "admission": ADMISSION.get_stats() if ADMISSION is not None else {},
+        "model": get_model_stats(),
+    }
+
+# --- Metrics Endpoint ---
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    """
+    Prometheus text exposition: per-stage latency histograms (NER, regex scan,
+    mask assembly, text cleaning, predict), PII entity counts by type, HTTP
+    request counts/latency and pool, cache and micro-batcher gauges.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+logger.debug("api.py finished importing.")
 
 # --- Optional: Add uvicorn runner for local testing ---
 if __name__ == "__main__":
     import uvicorn
-    print("Starting Uvicorn server directly (for debugging)...")
+    logger.info("Starting Uvicorn server directly (for debugging)...")
     uvicorn.run(app, host="0.0.0.0", port=8000)
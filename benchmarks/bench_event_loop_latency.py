@@ -0,0 +1,132 @@
+"""
+Benchmark: request latency under mixed short/long email load, per inference backend.
+
+For each INFERENCE_BACKEND a uvicorn server is started in a subprocess and hit
+with concurrent /classify_email/ requests (mostly short emails, some very long
+ones), while a probe keeps calling `/`. Before the worker pool existed every
+request ran on the event loop, so one long email delayed everything, including
+`/`. The "inline" backend reproduces that behaviour for comparison.
+
+Run from the repository root (spaCy model and saved_models/ must be available):
+    python benchmarks/bench_event_loop_latency.py
+    python benchmarks/bench_event_loop_latency.py --backends inline,thread --duration 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# --- Configuration ---
+SHORT_EMAIL = "Hello, my name is Jane Doe and I was charged twice for order 48213. Please refund me."
+LONG_EMAIL_PARAGRAPH = (
+    "Please see the log below from our billing export for account 4111 1111 1111 1111, "
+    "contact John Smith at +91 98765-43210 or john.smith@example.com if anything looks wrong. "
+)
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+async def wait_until_up(client: httpx.AsyncClient, base_url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(f"{base_url}/")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError(f"Server at {base_url} did not come up within {timeout}s")
+
+async def drive_load(base_url: str, duration: float, concurrency: int, long_fraction: float, long_chars: int) -> dict:
+    long_email = (LONG_EMAIL_PARAGRAPH * (long_chars // len(LONG_EMAIL_PARAGRAPH) + 1))[:long_chars]
+    latencies = {"short": [], "long": [], "root": []}
+    errors = 0
+    rejected = 0  # 503s from a full inference queue
+    rnd = random.Random(0)
+
+    async with httpx.AsyncClient(timeout=120) as client:
+        await wait_until_up(client, base_url, timeout=120)
+        end_at = time.monotonic() + duration
+
+        async def classify_worker():
+            nonlocal errors, rejected
+            while time.monotonic() < end_at:
+                kind = "long" if rnd.random() < long_fraction else "short"
+                body = long_email if kind == "long" else SHORT_EMAIL
+                start = time.perf_counter()
+                response = await client.post(f"{base_url}/classify_email/", json={"email_body": body})
+                if response.status_code == 200:
+                    latencies[kind].append((time.perf_counter() - start) * 1000)
+                elif response.status_code == 503:
+                    rejected += 1
+                else:
+                    errors += 1
+
+        async def root_probe():
+            while time.monotonic() < end_at:
+                start = time.perf_counter()
+                await client.get(f"{base_url}/")
+                latencies["root"].append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(0.05)
+
+        await asyncio.gather(root_probe(), *(classify_worker() for _ in range(concurrency)))
+
+    summary = {"errors": errors, "rejected": rejected}
+    for kind, values in latencies.items():
+        values.sort()
+        summary[kind] = {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50), 1),
+            "p99_ms": round(percentile(values, 99), 1),
+        }
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="inline,thread,process", help="Comma-separated INFERENCE_BACKEND values")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds of load per backend")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent classify clients")
+    parser.add_argument("--long-fraction", type=float, default=0.1, help="Share of requests using the long email")
+    parser.add_argument("--long-chars", type=int, default=200_000, help="Size of the long email")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--server-cwd", default=str(REPO_ROOT), help="Directory the server runs in (must contain saved_models/)")
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = {}
+    for backend in args.backends.split(","):
+        env = dict(os.environ, INFERENCE_BACKEND=backend, PYTHONPATH=str(REPO_ROOT))
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api:app", "--port", str(args.port), "--log-level", "warning"],
+            cwd=args.server_cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            print(f"Running backend '{backend}' for {args.duration}s...")
+            results[backend] = asyncio.run(drive_load(
+                base_url, args.duration, args.concurrency, args.long_fraction, args.long_chars
+            ))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    print(f"{'backend':>8} {'short p50':>10} {'short p99':>10} {'long p99':>9} {'/ p50':>7} {'/ p99':>7} {'503s':>6} {'errors':>7}")
+    for backend, summary in results.items():
+        print(f"{backend:>8} {summary['short']['p50_ms']:10.1f} {summary['short']['p99_ms']:10.1f} "
+              f"{summary['long']['p99_ms']:9.1f} {summary['root']['p50_ms']:7.1f} {summary['root']['p99_ms']:7.1f} "
+              f"{summary['rejected']:6d} {summary['errors']:7d}")
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
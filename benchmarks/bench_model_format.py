@@ -0,0 +1,107 @@
+"""
+Benchmark: cold start and memory of the pickled Pipeline vs. the compact artifact.
+
+Starts N worker-like processes per format at the same time. Each loads the
+classifier (including the imports the loader needs), classifies one email, and
+reports load time, RSS and PSS (proportional set size, from
+/proc/self/smaps_rollup). PSS is summed while all N are alive, so pages the
+processes share through the page cache (the memory-mapped compact arrays) are
+counted once.
+
+Run from the repository root after exporting the compact model:
+    python train.py --export-only
+    python benchmarks/bench_model_format.py --processes 4
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SAMPLE_EMAIL = "hello i was charged twice for my last order and the refund has not arrived please help"
+
+def _memory_mb() -> dict:
+    """RSS and PSS of this process in MB (PSS is None where smaps_rollup is unavailable)."""
+    values = {"rss_mb": None, "pss_mb": None}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Rss:"):
+                    values["rss_mb"] = int(line.split()[1]) / 1024
+                elif line.startswith("Pss:"):
+                    values["pss_mb"] = int(line.split()[1]) / 1024
+    except OSError:
+        import resource
+        values["rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return values
+
+def child(model_format: str, path: str) -> None:
+    """Loads one model, reports, then stays alive until the parent closes stdin."""
+    sys.path.insert(0, str(REPO_ROOT))
+    baseline = _memory_mb()
+    started = time.perf_counter()
+    if model_format == "pickle":
+        import joblib
+        model = joblib.load(path)
+    else:
+        from compact_model import CompactNBModel
+        model = CompactNBModel.load(path)
+    load_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    prediction = str(model.predict([SAMPLE_EMAIL])[0])
+    first_predict_ms = (time.perf_counter() - started) * 1000
+    memory = _memory_mb()
+    print(json.dumps({
+        "load_ms": load_ms,
+        "first_predict_ms": first_predict_ms,
+        "rss_mb": memory["rss_mb"],
+        "rss_delta_mb": memory["rss_mb"] - baseline["rss_mb"],
+        "pss_mb": memory["pss_mb"],
+        "prediction": prediction,
+    }), flush=True)
+    sys.stdin.read()
+
+def run_format(model_format: str, path: Path, processes: int) -> dict:
+    procs = [
+        subprocess.Popen([sys.executable, __file__, "--child", model_format, str(path)],
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, cwd=REPO_ROOT)
+        for _ in range(processes)
+    ]
+    reports = [json.loads(proc.stdout.readline()) for proc in procs]
+    # Every child is alive here, so their PSS values split the shared pages between them
+    for proc in procs:
+        proc.stdin.close()
+        proc.wait()
+    pss = [report["pss_mb"] for report in reports]
+    return {
+        "processes": processes,
+        "load_ms_median": round(statistics.median(r["load_ms"] for r in reports), 1),
+        "first_predict_ms_median": round(statistics.median(r["first_predict_ms"] for r in reports), 2),
+        "rss_mb_per_process": round(statistics.median(r["rss_mb"] for r in reports), 1),
+        "rss_delta_mb_per_process": round(statistics.median(r["rss_delta_mb"] for r in reports), 1),
+        "pss_mb_total": round(sum(pss), 1) if None not in pss else None,
+        "predictions": sorted({r["prediction"] for r in reports}),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare pickle vs. compact classifier loading.")
+    parser.add_argument("--pickle", type=Path, default=REPO_ROOT / "saved_models" / "email_classifier_pipeline.pkl")
+    parser.add_argument("--compact", type=Path, default=REPO_ROOT / "saved_models" / "email_classifier_compact")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--child", nargs=2, metavar=("FORMAT", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+    results = {
+        "pickle": run_format("pickle", args.pickle.resolve(), args.processes),
+        "compact": run_format("compact", args.compact.resolve(), args.processes),
+    }
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
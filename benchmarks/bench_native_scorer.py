@@ -0,0 +1,94 @@
+"""
+Benchmark: single-email classification latency, Pipeline.predict vs. the
+native scorer (CompactNBModel.from_pipeline) that models.predict_category uses.
+
+Both paths classify the same cleaned synthetic emails one at a time (and in
+batches of --batch-size), after checking that they return identical labels.
+Uses the saved pipeline when it loads, else trains a synthetic one.
+
+    python benchmarks/bench_native_scorer.py --emails 2000
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(BENCH_DIR))
+
+import joblib  # noqa: E402
+import numpy as np  # noqa: E402
+
+from compact_model import CompactNBModel  # noqa: E402
+from preprocessing import clean_text, clean_texts  # noqa: E402
+from synthetic_emails import EmailSpec, generate_corpus, generate_labelled_corpus  # noqa: E402
+
+def load_pipeline(path: Path, seed: int):
+    try:
+        return joblib.load(path), f"saved ({path})"
+    except Exception:
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.naive_bayes import MultinomialNB
+        from sklearn.pipeline import Pipeline
+
+        labelled = generate_labelled_corpus(2000, EmailSpec(length=400), seed=seed + 1)
+        pipeline = Pipeline([
+            ("tfidf", TfidfVectorizer(stop_words="english", max_df=0.95, min_df=2)),
+            ("clf", MultinomialNB()),
+        ])
+        pipeline.fit(clean_texts(body for body, _ in labelled), [label for _, label in labelled])
+        return pipeline, "synthetic TF-IDF + MultinomialNB (2000 generated emails)"
+
+def latency(predict, texts, batch_size: int, warmup: int = 50) -> dict:
+    for text in texts[:warmup]:
+        predict([text])
+    samples = []
+    for i in range(0, len(texts), batch_size):
+        batch = texts[i:i + batch_size]
+        started = time.perf_counter()
+        predict(batch)
+        samples.append((time.perf_counter() - started) / len(batch))
+    samples.sort()
+    return {
+        "mean_us": round(statistics.fmean(samples) * 1e6, 1),
+        "p50_us": round(samples[len(samples) // 2] * 1e6, 1),
+        "p99_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", type=Path, default=REPO_ROOT / "saved_models" / "email_classifier_pipeline.pkl")
+    parser.add_argument("--emails", type=int, default=2000)
+    parser.add_argument("--length", type=int, default=800, help="Target email length in characters")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    pipeline, source = load_pipeline(args.model, args.seed)
+    scorer = CompactNBModel.from_pipeline(pipeline)
+    texts = [clean_text(body) for body in generate_corpus(args.emails, EmailSpec(length=args.length), seed=args.seed)]
+
+    mismatches = int((scorer.predict(texts) != pipeline.predict(texts)).sum())
+    max_proba_diff = float(np.abs(scorer.predict_proba(texts) - pipeline.predict_proba(texts)).max())
+    report = {
+        "classifier": source,
+        "emails": len(texts),
+        "label_mismatches": mismatches,
+        "max_probability_diff": max_proba_diff,
+        "single": {"pipeline": latency(pipeline.predict, texts, 1), "native": latency(scorer.predict, texts, 1)},
+        f"batch_{args.batch_size}": {
+            "pipeline": latency(pipeline.predict, texts, args.batch_size),
+            "native": latency(scorer.predict, texts, args.batch_size),
+        },
+    }
+    report["single_speedup"] = round(report["single"]["pipeline"]["p50_us"] / report["single"]["native"]["p50_us"], 1)
+    print(json.dumps(report, indent=2))
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
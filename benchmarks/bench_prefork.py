@@ -0,0 +1,129 @@
+"""
+Benchmark: memory of N API workers, `uvicorn api:app --workers N` vs. `serve.py`
+(models loaded once in a master, then forked copy-on-write).
+
+For each launcher the server is started on a free port, /readyz is polled until
+it answers 200 --settle times in a row, --requests single-email requests are
+sent (so every worker has served traffic), and RSS / PSS of every process in
+the server's tree is read from /proc/<pid>/smaps_rollup. PSS splits each shared
+page between the processes mapping it, so "pss_mb_total" is the real footprint.
+
+Run from a directory with saved_models/ and the spaCy model:
+    python benchmarks/bench_prefork.py --workers 4
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Dict, List
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from serve import process_memory  # noqa: E402
+
+SAMPLE_EMAIL = "Hello, my name is Jane Doe. I was charged twice for my last order, please refund it."
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _get(url: str) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=2) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return 0
+
+def _classify(port: int) -> None:
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/classify_email/", data=json.dumps({"email_body": SAMPLE_EMAIL}).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        response.read()
+
+def process_tree(pid: int) -> List[int]:
+    """`pid` and all its descendants (Linux /proc)."""
+    pids, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        pids.append(current)
+        try:
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    stack.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+def run_launcher(name: str, command: List[str], port: int, requests: int, settle: int, timeout: float) -> Dict:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get("PYTHONPATH")])))
+    started = time.perf_counter()
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready_in_a_row = 0
+        while ready_in_a_row < settle:
+            if server.poll() is not None or time.perf_counter() - started > timeout:
+                raise SystemExit(f"{name}: server did not become ready")
+            ready_in_a_row = ready_in_a_row + 1 if _get(f"http://127.0.0.1:{port}/readyz") == 200 else 0
+            time.sleep(0.1)
+        ready_s = time.perf_counter() - started
+        for _ in range(requests):
+            _classify(port)
+        time.sleep(0.5)
+        rows = [dict(pid=pid, **process_memory(pid)) for pid in process_tree(server.pid)]
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+    rows = [row for row in rows if "pss_mb" in row]
+    return {
+        "launcher": name,
+        "ready_s": round(ready_s, 2),
+        "processes": len(rows),
+        "rss_mb_total": round(sum(row["rss_mb"] for row in rows), 1),
+        "pss_mb_total": round(sum(row["pss_mb"] for row in rows), 1),
+        "private_dirty_mb_total": round(sum(row["private_dirty_mb"] for row in rows), 1),
+        "per_process": rows,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200, help="Requests sent before measuring")
+    parser.add_argument("--settle", type=int, default=20, help="Consecutive 200s from /readyz before measuring")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    results = []
+    port = _free_port()
+    results.append(run_launcher(
+        "uvicorn --workers",
+        [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(port), "--workers", str(args.workers)],
+        port, args.requests, args.settle, args.timeout,
+    ))
+    port = _free_port()
+    results.append(run_launcher(
+        "serve.py",
+        [sys.executable, str(REPO_ROOT / "serve.py"), "--host", "127.0.0.1", "--port", str(port), "--workers", str(args.workers)],
+        port, args.requests, args.settle, args.timeout,
+    ))
+    report = {"workers": args.workers, "results": results,
+              "pss_saving_mb": round(results[0]["pss_mb_total"] - results[1]["pss_mb_total"], 1)}
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Fuzz benchmark: worst-case time of the PII regex scan (ReDoS check).
+
+Feeds adversarial inputs (long runs of digits, spaces, hyphens, dots and
+local-part characters, with and without '@') plus random strings over the same
+alphabet to `utils.scan_regex_pii`, and checks that:
+  1. every pattern finds exactly the matches of the original patterns
+     (ORIGINAL_PATTERNS, plain re.finditer) on inputs up to --parity-chars;
+  2. scanning any --max-chars input takes at most --max-ms, and a 4x longer
+     input at most --max-growth times longer (linear: ~4x, quadratic: ~16x).
+Exits with status 1 when a check fails, so it can run in CI.
+
+    python benchmarks/bench_regex_redos.py
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils import COMPILED_PATTERNS, SpanIndex, scan_regex_pii  # noqa: E402
+
+# utils.REGEX_PATTERNS as plain re.finditer would run them (the email pattern is
+# served by AnchoredEmailPattern), for the parity check
+ORIGINAL_PATTERNS = {
+    "email": r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
+    "phone_number": r'(\+?\d{1,3}[-.\s]?)?\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}\b',
+    "credit_debit_no": r'\b(?:\d[ -]*?){13,16}\b',
+    "cvv_no": r'\b\d{3,4}\b',
+    "expiry_no": r'\b(0[1-9]|1[0-2])\/?([0-9]{4}|[0-9]{2})\b',
+    "aadhar_num": r'\b\d{4}[ -]?\d{4}[ -]?\d{4}\b',
+    "dob": r'\b(\d{1,2}[-/]\d{1,2}[-/]\d{2,4}|\d{4}[-/]\d{1,2}[-/]\d{1,2})\b',
+}
+
+# Repeated to the requested length
+ADVERSARIAL = {
+    "digits": "1",
+    "digit_space": "1 ",
+    "digit_hyphen": "1-",
+    "digit_hyphen_at_end": "1-",        # + "@"
+    "digit_double_space": "1  ",
+    "digit_long_separators": "1" + " -" * 20,
+    "digit_groups": "1234 ",
+    "phone_like": "123-456-789 ",
+    "card_like_15": "4111 1111 1111 111 ",
+    "dates": "12/12/12/",
+    "dotted_digits": "1.",
+    "dotted_letters": "a.",
+    "domain_dots": "a.",                # "a@" + ...
+    "local_then_pipes": "a.b|",          # "x@y." + ...
+    "at_runs": "a@a.",
+}
+PREFIXES = {"domain_dots": "a@", "local_then_pipes": "x@y."}
+SUFFIXES = {"digit_hyphen_at_end": "@example.com"}
+FUZZ_ALPHABET = "0123456789    --..//()+@a|_xZ\n"
+
+def adversarial_text(name: str, size: int) -> str:
+    unit = ADVERSARIAL[name]
+    body = unit * (size // len(unit) + 1)
+    return (PREFIXES.get(name, "") + body)[:size - len(SUFFIXES.get(name, ""))] + SUFFIXES.get(name, "")
+
+def fuzz_text(rnd: random.Random, size: int) -> str:
+    # Runs of one character mixed with random characters, which is what drives backtracking
+    parts, length = [], 0
+    while length < size:
+        part = rnd.choice(FUZZ_ALPHABET) * (rnd.randint(1, 40) if rnd.random() < 0.3 else 1)
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)[:size]
+
+def scan_ms(text: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        scan_regex_pii(text, SpanIndex(), budget_ms=0)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+def parity_failures(text: str) -> list:
+    failures = []
+    for entity_type, pattern in ORIGINAL_PATTERNS.items():
+        expected = [m.span() for m in re.finditer(pattern, text)]
+        actual = [m.span() for m in COMPILED_PATTERNS[entity_type].finditer(text)]
+        if expected != actual:
+            failures.append(entity_type)
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-chars", type=int, default=100_000, help="Largest input scanned")
+    parser.add_argument("--max-ms", type=float, default=250.0, help="Upper bound on one scan of --max-chars characters")
+    parser.add_argument("--max-growth", type=float, default=8.0, help="Upper bound on time(4n) / time(n)")
+    parser.add_argument("--parity-chars", type=int, default=5_000, help="Input size for the parity check")
+    parser.add_argument("--fuzz-cases", type=int, default=300, help="Random strings checked for parity")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    failures = []
+
+    # 1. Parity with the original patterns
+    parity_inputs = [adversarial_text(name, args.parity_chars) for name in ADVERSARIAL]
+    parity_inputs += [fuzz_text(rnd, rnd.randint(1, 400)) for _ in range(args.fuzz_cases)]
+    parity_inputs += [fuzz_text(rnd, args.parity_chars) for _ in range(10)]
+    for text in parity_inputs:
+        for entity_type in parity_failures(text):
+            failures.append(f"parity: {entity_type} differs on {text[:60]!r}")
+
+    # 2. Time bound and linear growth
+    cases = {name: (lambda size, name=name: adversarial_text(name, size)) for name in ADVERSARIAL}
+    cases["fuzz"] = lambda size: fuzz_text(random.Random(args.seed), size)
+    quarter = args.max_chars // 4
+    timings = {}
+    for name, make in cases.items():
+        small_ms, full_ms = scan_ms(make(quarter), args.repeat), scan_ms(make(args.max_chars), args.repeat)
+        growth = full_ms / max(small_ms, 1e-3)
+        timings[name] = {f"{quarter}_chars_ms": round(small_ms, 2), f"{args.max_chars}_chars_ms": round(full_ms, 2),
+                         "growth": round(growth, 2)}
+        if full_ms > args.max_ms:
+            failures.append(f"time: {name} took {full_ms:.1f} ms > {args.max_ms} ms for {args.max_chars} characters")
+        if full_ms > 1.0 and growth > args.max_growth:
+            failures.append(f"growth: {name} took {growth:.1f}x longer for a 4x longer input")
+
+    worst = max(timings, key=lambda name: timings[name][f"{args.max_chars}_chars_ms"])
+    print(json.dumps({"parity_inputs": len(parity_inputs), "timings": timings, "worst_case": worst,
+                      "failures": failures}, indent=2))
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark: per-email NER latency and worker memory for each spaCy loading profile.
+
+Each profile from utils.SPACY_PROFILES is loaded in a fresh subprocess (so memory
+numbers don't leak between runs) with SPACY_PROFILE set accordingly. Reports
+model load time, resident memory after loading and after the run, and per-email
+latency percentiles of `mask_pii` on a fixed set of sample emails.
+
+Run from the repository root (the spaCy model must be installed):
+    python benchmarks/bench_spacy_profiles.py
+    SPACY_MODEL=en_core_web_md python benchmarks/bench_spacy_profiles.py --emails 500
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# --- Configuration ---
+NUM_EMAILS = 200
+FIRST_NAMES = ["Jane", "John", "Priya", "Rahul", "Maria", "Wei", "Fatima", "Carlos"]
+LAST_NAMES = ["Doe", "Smith", "Sharma", "Gupta", "Garcia", "Chen", "Khan", "Lopez"]
+TEMPLATES = [
+    "Hello, my name is {name} and I was charged twice for my last order. Please refund the duplicate payment.",
+    "Hi team, {name} here. I cannot log in since the last update and the password reset link is broken.",
+    "Dear support, please close the account registered to {name}. I no longer use the service.",
+    "Our dashboard has been down for two hours. This is urgent, contact {name} at the operations desk.",
+    "Your order has shipped and will arrive within 3-5 business days. Thank you for shopping with us.",
+]
+
+def sample_emails(count: int, seed: int = 0) -> list:
+    rnd = random.Random(seed)
+    return [
+        rnd.choice(TEMPLATES).format(name=f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}")
+        for _ in range(count)
+    ]
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB (Linux /proc, falls back to ru_maxrss)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_child(num_emails: int) -> dict:
+    """Runs inside the subprocess: loads the model with the configured profile and times mask_pii."""
+    sys.path.insert(0, str(REPO_ROOT))
+    import utils
+
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    nlp = utils.load_spacy_model()
+    load_seconds = time.perf_counter() - start
+    if nlp is None:
+        return {"error": "spaCy model failed to load"}
+    rss_loaded = current_rss_mb()
+
+    latencies_ms = []
+    for email in sample_emails(num_emails):
+        start = time.perf_counter()
+        utils.mask_pii(email, nlp)
+        latencies_ms.append((time.perf_counter() - start) * 1000)
+    latencies_ms.sort()
+
+    return {
+        "profile": utils.SPACY_PROFILE,
+        "pipes": nlp.pipe_names,
+        "load_seconds": round(load_seconds, 3),
+        "rss_model_mb": round(rss_loaded - rss_before, 1),
+        "rss_after_run_mb": round(current_rss_mb(), 1),
+        "latency_ms_mean": round(statistics.mean(latencies_ms), 3),
+        "latency_ms_p50": round(latencies_ms[len(latencies_ms) // 2], 3),
+        "latency_ms_p95": round(latencies_ms[int(len(latencies_ms) * 0.95) - 1], 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=NUM_EMAILS, help="Number of sample emails per profile")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print("BENCH_RESULT " + json.dumps(run_child(args.emails)))
+        return
+
+    sys.path.insert(0, str(REPO_ROOT))
+    from utils import SPACY_PROFILES, SPACY_MODEL_NAME
+
+    print(f"Model: {SPACY_MODEL_NAME}, {args.emails} emails per profile")
+    rows = []
+    for profile in SPACY_PROFILES:
+        env = dict(os.environ, SPACY_PROFILE=profile)
+        completed = subprocess.run(
+            [sys.executable, __file__, "--child", "--emails", str(args.emails)],
+            env=env, capture_output=True, text=True, cwd=REPO_ROOT,
+        )
+        result_lines = [line for line in completed.stdout.splitlines() if line.startswith("BENCH_RESULT ")]
+        if not result_lines:
+            print(f"Profile '{profile}' failed:\n{completed.stderr[-2000:]}")
+            continue
+        rows.append(json.loads(result_lines[-1][len("BENCH_RESULT "):]))
+
+    print(f"{'profile':>10} {'load (s)':>9} {'model RSS (MB)':>15} {'mean (ms)':>10} {'p50 (ms)':>9} {'p95 (ms)':>9}  pipes")
+    for row in rows:
+        if "error" in row:
+            print(f"{'?':>10} {row['error']}")
+            continue
+        print(f"{row['profile']:>10} {row['load_seconds']:9.3f} {row['rss_model_mb']:15.1f} "
+              f"{row['latency_ms_mean']:10.3f} {row['latency_ms_p50']:9.3f} {row['latency_ms_p95']:9.3f}  {row['pipes']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark: API cold start.
+
+1. Import cost: runs `python -X importtime -c "import api"` (best of --repeat)
+   and breaks the cumulative time down by the modules api imports directly,
+   and lists which heavy libraries were imported at all.
+2. Time to ready (--serve): starts `uvicorn api:app` and reports when
+   /healthz first answers and when /readyz turns 200 (models loaded and
+   warmed up). Run it from a directory with saved_models/ and the spaCy model.
+
+    python benchmarks/bench_startup.py --serve --output benchmarks/startup_importtime.txt
+"""
+import argparse
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ("spacy", "sklearn", "scipy", "pandas", "joblib", "gradio", "numpy", "thinc", "torch")
+
+def import_times(module: str) -> List[Tuple[int, int, int, str]]:
+    """(self_us, cumulative_us, depth, name) per imported module, in -X importtime order."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get("PYTHONPATH")])))
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, check=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return rows
+
+def best_import(module: str, repeat: int) -> List[Tuple[int, int, int, str]]:
+    # The first run also pays for .pyc compilation and a cold page cache
+    runs = [import_times(module) for _ in range(repeat + 1)][1:]
+    return min(runs, key=lambda rows: rows[-1][1])
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _status(url: str) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return 0
+
+def time_to_ready(timeout: float) -> Dict[str, float]:
+    port = _free_port()
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get("PYTHONPATH")])))
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    result: Dict[str, float] = {}
+    try:
+        while time.perf_counter() - started < timeout and server.poll() is None:
+            elapsed = time.perf_counter() - started
+            if "healthz_s" not in result and _status(f"http://127.0.0.1:{port}/healthz") == 200:
+                result["healthz_s"] = round(elapsed, 2)
+            if "healthz_s" in result and _status(f"http://127.0.0.1:{port}/readyz") == 200:
+                result["readyz_s"] = round(elapsed, 2)
+                break
+            time.sleep(0.05)
+    finally:
+        server.terminate()
+        server.wait()
+    return result
+
+def report(module: str, rows: List[Tuple[int, int, int, str]], top: int) -> List[str]:
+    total_ms = rows[-1][1] / 1000
+    lines = [
+        f"python {platform.python_version()} on {platform.platform()}",
+        f"import {module}: {total_ms:.0f} ms cumulative (-X importtime, best run)",
+        "",
+        f"Direct imports of {module} by cumulative time:",
+    ]
+    direct = sorted((row for row in rows if row[2] == 1), key=lambda row: -row[1])
+    for _, cumulative_us, _, name in direct[:top]:
+        lines.append(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+    imported = {row[3] for row in rows}
+    lines += ["", "Heavy libraries imported: " + (", ".join(m for m in HEAVY_MODULES if m in imported) or "none")]
+    return lines
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="api")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--serve", action="store_true", help="Also measure uvicorn time to /healthz and /readyz")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="Write the report here as well as to stdout")
+    args = parser.parse_args()
+
+    lines = report(args.module, best_import(args.module, args.repeat), args.top)
+    if args.serve:
+        ready = time_to_ready(args.timeout)
+        lines += ["", f"uvicorn api:app: /healthz after {ready.get('healthz_s', 'n/a')} s, "
+                      f"/readyz 200 after {ready.get('readyz_s', 'n/a')} s"]
+    text = "\n".join(lines)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+
+if __name__ == "__main__":
+    main()
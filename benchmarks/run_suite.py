@@ -0,0 +1,252 @@
+"""
+Benchmark suite: PII masking, text cleaning, prediction and the in-process API.
+
+Runs each case over the same seeded synthetic corpus (see synthetic_emails.py)
+and writes one JSON document with throughput, latency percentiles and peak
+memory per case, plus the library versions and git commit, so runs on two
+commits can be diffed:
+
+    python benchmarks/run_suite.py --output before.json
+    git checkout my-branch
+    python benchmarks/run_suite.py --output after.json --compare before.json
+
+Cases:
+    mask_pii          utils.mask_pii (spaCy NER + regex scan + mask assembly)
+    clean_text        models.clean_text_for_classification
+    predict_category  models.predict_category on the masked text
+    api               POST /classify_email/ through FastAPI's TestClient
+
+Everything runs offline. If the spaCy model is not installed, NER uses a blank
+English pipeline with an entity ruler for the generator's names; if the saved
+classifier is missing or unreadable (e.g. a Git LFS pointer), a small TF-IDF +
+MultinomialNB pipeline is trained on synthetic emails. Both substitutions are
+recorded under "environment" in the output so numbers are never compared
+across different setups by accident.
+"""
+import argparse
+import atexit
+import gc
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(BENCH_DIR))
+
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+import joblib  # noqa: E402
+import sklearn  # noqa: E402
+import spacy  # noqa: E402
+
+import utils  # noqa: E402
+from models import clean_text_for_classification, predict_category  # noqa: E402
+from synthetic_emails import DEFAULT_ENTITY_MIX, FIRST_NAMES, LAST_NAMES, EmailSpec, generate_corpus, generate_labelled_corpus  # noqa: E402
+
+CASES = ("mask_pii", "clean_text", "predict_category", "api")
+
+# --- Setup ---
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def setup_spacy(environment: Dict) -> spacy.language.Language:
+    """Loads the configured spaCy model without trying to download it."""
+    try:
+        nlp = utils._load_spacy_with_profile(utils.SPACY_MODEL_NAME, utils.SPACY_PROFILE, utils.SPACY_EXCLUDE)
+        environment["ner"] = f"{utils.SPACY_MODEL_NAME} (profile {utils.SPACY_PROFILE}, pipes {nlp.pipe_names})"
+    except OSError:
+        nlp = spacy.blank("en")
+        ruler = nlp.add_pipe("entity_ruler")
+        ruler.add_patterns([
+            {"label": "PERSON", "pattern": [{"TEXT": first}, {"TEXT": last}]}
+            for first in FIRST_NAMES for last in LAST_NAMES
+        ])
+        environment["ner"] = f"entity_ruler fallback ({utils.SPACY_MODEL_NAME} not installed)"
+    utils.NLP_MODEL = nlp
+    return nlp
+
+def setup_pipeline(environment: Dict, mode: str, seed: int):
+    """Loads the saved classifier, or trains a synthetic one (mode "auto" falls back to it)."""
+    if mode in ("auto", "saved"):
+        try:
+            pipeline = joblib.load(utils.MODEL_PATH)
+            environment["classifier"] = f"saved ({utils.MODEL_PATH})"
+            utils.set_active_model(pipeline, "saved")
+            return pipeline
+        except Exception as e:
+            if mode == "saved":
+                raise SystemExit(f"Could not load {utils.MODEL_PATH}: {e}")
+
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.pipeline import Pipeline
+
+    labelled = generate_labelled_corpus(2000, EmailSpec(length=400), seed=seed + 1)
+    pipeline = Pipeline([
+        ("tfidf", TfidfVectorizer(stop_words="english", max_df=0.95, min_df=2)),
+        ("clf", MultinomialNB()),
+    ])
+    pipeline.fit([clean_text_for_classification(body) for body, _ in labelled], [label for _, label in labelled])
+    environment["classifier"] = "synthetic TF-IDF + MultinomialNB (2000 generated emails)"
+    utils.set_active_model(pipeline, "synthetic")
+    return pipeline
+
+# --- Measurement ---
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def measure(func: Callable[[str], object], inputs: List[str], warmup: int) -> Dict:
+    """Times `func` on every input, then re-runs it under tracemalloc for peak memory."""
+    for text in inputs[:warmup]:
+        func(text)
+
+    gc.collect()
+    latencies = []
+    started = time.perf_counter()
+    for text in inputs:
+        t0 = time.perf_counter()
+        func(text)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+
+    # Separate pass: tracemalloc slows allocation-heavy code down a lot
+    gc.collect()
+    tracemalloc.start()
+    for text in inputs[:max(1, len(inputs) // 10)]:
+        func(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "calls": len(inputs),
+        "throughput_per_s": round(len(inputs) / elapsed, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 4),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 4),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 4),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 4),
+        "max_ms": round(latencies[-1] * 1000, 4),
+        "peak_traced_kib": round(peak / 1024, 1),
+    }
+
+def build_case(name: str, nlp, pipeline, emails: List[str]):
+    """Returns (callable, inputs) for one case."""
+    if name == "mask_pii":
+        return (lambda text: utils.mask_pii(text, nlp)), emails
+    if name == "clean_text":
+        return clean_text_for_classification, emails
+    if name == "predict_category":
+        masked = [utils.mask_pii(text, nlp)[0] for text in emails]
+        return (lambda text: predict_category(text, pipeline)), masked
+    if name == "api":
+        from fastapi.testclient import TestClient
+        import api
+
+        client = TestClient(api.app)
+        client.__enter__()  # Runs the startup event (inference pool)
+        atexit.register(client.__exit__, None, None, None)
+
+        def call(text):
+            response = client.post("/classify_email/", json={"email_body": text})
+            if response.status_code != 200:
+                raise RuntimeError(f"/classify_email/ returned {response.status_code}: {response.text[:200]}")
+        return call, emails
+    raise ValueError(f"Unknown case '{name}'. Expected one of: {', '.join(CASES)}")
+
+# --- Comparison ---
+def compare(baseline: Dict, current: Dict) -> None:
+    """Prints p50/p99/throughput changes per case against a previous run."""
+    print(f"\nChange vs. {baseline.get('environment', {}).get('git_commit')} (negative latency = faster):", file=sys.stderr)
+    for case, result in current["cases"].items():
+        before = baseline.get("cases", {}).get(case)
+        if not before:
+            continue
+        deltas = []
+        for key in ("p50_ms", "p99_ms", "throughput_per_s"):
+            if before.get(key):
+                deltas.append(f"{key} {100 * (result[key] - before[key]) / before[key]:+.1f}%")
+        print(f"  {case:18s} " + ", ".join(deltas), file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES))
+    parser.add_argument("--emails", type=int, default=300, help="Emails per case")
+    parser.add_argument("--length", type=int, default=800, help="Target email length in characters")
+    parser.add_argument("--pii-density", type=float, default=4.0, help="PII entities per 100 words")
+    parser.add_argument("--entity-mix", default=None,
+                        help="Comma-separated kind=weight, e.g. name=1,email=1 (kinds: " + ", ".join(DEFAULT_ENTITY_MIX) + ")")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--model", choices=("auto", "saved", "synthetic"), default="auto",
+                        help="Classifier: the saved pipeline, a synthetic one, or saved with synthetic fallback")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", help="Previous JSON report to print changes against")
+    args = parser.parse_args()
+
+    entity_mix = dict(DEFAULT_ENTITY_MIX)
+    if args.entity_mix:
+        entity_mix = {kind: 0.0 for kind in DEFAULT_ENTITY_MIX}
+        for item in args.entity_mix.split(","):
+            kind, _, weight = item.partition("=")
+            if kind.strip() not in DEFAULT_ENTITY_MIX:
+                parser.error(f"Unknown entity kind '{kind.strip()}'")
+            entity_mix[kind.strip()] = float(weight or 1)
+    spec = EmailSpec(length=args.length, pii_per_100_words=args.pii_density, entity_mix=entity_mix)
+
+    environment = {
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "spacy": spacy.__version__,
+        "sklearn": sklearn.__version__,
+    }
+    nlp = setup_spacy(environment)
+    pipeline = setup_pipeline(environment, args.model, args.seed)
+    emails = generate_corpus(args.emails, spec, seed=args.seed)
+
+    report = {
+        "environment": environment,
+        "workload": {
+            "emails": args.emails,
+            "length": args.length,
+            "mean_length": round(statistics.fmean(len(email) for email in emails), 1),
+            "pii_per_100_words": args.pii_density,
+            "entity_mix": entity_mix,
+            "seed": args.seed,
+        },
+        "cases": {},
+    }
+    for name in args.cases:
+        print(f"Running {name}...", file=sys.stderr)
+        func, inputs = build_case(name, nlp, pipeline, emails)
+        report["cases"][name] = measure(func, inputs, args.warmup)
+    report["peak_rss_mib"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+        print(f"Report written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text()), report)
+
+if __name__ == "__main__":
+    main()
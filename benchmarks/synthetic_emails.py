@@ -0,0 +1,146 @@
+"""
+Seeded synthetic support emails for the benchmark suite.
+
+Every email is built from a category template, filler sentences up to a target
+length, and PII entities inserted at a given density. The same seed and settings
+always produce the same corpus, so benchmark runs on different commits process
+identical input.
+
+    from synthetic_emails import EmailSpec, generate_corpus
+    emails = generate_corpus(500, EmailSpec(length=2000, pii_per_100_words=5), seed=7)
+"""
+import random
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+# --- Vocabulary ---
+FIRST_NAMES = ["Jane", "John", "Priya", "Rahul", "Maria", "Wei", "Fatima", "Carlos", "Anita", "Olu", "Sven", "Mei"]
+LAST_NAMES = ["Doe", "Smith", "Sharma", "Gupta", "Garcia", "Chen", "Khan", "Lopez", "Okafor", "Berg", "Tanaka"]
+EMAIL_DOMAINS = ["example.com", "mail.example.org", "corp.example.net"]
+
+CATEGORY_OPENINGS = {
+    "Billing Issues": [
+        "I was charged twice for my last order and need a refund.",
+        "My invoice shows a payment I never made this month.",
+        "The subscription fee on my card is higher than the price on your website.",
+    ],
+    "Technical Support": [
+        "I cannot log in since the last update and the password reset link is broken.",
+        "The app crashes every time I open the settings page.",
+        "Uploads fail with a timeout error on every browser I tried.",
+    ],
+    "Account Management": [
+        "Please close my account, I no longer use the service.",
+        "I need to change the email address registered on my profile.",
+        "Could you merge my two accounts into one?",
+    ],
+    "Incident": [
+        "The dashboard has been down for two hours and nobody on our team can work.",
+        "We are seeing data from another customer in our reports, this is urgent.",
+        "All API requests return errors since this morning.",
+    ],
+}
+FILLER_SENTENCES = [
+    "I have attached the details below.",
+    "This has happened several times over the last weeks.",
+    "Please let me know if you need more information from my side.",
+    "I already tried restarting and clearing the cache.",
+    "Our team relies on this every day, so a quick answer would help.",
+    "Thank you for looking into this.",
+    "The problem started right after the latest release.",
+    "I contacted support before but did not receive a reply.",
+]
+
+# Entity kinds and the default share of each among inserted PII
+DEFAULT_ENTITY_MIX: Dict[str, float] = {
+    "name": 0.30,
+    "email": 0.20,
+    "phone": 0.20,
+    "card": 0.10,
+    "aadhaar": 0.10,
+    "dob": 0.10,
+}
+
+@dataclass
+class EmailSpec:
+    """Shape of the generated emails."""
+    length: int = 600                # Target length in characters (the body is cut at a word boundary)
+    pii_per_100_words: float = 4.0   # PII density
+    entity_mix: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_ENTITY_MIX))
+
+def _luhn_complete(digits: List[int]) -> List[int]:
+    """Appends the Luhn check digit so card numbers look like real ones."""
+    total = 0
+    for i, digit in enumerate(reversed(digits)):
+        if i % 2 == 0:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return digits + [(10 - total % 10) % 10]
+
+def make_entity(kind: str, rnd: random.Random) -> str:
+    """One PII value of the given kind."""
+    if kind == "name":
+        return f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}"
+    if kind == "email":
+        return f"{rnd.choice(FIRST_NAMES).lower()}.{rnd.choice(LAST_NAMES).lower()}{rnd.randint(1, 99)}@{rnd.choice(EMAIL_DOMAINS)}"
+    if kind == "phone":
+        return rnd.choice([
+            f"+91 {rnd.randint(70000, 99999)} {rnd.randint(10000, 99999)}",
+            f"({rnd.randint(200, 999)}) {rnd.randint(200, 999)}-{rnd.randint(1000, 9999)}",
+            f"{rnd.randint(200, 999)}-{rnd.randint(200, 999)}-{rnd.randint(1000, 9999)}",
+        ])
+    if kind == "card":
+        digits = "".join(map(str, _luhn_complete([4] + [rnd.randint(0, 9) for _ in range(14)])))
+        return " ".join(digits[i:i + 4] for i in range(0, 16, 4))
+    if kind == "aadhaar":
+        return f"{rnd.randint(2000, 9999)} {rnd.randint(1000, 9999)} {rnd.randint(1000, 9999)}"
+    if kind == "dob":
+        return f"{rnd.randint(1, 28):02d}/{rnd.randint(1, 12):02d}/{rnd.randint(1950, 2005)}"
+    raise ValueError(f"Unknown entity kind '{kind}'. Expected one of: {', '.join(DEFAULT_ENTITY_MIX)}")
+
+ENTITY_PHRASES = {
+    "name": "My name is {value}.",
+    "email": "You can reach me at {value}.",
+    "phone": "My phone number is {value}.",
+    "card": "The card used was {value}.",
+    "aadhaar": "My Aadhaar number is {value}.",
+    "dob": "My date of birth is {value}.",
+}
+
+def generate_email(spec: EmailSpec, rnd: random.Random) -> Tuple[str, str]:
+    """Returns (email_body, category) for one synthetic email."""
+    category = rnd.choice(sorted(CATEGORY_OPENINGS))
+    kinds = [kind for kind, weight in spec.entity_mix.items() if weight > 0]
+    weights = [spec.entity_mix[kind] for kind in kinds]
+
+    sentences = [rnd.choice(CATEGORY_OPENINGS[category])]
+    length = len(sentences[0])
+    words = len(sentences[0].split())
+    pii_budget = 0.0
+    while length < spec.length:
+        sentence = rnd.choice(FILLER_SENTENCES)
+        words += len(sentence.split())
+        pii_budget += len(sentence.split()) * spec.pii_per_100_words / 100
+        while kinds and pii_budget >= 1:
+            kind = rnd.choices(kinds, weights)[0]
+            sentence += " " + ENTITY_PHRASES[kind].format(value=make_entity(kind, rnd))
+            pii_budget -= 1
+        sentences.append(sentence)
+        length += len(sentence) + 1
+
+    body = " ".join(sentences)
+    if len(body) > spec.length:
+        cut = body.rfind(" ", 0, spec.length)
+        body = body[:cut if cut > 0 else spec.length]
+    return body, category
+
+def generate_labelled_corpus(count: int, spec: EmailSpec, seed: int = 0) -> List[Tuple[str, str]]:
+    """`count` (email_body, category) pairs, deterministic for a given seed."""
+    rnd = random.Random(seed)
+    return [generate_email(spec, rnd) for _ in range(count)]
+
+def generate_corpus(count: int, spec: EmailSpec, seed: int = 0) -> List[str]:
+    """`count` email bodies, deterministic for a given seed."""
+    return [body for body, _ in generate_labelled_corpus(count, spec, seed)]
@@ -0,0 +1,260 @@
+"""
+Compact, pickle-free classifier artifact: a TF-IDF + MultinomialNB pipeline
+exported as a directory of .npy arrays plus a JSON manifest.
+
+Arrays are memory-mapped read-only, so loading takes milliseconds and every
+process serving the same directory shares the pages through the OS page cache
+instead of holding its own unpickled copy. CompactNBModel.predict is a drop-in
+for Pipeline.predict in models.predict_category / predict_categories.
+CompactNBModel.from_pipeline builds the same scorer from a fitted pipeline in
+memory; models.predict_category uses it for single emails.
+
+Layout (FORMAT_VERSION 1):
+    manifest.json           analyzer settings, classes, file hashes, model_version
+    vocab.npy               sorted vocabulary terms (fixed-width unicode)
+    vocab_columns.npy       feature column of each term in vocab.npy (int32)
+    idf.npy                 IDF weight per feature column (float64)
+    feature_log_prob.npy    log P(feature | class), shape (n_features, n_classes)
+    class_log_prior.npy     log P(class), shape (n_classes,)
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+FORMAT_VERSION = 1
+ARRAY_FILES = ("vocab.npy", "vocab_columns.npy", "idf.npy", "feature_log_prob.npy", "class_log_prior.npy")
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _arrays_version(arrays: Dict[str, np.ndarray]) -> str:
+    """Content hash of the model arrays: the same for a pipeline and its export."""
+    digest = hashlib.sha256()
+    for name in ARRAY_FILES:
+        digest.update(np.ascontiguousarray(arrays[name]).tobytes())
+    return digest.hexdigest()[:16]
+
+# --- Export ---
+def _pipeline_arrays(pipeline) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    """
+    Extracts (manifest, arrays by file name) from a fitted
+    Pipeline([... TfidfVectorizer, MultinomialNB]).
+    Raises ValueError for pipelines this format cannot represent.
+    """
+    from sklearn import __version__ as sklearn_version
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.naive_bayes import MultinomialNB
+
+    steps = [step for _, step in getattr(pipeline, "steps", ())]
+    if len(steps) != 2 or not isinstance(steps[0], TfidfVectorizer) or not isinstance(steps[1], MultinomialNB):
+        raise ValueError("Compact export supports Pipeline([TfidfVectorizer, MultinomialNB]) only, "
+                         f"got {[type(step).__name__ for step in steps] or type(pipeline).__name__}")
+    vectorizer, clf = steps
+    if vectorizer.analyzer != "word" or vectorizer.tokenizer is not None or vectorizer.preprocessor is not None \
+            or vectorizer.strip_accents is not None:
+        raise ValueError("Compact export supports the default word analyzer only "
+                         "(no custom tokenizer, preprocessor or strip_accents).")
+
+    vocabulary: Dict[str, int] = vectorizer.vocabulary_
+    terms = sorted(vocabulary)
+    stop_words = vectorizer.get_stop_words()
+    idf = vectorizer.idf_ if vectorizer.use_idf else np.ones(len(vocabulary))
+    arrays = {
+        "vocab.npy": np.array(terms, dtype=str),
+        "vocab_columns.npy": np.array([vocabulary[term] for term in terms], dtype=np.int32),
+        "idf.npy": np.ascontiguousarray(idf, dtype=np.float64),
+        # Transposed so the columns of one email's terms are contiguous rows
+        "feature_log_prob.npy": np.ascontiguousarray(clf.feature_log_prob_.T, dtype=np.float64),
+        "class_log_prior.npy": np.ascontiguousarray(clf.class_log_prior_, dtype=np.float64),
+    }
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "model_version": _arrays_version(arrays),
+        "sklearn_version": sklearn_version,
+        "classes": [str(label) for label in clf.classes_],
+        "n_features": len(vocabulary),
+        "analyzer": {
+            "lowercase": vectorizer.lowercase,
+            "token_pattern": vectorizer.token_pattern,
+            "ngram_range": list(vectorizer.ngram_range),
+            "stop_words": sorted(stop_words) if stop_words else [],
+            "binary": vectorizer.binary,
+            "sublinear_tf": vectorizer.sublinear_tf,
+            "norm": vectorizer.norm,
+        },
+    }
+    return manifest, arrays
+
+def export_compact_model(pipeline, out_dir: Union[str, Path]) -> Path:
+    """
+    Writes a fitted Pipeline([... TfidfVectorizer, MultinomialNB]) to `out_dir`.
+    The directory is written next to the target and renamed into place, so a
+    process loading it never sees a half-written export.
+    Raises ValueError for pipelines this format cannot represent.
+    """
+    manifest, arrays = _pipeline_arrays(pipeline)
+
+    out_dir = Path(out_dir)
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=f".{out_dir.name}.", dir=out_dir.parent))
+    try:
+        for name in ARRAY_FILES:
+            np.save(tmp_dir / name, arrays[name])
+        manifest["files"] = {name: _file_sha256(tmp_dir / name) for name in ARRAY_FILES}
+        (tmp_dir / "manifest.json").write_text(json.dumps(manifest, indent=2))
+        os.chmod(tmp_dir, 0o755)  # mkdtemp creates it owner-only
+
+        if out_dir.exists():
+            old_dir = out_dir.with_name(f".{out_dir.name}.old")
+            shutil.rmtree(old_dir, ignore_errors=True)
+            os.replace(out_dir, old_dir)
+            os.replace(tmp_dir, out_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        else:
+            os.replace(tmp_dir, out_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return out_dir
+
+# --- Loading / Prediction ---
+class CompactNBModel:
+    """
+    Read-only TF-IDF + MultinomialNB scorer: tokenizes like the fitted
+    vectorizer, looks up the few vocabulary columns an email touches and
+    computes class log-probabilities with NumPy over just those nonzeros,
+    skipping sklearn's input validation and sparse-matrix construction.
+    """
+
+    def __init__(self, manifest: Dict, arrays: Dict[str, np.ndarray], term_columns: Optional[Dict[str, int]] = None):
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compact model format {manifest.get('format_version')}, expected {FORMAT_VERSION}")
+        self.manifest = manifest
+        self.model_version: str = manifest["model_version"]
+        self.classes_ = np.array(manifest["classes"])
+        analyzer = manifest["analyzer"]
+        self._lowercase = analyzer["lowercase"]
+        self._token_re = re.compile(analyzer["token_pattern"])
+        self._min_n, self._max_n = analyzer["ngram_range"]
+        self._stop_words = frozenset(analyzer["stop_words"])
+        self._binary = analyzer["binary"]
+        self._sublinear_tf = analyzer["sublinear_tf"]
+        self._norm = analyzer["norm"]
+
+        self.vocab = arrays["vocab.npy"]
+        self.vocab_columns = arrays["vocab_columns.npy"]
+        self.idf = arrays["idf.npy"]
+        self.feature_log_prob = arrays["feature_log_prob.npy"]
+        self.class_log_prior = arrays["class_log_prior.npy"]
+        # term -> column dict when one is already in memory (from_pipeline); else binary search over vocab
+        self._term_columns = term_columns
+
+    @classmethod
+    def load(cls, path: Union[str, Path], mmap: bool = True) -> "CompactNBModel":
+        """Opens an exported directory; with `mmap` the arrays are mapped read-only instead of read."""
+        path = Path(path)
+        manifest = json.loads((path / "manifest.json").read_text())
+        mmap_mode = "r" if mmap else None
+        arrays = {name: np.load(path / name, mmap_mode=mmap_mode, allow_pickle=False) for name in ARRAY_FILES}
+        return cls(manifest, arrays)
+
+    @classmethod
+    def from_pipeline(cls, pipeline) -> "CompactNBModel":
+        """
+        Builds the scorer from a fitted pipeline in memory, reusing its
+        vocabulary dict for lookups. Raises ValueError like export_compact_model.
+        """
+        manifest, arrays = _pipeline_arrays(pipeline)
+        return cls(manifest, arrays, term_columns=pipeline.steps[0][1].vocabulary_)
+
+    def _analyze(self, text: str) -> List[str]:
+        """Same tokens as TfidfVectorizer's word analyzer for the exported settings."""
+        if self._lowercase:
+            text = text.lower()
+        tokens = self._token_re.findall(text)
+        if self._stop_words:
+            tokens = [token for token in tokens if token not in self._stop_words]
+        if self._max_n == 1:
+            return tokens
+        original, tokens = tokens, (list(tokens) if self._min_n == 1 else [])
+        for n in range(max(self._min_n, 2), min(self._max_n, len(original)) + 1):
+            tokens.extend(" ".join(original[i:i + n]) for i in range(len(original) - n + 1))
+        return tokens
+
+    def _lookup(self, counts: Counter) -> Tuple[np.ndarray, np.ndarray]:
+        """(feature columns, term counts) of the in-vocabulary terms in `counts`."""
+        if self._term_columns is not None:
+            columns, term_counts = [], []
+            for term, count in counts.items():
+                column = self._term_columns.get(term)
+                if column is not None:
+                    columns.append(column)
+                    term_counts.append(count)
+            return np.array(columns, dtype=np.intp), np.array(term_counts, dtype=np.float64)
+
+        # Own width, not the vocabulary's: casting would truncate long tokens into false matches
+        terms = np.array(list(counts), dtype=str)
+        positions = np.searchsorted(self.vocab, terms)
+        positions[positions == len(self.vocab)] = 0  # Past the end: never a match below
+        hits = self.vocab[positions] == terms
+        term_counts = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        return self.vocab_columns[positions[hits]], term_counts[hits]
+
+    def joint_log_likelihood(self, text: str) -> np.ndarray:
+        """Unnormalised log P(class, text) for one text, shape (n_classes,)."""
+        counts = Counter(self._analyze(text))
+        if not counts or not len(self.vocab):
+            return np.array(self.class_log_prior)
+        columns, weights = self._lookup(counts)
+        if not len(columns):
+            return np.array(self.class_log_prior)
+
+        if self._binary:
+            weights[:] = 1.0
+        elif self._sublinear_tf:
+            weights = np.log(weights) + 1
+        weights *= self.idf[columns]
+        if self._norm == "l2":
+            weights /= np.sqrt(np.dot(weights, weights))
+        elif self._norm == "l1":
+            weights /= np.abs(weights).sum()
+        return self.class_log_prior + weights @ self.feature_log_prob[columns]
+
+    def _posterior(self, text: str) -> np.ndarray:
+        """P(class | text), normalised the way MultinomialNB.predict_proba does (softmax of the log-likelihood)."""
+        jll = self.joint_log_likelihood(text)
+        probabilities = np.exp(jll - jll.max())
+        return probabilities / probabilities.sum()
+
+    def predict(self, texts: Iterable[str]) -> np.ndarray:
+        """Predicted class label per text, like Pipeline.predict."""
+        return np.array([self.classes_[int(np.argmax(self.joint_log_likelihood(text)))] for text in texts])
+
+    def predict_proba(self, texts: Iterable[str]) -> np.ndarray:
+        """Class probabilities per text, shape (n_texts, n_classes), like Pipeline.predict_proba."""
+        return np.array([self._posterior(text) for text in texts]).reshape(-1, len(self.classes_))
+
+    def score(self, text: str, top_k: int = 3) -> Dict:
+        """
+        Label, per-class probabilities and the `top_k` most likely classes for one text:
+        {"label": ..., "probabilities": {class: p}, "top_k": [{"label": ..., "probability": ...}]}
+        """
+        probabilities = self._posterior(text)
+        order = np.argsort(-probabilities, kind="stable")
+        return {
+            "label": str(self.classes_[order[0]]),
+            "probabilities": {str(label): float(p) for label, p in zip(self.classes_, probabilities)},
+            "top_k": [{"label": str(self.classes_[i]), "probability": float(probabilities[i])} for i in order[:max(1, top_k)]],
+        }
@@ -1,23 +1,125 @@
 import pandas as pd
-import requests
+import httpx
+import argparse
+import asyncio
 import json
+import multiprocessing
+import os
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import time
+from typing import Dict, Iterator, List, Optional, Tuple
 
 # --- Configuration ---
 DATASET_PATH = Path("combined_emails_with_natural_pii.csv") # Path to your input CSV
 OUTPUT_PATH = Path("api_output_results.jsonl") # Where to save the results (JSON Lines format)
-API_ENDPOINT = "http://127.0.0.1:8000/classify/" # Your running API endpoint
+API_ENDPOINT = "http://127.0.0.1:8000/classify_email/" # Your running API endpoint
+
+CONCURRENCY = 16          # Requests in flight at once (also the keep-alive pool size)
+MAX_RETRIES = 5           # Retries per email on 5xx / 429 / timeouts / connection errors
+REQUEST_TIMEOUT = 30      # Seconds per request
+BACKOFF_BASE = 0.5        # First retry waits ~0.5s, then 1s, 2s, ... (with jitter)
+BACKOFF_MAX = 30          # Longest wait between retries
+CHECKPOINT_EVERY = 200    # Results written between checkpoint updates
+PROGRESS_EVERY_S = 5      # Seconds between progress lines
+
+# Offline mode (no API): see process_emails_offline
+OFFLINE_CHUNK_ROWS = 10000  # CSV rows read at a time
+OFFLINE_BATCH_SIZE = 64     # Emails per worker task (one nlp.pipe + one predict call)
 
 # Adjust column names if different
 email_body_column = 'email'
 # category_column = 'type' # Original category column (optional, for reference)
 
+# --- Checkpointing ---
+# The checkpoint records how many rows have been written and the output file size
+# at that point, so a resumed run truncates any partially written tail and
+# carries on from the next row instead of starting over.
+def checkpoint_path_for(output_path: Path) -> Path:
+    return output_path.with_name(output_path.name + ".checkpoint.json")
+
+def _dataset_fingerprint(data_path: Path, api_url: str) -> Dict:
+    stat = data_path.stat()
+    return {"dataset": str(data_path.resolve()), "size": stat.st_size, "mtime": stat.st_mtime, "api_url": api_url}
+
+def load_checkpoint(checkpoint_path: Path, fingerprint: Dict) -> Tuple[int, int]:
+    """Returns (rows_done, output_bytes) to resume from, or (0, 0) for a fresh run."""
+    if not checkpoint_path.exists():
+        return 0, 0
+    try:
+        checkpoint = json.loads(checkpoint_path.read_text())
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Ignoring unreadable checkpoint {checkpoint_path}: {e}")
+        return 0, 0
+    if checkpoint.get("fingerprint") != fingerprint:
+        print(f"Checkpoint {checkpoint_path} belongs to a different dataset or endpoint; starting over.")
+        return 0, 0
+    return checkpoint["rows_done"], checkpoint["output_bytes"]
+
+def save_checkpoint(checkpoint_path: Path, fingerprint: Dict, rows_done: int, output_bytes: int) -> None:
+    """Atomically replaces the checkpoint file."""
+    tmp_path = checkpoint_path.with_name(checkpoint_path.name + ".tmp")
+    tmp_path.write_text(json.dumps({"fingerprint": fingerprint, "rows_done": rows_done, "output_bytes": output_bytes}))
+    os.replace(tmp_path, checkpoint_path)
+
+# --- Requests ---
+def _is_retryable_status(status_code: int) -> bool:
+    return status_code >= 500 or status_code == 429
+
+def _retry_delay(attempt: int, response: Optional[httpx.Response]) -> float:
+    """Exponential backoff with full jitter; honours Retry-After when the API sends one."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(BACKOFF_MAX, float(retry_after))
+            except ValueError:
+                pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+async def classify_one(client: httpx.AsyncClient, api_url: str, index, email_text: str) -> Dict:
+    """Posts one email, retrying transient failures. Always returns a JSON-serialisable dict."""
+    payload = {"email_body": email_text}
+    for attempt in range(MAX_RETRIES + 1):
+        response = None
+        try:
+            response = await client.post(api_url, json=payload)
+            if _is_retryable_status(response.status_code) and attempt < MAX_RETRIES:
+                await asyncio.sleep(_retry_delay(attempt, response))
+                continue
+            response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
+            api_result = response.json()
+            api_result["index"] = index
+            return api_result
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            if attempt < MAX_RETRIES:
+                await asyncio.sleep(_retry_delay(attempt, None))
+                continue
+            error = f"{type(e).__name__}: {e}"
+        except httpx.HTTPStatusError as e:
+            error = str(e)
+        except json.JSONDecodeError as e:
+            print(f"\nError decoding JSON response for email index {index}: {e}")
+            return {
+                "error": f"JSONDecodeError: {e}",
+                "response_text": response.text,
+                "input_email_body": email_text,
+                "index": index
+            }
+        break
+    print(f"\nError processing email index {index}: {error}")
+    return {"error": error, "input_email_body": email_text, "index": index}
+
 # --- Main Function ---
-def process_emails_via_api(data_path: Path, output_path: Path, api_url: str):
+async def process_emails_via_api_async(data_path: Path, output_path: Path, api_url: str,
+                                       concurrency: int = CONCURRENCY, resume: bool = True):
     """
-    Reads emails from a CSV, sends them to the classification API,
-    and saves the JSON responses to a file.
+    Reads emails from a CSV, sends them to the classification API with up to
+    `concurrency` requests in flight over keep-alive connections, and writes the
+    JSON responses to `output_path` in input order (each tagged with its row
+    index). With `resume`, an interrupted run continues from its checkpoint.
     """
     if not data_path.exists():
         print(f"Error: Input dataset not found at {data_path}")
@@ -41,60 +143,213 @@ def process_emails_via_api(data_path: Path, output_path: Path, api_url: str):
         print("Error: No valid email bodies found after handling missing values.")
         return
 
-    results = []
-    total_emails = len(df)
-    print(f"Processing {total_emails} emails via API: {api_url}")
+    rows = list(zip(df.index.tolist(), df[email_body_column].astype(str).tolist()))
+    total_emails = len(rows)
 
-    # Open output file in write mode (clears existing content)
-    with open(output_path, 'w') as f_out:
-        for index, row in df.iterrows():
-            email_text = str(row[email_body_column]) # Ensure it's a string
-            payload = {"email_body": email_text}
+    checkpoint_path = checkpoint_path_for(output_path)
+    fingerprint = _dataset_fingerprint(data_path, api_url)
+    rows_done, output_bytes = load_checkpoint(checkpoint_path, fingerprint) if resume else (0, 0)
+    if rows_done and (not output_path.exists() or output_path.stat().st_size < output_bytes):
+        print(f"Output file {output_path} is shorter than its checkpoint; starting over.")
+        rows_done, output_bytes = 0, 0
+    if rows_done:
+        print(f"Resuming after {rows_done}/{total_emails} emails (checkpoint {checkpoint_path}).")
+    print(f"Processing {total_emails - rows_done} emails via API: {api_url} (concurrency {concurrency})")
 
+    # Results can finish out of order; they wait in `finished` until every earlier
+    # row has been written. `window` bounds that buffer so one slow email can't
+    # make it grow without limit.
+    queue: "asyncio.Queue" = asyncio.Queue()
+    window = asyncio.Semaphore(concurrency * 4)
+    finished: Dict[int, Dict] = {}
+    result_ready = asyncio.Event()
+
+    async def producer():
+        for position in range(rows_done, total_emails):
+            await window.acquire()
+            await queue.put(position)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def worker(client: httpx.AsyncClient):
+        while True:
+            position = await queue.get()
+            if position is None:
+                return
+            index, email_text = rows[position]
+            try:
+                finished[position] = await classify_one(client, api_url, index, email_text)
+            except Exception as e:
+                # Never leave a hole in the output; the writer waits for every position
+                finished[position] = {"error": f"{type(e).__name__}: {e}", "input_email_body": email_text, "index": index}
+            result_ready.set()
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    # Open in append mode after dropping anything written past the checkpoint
+    with open(output_path, 'a+b') as f_out:
+        f_out.truncate(output_bytes)
+        f_out.seek(output_bytes)
+        async with httpx.AsyncClient(limits=limits, timeout=REQUEST_TIMEOUT) as client:
+            tasks = [asyncio.create_task(producer())]
+            tasks += [asyncio.create_task(worker(client)) for _ in range(concurrency)]
+
+            started = last_progress = time.monotonic()
+            next_position, written_since_checkpoint = rows_done, 0
             try:
-                response = requests.post(api_url, json=payload, timeout=30) # Added timeout
-                response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
-
-                api_result = response.json()
-
-                # Write result as a JSON line
-                f_out.write(json.dumps(api_result) + '\n')
-
-                if (index + 1) % 50 == 0: # Print progress every 50 emails
-                    print(f"Processed {index + 1}/{total_emails} emails...")
-
-            except requests.exceptions.RequestException as e:
-                print(f"\nError processing email index {index}: {e}")
-                # Optionally write error info to the file or a separate log
-                error_info = {
-                    "error": str(e),
-                    "input_email_body": email_text,
-                    "index": index
-                }
-                f_out.write(json.dumps(error_info) + '\n')
-                # Optional: add a small delay if API is overloaded
-                # time.sleep(0.5)
-            except json.JSONDecodeError as e:
-                 print(f"\nError decoding JSON response for email index {index}: {e}")
-                 print(f"Response status code: {response.status_code}")
-                 print(f"Response text: {response.text[:500]}...") # Print beginning of text
-                 error_info = {
-                    "error": f"JSONDecodeError: {e}",
-                    "response_text": response.text,
-                    "input_email_body": email_text,
-                    "index": index
-                 }
-                 f_out.write(json.dumps(error_info) + '\n')
+                while next_position < total_emails:
+                    await result_ready.wait()
+                    result_ready.clear()
+                    while next_position in finished:
+                        # Write result as a JSON line
+                        f_out.write((json.dumps(finished.pop(next_position)) + '\n').encode('utf-8'))
+                        next_position += 1
+                        written_since_checkpoint += 1
+                        window.release()
+                    if written_since_checkpoint >= CHECKPOINT_EVERY or next_position == total_emails:
+                        f_out.flush()
+                        os.fsync(f_out.fileno())
+                        save_checkpoint(checkpoint_path, fingerprint, next_position, f_out.tell())
+                        written_since_checkpoint = 0
 
+                    now = time.monotonic()
+                    if now - last_progress >= PROGRESS_EVERY_S or next_position == total_emails:
+                        last_progress = now
+                        rate = (next_position - rows_done) / max(now - started, 1e-9)
+                        eta = (total_emails - next_position) / rate if rate else float('inf')
+                        print(f"Processed {next_position}/{total_emails} emails "
+                              f"({rate:.1f} emails/s, ETA {time.strftime('%H:%M:%S', time.gmtime(eta)) if eta != float('inf') else '?'})")
+                # Propagate a crashed producer/worker instead of hanging
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                f_out.flush()
+                save_checkpoint(checkpoint_path, fingerprint, next_position, f_out.tell())
 
+    checkpoint_path.unlink(missing_ok=True)
     print(f"\nProcessing complete. Results saved to {output_path}")
 
+def process_emails_via_api(data_path: Path, output_path: Path, api_url: str,
+                           concurrency: int = CONCURRENCY, resume: bool = True):
+    """Synchronous entry point for process_emails_via_api_async."""
+    asyncio.run(process_emails_via_api_async(data_path, output_path, api_url, concurrency, resume))
+
+
+# --- Offline Mode ---
+def _process_offline_batch(indices: List, email_bodies: List[str], ner_gate: Optional[str]) -> bytes:
+    """
+    Worker task: masks and classifies a batch in-process and returns its JSONL
+    lines, so results are serialised in the workers rather than the parent.
+    """
+    from utils import process_email_batch  # Already loaded by the worker initializer
+    results = process_email_batch(email_bodies, ner_gate=ner_gate)
+    lines = []
+    for index, result in zip(indices, results):
+        result["index"] = index
+        lines.append(json.dumps(result))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+def _iter_email_batches(data_path: Path, chunk_rows: int, batch_size: int) -> Iterator[Tuple[List, List[str]]]:
+    """Streams (row_indices, email_bodies) batches from the CSV without loading it whole."""
+    reader = pd.read_csv(data_path, usecols=[email_body_column], chunksize=chunk_rows, on_bad_lines='skip')
+    for chunk in reader:
+        chunk = chunk.dropna(subset=[email_body_column])
+        indices = chunk.index.tolist()
+        bodies = chunk[email_body_column].astype(str).tolist()
+        for start in range(0, len(bodies), batch_size):
+            yield indices[start:start + batch_size], bodies[start:start + batch_size]
+
+def process_emails_offline(data_path: Path, output_path: Path, workers: Optional[int] = None,
+                           chunk_rows: int = OFFLINE_CHUNK_ROWS, batch_size: int = OFFLINE_BATCH_SIZE,
+                           ner_gate: Optional[str] = None):
+    """
+    Masks and classifies every email in the CSV without the API. Work is spread
+    over a process pool whose workers load the spaCy model and the pipeline once
+    (the same initializer the API's process backend uses). The registry version
+    CURRENT points at when the run starts is pinned: workers do not watch for
+    new versions, so one run is never classified by a mix of models. At most
+    2 batches per worker are in flight and results are written in input order
+    as they finish, so memory stays bounded however large the CSV is.
+    """
+    if not data_path.exists():
+        print(f"Error: Input dataset not found at {data_path}")
+        return
+    try:
+        columns = pd.read_csv(data_path, nrows=0).columns
+    except Exception as e:
+        print(f"Error loading CSV: {e}")
+        return
+    if email_body_column not in columns:
+        print(f"Error: Email body column '{email_body_column}' not found.")
+        return
+    from inference_pool import INFERENCE_START_METHOD, _init_worker
+    from model_registry import MODEL_REGISTRY_DIR, read_current
+
+    try:
+        model_version = read_current(MODEL_REGISTRY_DIR)  # None: the legacy artifact, nothing to pin
+    except (OSError, ValueError) as e:
+        print(f"Error reading the model registry in {MODEL_REGISTRY_DIR}: {e}")
+        return
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = 2 * workers
+    print(f"Processing {data_path} offline with {workers} worker process(es), batches of {batch_size}"
+          f"{f', model {model_version}' if model_version else ''}...")
+
+    batches = _iter_email_batches(data_path, chunk_rows, batch_size)
+    processed = 0
+    started = last_progress = time.monotonic()
+    with open(output_path, 'wb') as f_out, ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(INFERENCE_START_METHOD),
+        initializer=_init_worker,
+        initargs=(False, model_version),
+    ) as executor:
+        in_flight = deque()
+        for indices, bodies in batches:
+            if len(in_flight) >= max_in_flight:
+                f_out.write(in_flight.popleft().result())
+            in_flight.append(executor.submit(_process_offline_batch, indices, bodies, ner_gate))
+            processed += len(bodies)
+
+            now = time.monotonic()
+            if now - last_progress >= PROGRESS_EVERY_S:
+                last_progress = now
+                print(f"Submitted {processed} emails ({processed / (now - started):.1f} emails/s)")
+        while in_flight:
+            f_out.write(in_flight.popleft().result())
+
+    elapsed = time.monotonic() - started
+    print(f"\nProcessing complete: {processed} emails in {elapsed:.1f}s ({processed / max(elapsed, 1e-9):.1f} emails/s). Results saved to {output_path}")
+
 
 # --- Script Execution ---
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mask and classify every email in a CSV, writing JSON Lines.")
+    parser.add_argument("--input", type=Path, default=DATASET_PATH, help=f"Input CSV (default: {DATASET_PATH})")
+    parser.add_argument("--output", type=Path, default=OUTPUT_PATH, help=f"Output JSONL (default: {OUTPUT_PATH})")
+    parser.add_argument("--offline", action="store_true",
+                        help="Process in-process on a worker pool instead of calling the API")
+    parser.add_argument("--workers", type=int, default=None, help="Offline worker processes (default: all CPUs)")
+    parser.add_argument("--batch-size", type=int, default=OFFLINE_BATCH_SIZE, help="Offline emails per worker task")
+    parser.add_argument("--ner-gate", choices=["off", "on", "shadow"], default=None, help="Offline NER gate mode")
+    parser.add_argument("--api-url", default=API_ENDPOINT, help=f"API endpoint (default: {API_ENDPOINT})")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="API requests in flight")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore an existing API-mode checkpoint")
+    parser.add_argument("--yes", "-y", action="store_true", help="Don't wait for confirmation that the API is running")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    # Make sure the API is running before executing this script!
-    print("--- Starting API Output Generation ---")
-    print("Ensure the FastAPI server (python app.py or uvicorn) is running in another terminal.")
-    input("Press Enter to continue once the API is running...")
-    process_emails_via_api(DATASET_PATH, OUTPUT_PATH, API_ENDPOINT)
-    print("--- Finished API Output Generation ---")
+    args = parse_args()
+    if args.offline:
+        print("--- Starting Offline Output Generation ---")
+        process_emails_offline(args.input, args.output, args.workers, batch_size=args.batch_size, ner_gate=args.ner_gate)
+        print("--- Finished Offline Output Generation ---")
+    else:
+        # Make sure the API is running before executing this script!
+        print("--- Starting API Output Generation ---")
+        if not args.yes:
+            print("Ensure the FastAPI server (python app.py or uvicorn) is running in another terminal.")
+            input("Press Enter to continue once the API is running...")
+        process_emails_via_api(args.input, args.output, args.api_url, args.concurrency, resume=not args.no_resume)
+        print("--- Finished API Output Generation ---")
@@ -0,0 +1,155 @@
+import logging
+logger = logging.getLogger(__name__)
+
+logger.debug("Importing inference_pool.py...")
+
+# --- Imports ---
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import metrics
+
+# --- Configuration ---
+# CPU-bound inference (spaCy, regex, sklearn) is dispatched off the asyncio event
+# loop with run_in_executor so slow emails don't stall other connections.
+#   INFERENCE_BACKEND:      "thread" (default), "process" or "inline" (run on the event loop, old behaviour)
+#   INFERENCE_WORKERS:      pool size (default: min(4, CPUs) for threads, CPUs for processes)
+#   INFERENCE_QUEUE_DEPTH:  requests allowed to wait for a free worker before new ones
+#                           are rejected (default: 4 x workers)
+#   INFERENCE_START_METHOD: multiprocessing start method for the process backend (default: "spawn")
+INFERENCE_BACKENDS = ("inline", "thread", "process")
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "thread").strip().lower()
+_CPU_COUNT = os.cpu_count() or 1
+INFERENCE_WORKERS = int(os.environ.get(
+    "INFERENCE_WORKERS", _CPU_COUNT if INFERENCE_BACKEND == "process" else min(4, _CPU_COUNT)
+))
+INFERENCE_QUEUE_DEPTH = int(os.environ.get("INFERENCE_QUEUE_DEPTH", 4 * INFERENCE_WORKERS))
+INFERENCE_START_METHOD = os.environ.get("INFERENCE_START_METHOD", "spawn")
+
+class PoolSaturatedError(RuntimeError):
+    """Raised when every worker is busy and the wait queue is full."""
+
+# --- Worker Process Setup ---
+def _init_worker(watch_models: bool = True, model_version: Optional[str] = None) -> None:
+    """
+    Process pool initializer: loads the spaCy model and the pipeline once per
+    worker and warms them up. With `watch_models` it starts the worker's model
+    watcher, which picks up new versions published to the model registry.
+    Bulk jobs pass False and the registry `model_version` they read at start,
+    so every worker serves that one version for the whole run.
+    """
+    logging.basicConfig(
+        level=os.environ.get("LOG_LEVEL", "WARNING").strip().upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    from utils import reload_model, start_model_watcher, warm_up
+    logger.debug(f"Inference worker {os.getpid()} loading models...")
+    if model_version is not None:
+        reload_model(model_version)  # Loaded before warm_up, which then finds it active
+    if warm_up():
+        logger.info(f"Inference worker {os.getpid()} ready.")
+    if watch_models:
+        start_model_watcher()
+
+def _ping() -> int:
+    return os.getpid()
+
+def _run_with_metrics_capture(func: Callable[..., Any], args: tuple, kwargs: dict) -> tuple:
+    """
+    Runs `func` in a worker process and returns (result, exception, metric
+    updates) for the parent to replay; updates made before a raise are kept.
+    """
+    with metrics.capture() as events:
+        try:
+            return func(*args, **kwargs), None, events
+        except Exception as e:
+            return None, e, events
+
+# --- Pool ---
+class InferencePool:
+    """Runs blocking inference calls on a thread or process pool from async code."""
+
+    def __init__(self, backend: str = INFERENCE_BACKEND, workers: int = INFERENCE_WORKERS,
+                 queue_depth: int = INFERENCE_QUEUE_DEPTH, start_method: str = INFERENCE_START_METHOD):
+        if backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown INFERENCE_BACKEND '{backend}'. Expected one of: {', '.join(INFERENCE_BACKENDS)}")
+        self.backend = backend
+        self.workers = max(1, workers)
+        self.queue_depth = max(0, queue_depth)
+        self.start_method = start_method
+        self.executor: Optional[Executor] = None
+        self.in_flight = 0  # Only touched from the event loop thread
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+    def start(self) -> None:
+        """Creates the executor. Process workers load the models in their initializer."""
+        if self.executor is not None or self.backend == "inline":
+            return
+        if self.backend == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        else:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=_init_worker,
+            )
+        logger.info(f"Inference pool started: backend={self.backend}, workers={self.workers}, queue_depth={self.queue_depth}")
+
+    async def warm_up(self) -> None:
+        """Makes sure every process worker is started (and has loaded its models) before traffic arrives."""
+        if self.backend != "process" or self.executor is None:
+            return
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*(loop.run_in_executor(self.executor, _ping) for _ in range(self.workers)))
+        logger.info(f"Inference pool warm: {len(set(pids))} worker process(es) ready.")
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+            logger.info("Inference pool shut down.")
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Runs `func(*args, **kwargs)` on the pool and returns its result.
+        Raises PoolSaturatedError when workers + queue_depth calls are already in flight.
+        With the process backend `func` must be a picklable top-level function.
+        """
+        if self.in_flight >= self.workers + self.queue_depth:
+            self.stats["rejected"] += 1
+            raise PoolSaturatedError(
+                f"Inference queue is full ({self.in_flight} requests in flight). Try again shortly."
+            )
+        self.in_flight += 1
+        self.stats["submitted"] += 1
+        try:
+            if self.executor is None:
+                result = func(*args, **kwargs)  # "inline" backend (or pool not started)
+            elif self.backend == "process":
+                # Stage timings recorded in the worker are shipped back so /metrics sees them
+                loop = asyncio.get_running_loop()
+                result, error, events = await loop.run_in_executor(self.executor, _run_with_metrics_capture, func, args, kwargs)
+                metrics.replay(events)
+                if error is not None:
+                    raise error
+            else:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+            self.stats["completed"] += 1
+            return result
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self.stats)
+        stats.update(backend=self.backend, workers=self.workers, queue_depth=self.queue_depth, in_flight=self.in_flight)
+        return stats
+
+logger.debug("inference_pool.py finished importing.")
@@ -0,0 +1,244 @@
+"""
+Minimal in-process metrics (counters and histograms) rendered in the
+Prometheus text exposition format for the /metrics endpoint.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# --- Defaults ---
+# Latency buckets in seconds, from sub-millisecond regex scans up to slow NER passes
+DEFAULT_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+# (metric name, label values, value) recorded while a capture() is active
+MetricEvent = Tuple[str, LabelValues, float]
+
+_capture_state = threading.local()
+
+def _escape_label_value(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+# --- Metric Types ---
+class _Metric:
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _record(self, label_values: LabelValues, value: float) -> None:
+        raise NotImplementedError
+
+    def _emit(self, label_values: LabelValues, value: float) -> None:
+        self._record(label_values, value)
+        events = getattr(_capture_state, "events", None)
+        if events is not None:
+            events.append((self.name, label_values, value))
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally labelled."""
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        self._emit(self._label_values(labels), amount)
+
+    def _record(self, label_values: LabelValues, value: float) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + value
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._label_values(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}" for values, value in items]
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram, optionally labelled."""
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        self._emit(self._label_values(labels), value)
+
+    def _record(self, label_values: LabelValues, value: float) -> None:
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            else:
+                state[len(self.buckets)] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, **labels: str):
+        """Observes the wall-clock duration of the block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self, **labels: str) -> Dict[str, object]:
+        """Cumulative bucket counts, sum and count for one label set."""
+        with self._lock:
+            state = list(self._values.get(self._label_values(labels), [0] * (len(self.buckets) + 2)))
+        cumulative, running = {}, 0
+        for bound, count in zip(list(self.buckets) + [float("inf")], state[:-1]):
+            running += count
+            cumulative[_format_value(bound)] = running
+        return {"buckets": cumulative, "count": running, "sum": state[-1]}
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((values, list(state)) for values, state in self._values.items())
+        lines = []
+        for values, state in items:
+            running = 0
+            for bound, count in zip(list(self.buckets) + [float("inf")], state[:-1]):
+                running += count
+                labels = _format_labels(self.labelnames, values, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {running}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_count{labels} {running}")
+        return lines
+
+# --- Registry ---
+# A collector returns (name, type, documentation, [(labels, value), ...]) tuples
+# computed at scrape time, for values that live elsewhere (pool sizes, cache stats).
+CollectorSample = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[CollectorSample]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing  # Module re-imported; keep one instance per name
+            self._metrics[metric.name] = metric
+            return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[CollectorSample]]) -> None:
+        with self._lock:
+            self._collectors.append(collector)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Renders every metric and collector in the Prometheus text format."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                collected = list(collector())
+            except Exception:
+                continue  # A broken collector must not take down /metrics
+            for name, metric_type, documentation, samples in collected:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(f"{name}{_format_labels(names, [labels[n] for n in names])} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+# --- Cross-Process Capture ---
+@contextmanager
+def capture():
+    """
+    Records every metric update made by this thread inside the block, so a worker
+    process can ship them back to the parent (see replay()).
+    """
+    previous = getattr(_capture_state, "events", None)
+    events: List[MetricEvent] = []
+    _capture_state.events = events
+    try:
+        yield events
+    finally:
+        _capture_state.events = previous
+
+def replay(events: Iterable[MetricEvent]) -> None:
+    """Applies metric updates captured in another process to this process's registry."""
+    for name, label_values, value in events:
+        metric = REGISTRY.get(name)
+        if metric is not None:
+            metric._record(tuple(label_values), value)
+
+# --- Shared Metrics ---
+STAGE_SECONDS = histogram(
+    "email_stage_duration_seconds",
+    "Time spent in each processing stage (per email, or per batch for *_batch stages).",
+    labelnames=("stage",),
+)
+PII_ENTITIES = counter(
+    "pii_entities_total",
+    "PII entities masked, by entity type.",
+    labelnames=("type",),
+)
+
+def stage_timer(stage: str):
+    """Context manager timing one processing stage into email_stage_duration_seconds."""
+    return STAGE_SECONDS.time(stage=stage)
@@ -0,0 +1,263 @@
+import logging
+logger = logging.getLogger(__name__)
+
+logger.debug("Importing micro_batcher.py...")
+
+# --- Imports ---
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from inference_pool import INFERENCE_QUEUE_DEPTH, PoolSaturatedError
+from metrics import histogram
+
+# --- Configuration ---
+# Concurrent single-email requests are queued and flushed as one batch when
+# either the batch is full or the oldest request has waited long enough, so
+# nlp.pipe and a single pipeline.predict serve all of them.
+#   MICROBATCH_ENABLED:           "1"/"true" to coalesce /classify_email/ calls (default: disabled)
+#   MICROBATCH_MAX_SIZE:          upper bound for a batch (default: 32)
+#   MICROBATCH_MAX_WAIT_MS:       upper bound for how long the oldest request waits (default: 5)
+#   MICROBATCH_ADAPTIVE:          adapt batch size and wait to observed load (default: enabled)
+#   MICROBATCH_LATENCY_BUDGET_MS: target processing time of one batch, used to cap
+#                                 the adaptive batch size (default: 100)
+#   MICROBATCH_MAX_PENDING:       requests allowed to wait for a batch; beyond that submit
+#                                 raises PoolSaturatedError (503), like the inference pool's
+#                                 queue does without batching; 0 = no limit
+#                                 (default: INFERENCE_QUEUE_DEPTH, at least MICROBATCH_MAX_SIZE)
+MICROBATCH_ENABLED = os.environ.get("MICROBATCH_ENABLED", "0").strip().lower() in ("1", "true", "yes")
+MICROBATCH_MAX_SIZE = int(os.environ.get("MICROBATCH_MAX_SIZE", 32))
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get("MICROBATCH_MAX_WAIT_MS", 5))
+MICROBATCH_ADAPTIVE = os.environ.get("MICROBATCH_ADAPTIVE", "1").strip().lower() in ("1", "true", "yes")
+MICROBATCH_LATENCY_BUDGET_MS = float(os.environ.get("MICROBATCH_LATENCY_BUDGET_MS", 100))
+MICROBATCH_MAX_PENDING = int(os.environ.get("MICROBATCH_MAX_PENDING", max(INFERENCE_QUEUE_DEPTH, MICROBATCH_MAX_SIZE)))
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+QUEUE_DELAY_BUCKETS_S = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+EWMA_ALPHA = 0.2  # Weight of the newest observation in the moving averages
+
+BATCH_SIZE = histogram("microbatch_batch_size", "Requests per flushed micro-batch.", buckets=BATCH_SIZE_BUCKETS)
+QUEUE_DELAY = histogram(
+    "microbatch_queue_delay_seconds", "Time a request waited in the micro-batch queue.", buckets=QUEUE_DELAY_BUCKETS_S
+)
+
+class _PendingRequest:
+    __slots__ = ("key", "payload", "future", "enqueued_at")
+
+    def __init__(self, key: Hashable, payload: Any, future: asyncio.Future):
+        self.key = key
+        self.payload = payload
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+# --- Micro-Batcher ---
+class MicroBatcher:
+    """
+    Coalesces concurrent `submit(key, payload)` calls into batches.
+
+    `run_batch(key, payloads)` is awaited once per key present in a flushed batch
+    and must return one result per payload, in order. Each caller's future is
+    resolved with its own result (or the exception raised for its batch); a
+    result that is an exception instance is raised for that caller only.
+    At most `max_pending` requests wait to be batched (0 = no limit).
+
+    When adaptive, the wait shrinks to zero if fewer than one more request is
+    expected within MICROBATCH_MAX_WAIT_MS (no point delaying a lone request),
+    and the batch size is capped so a batch fits the latency budget given the
+    observed per-email processing time.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[Hashable, List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = MICROBATCH_MAX_SIZE,
+        max_wait_ms: float = MICROBATCH_MAX_WAIT_MS,
+        adaptive: bool = MICROBATCH_ADAPTIVE,
+        latency_budget_ms: float = MICROBATCH_LATENCY_BUDGET_MS,
+        max_concurrent_batches: int = 1,
+        max_pending: int = MICROBATCH_MAX_PENDING,
+    ):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self.adaptive = adaptive
+        self.latency_budget_ms = latency_budget_ms
+        self.max_concurrent_batches = max(1, max_concurrent_batches)
+        self.max_pending = max(0, max_pending)
+
+        self._pending: "deque[_PendingRequest]" = deque()
+        self._has_items: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Load estimates (EWMA)
+        self._last_arrival: Optional[float] = None
+        self._interarrival_s: Optional[float] = None
+        self._last_gap_s: Optional[float] = None
+        self._per_item_ms: Optional[float] = None
+
+        self.stats = {
+            "requests": 0,
+            "rejected": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "dropped": 0,
+            "queue_delay_ms_sum": 0.0,
+            "queue_delay_ms_max": 0.0,
+        }
+
+    # --- Lifecycle ---
+    def start(self) -> None:
+        """Starts the flush loop on the running event loop."""
+        if self._task is None:
+            self._has_items = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+            logger.info(f"Micro-batcher started: max_batch_size={self.max_batch_size}, "
+                        f"max_wait_ms={self.max_wait_ms}, adaptive={self.adaptive}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._pending:
+            request = self._pending.popleft()
+            if not request.future.done():
+                request.future.set_exception(RuntimeError("Micro-batcher stopped before the request was processed."))
+
+    # --- Submission ---
+    async def submit(self, key: Hashable, payload: Any) -> Any:
+        """Queues one request and waits for its result. Raises PoolSaturatedError when the queue is full."""
+        if self._task is None:
+            raise RuntimeError("Micro-batcher is not started.")
+        if self.max_pending and len(self._pending) >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise PoolSaturatedError(
+                f"Micro-batch queue is full ({len(self._pending)} requests waiting). Try again shortly."
+            )
+        now = time.monotonic()
+        if self._last_arrival is not None:
+            self._last_gap_s = now - self._last_arrival
+            self._interarrival_s = self._ewma(self._interarrival_s, self._last_gap_s)
+        self._last_arrival = now
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(_PendingRequest(key, payload, future))
+        self.stats["requests"] += 1
+        self._has_items.set()
+        return await future
+
+    # --- Adaptation ---
+    @staticmethod
+    def _ewma(current: Optional[float], value: float) -> float:
+        return value if current is None else (1 - EWMA_ALPHA) * current + EWMA_ALPHA * value
+
+    def current_batch_limit(self) -> int:
+        if not self.adaptive or not self._per_item_ms:
+            return self.max_batch_size
+        fits_budget = int(self.latency_budget_ms / self._per_item_ms)
+        return max(1, min(self.max_batch_size, fits_budget))
+
+    def current_wait_ms(self, batch_limit: int) -> float:
+        if not self.adaptive:
+            return self.max_wait_ms
+        if not self._interarrival_s:
+            return 0.0  # No load observed yet
+        # A long gap before the latest request means traffic just resumed after a
+        # quiet period; trust that over the slower moving average.
+        interarrival_s = max(self._interarrival_s, self._last_gap_s or 0.0)
+        arrival_rate_per_ms = 1 / (interarrival_s * 1000)
+        if arrival_rate_per_ms * self.max_wait_ms < 1:
+            return 0.0  # Fewer than one more request expected; waiting only adds latency
+        time_to_fill_ms = (batch_limit - 1) / arrival_rate_per_ms
+        return min(self.max_wait_ms, time_to_fill_ms)
+
+    # --- Flushing ---
+    async def _flush_loop(self) -> None:
+        while True:
+            while not self._pending:
+                self._has_items.clear()
+                await self._has_items.wait()
+
+            # Requests keep queueing while every batch slot is busy, so batches
+            # grow naturally under load.
+            await self._slots.acquire()
+
+            batch_limit = self.current_batch_limit()
+            flush_at = self._pending[0].enqueued_at + self.current_wait_ms(batch_limit) / 1000
+            while len(self._pending) < batch_limit:
+                remaining = flush_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._has_items.clear()
+                try:
+                    await asyncio.wait_for(self._has_items.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            batch = [self._pending.popleft() for _ in range(min(batch_limit, len(self._pending)))]
+            asyncio.get_running_loop().create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch: List[_PendingRequest]) -> None:
+        started = time.monotonic()
+        try:
+            self.stats["batches"] += 1
+            BATCH_SIZE.observe(len(batch))
+            for request in batch:
+                delay_ms = (started - request.enqueued_at) * 1000
+                self.stats["queue_delay_ms_sum"] += delay_ms
+                self.stats["queue_delay_ms_max"] = max(self.stats["queue_delay_ms_max"], delay_ms)
+                QUEUE_DELAY.observe(delay_ms / 1000)
+
+            # A flushed batch may mix keys (e.g. NER gate modes); run one call per key.
+            # Requests whose caller stopped waiting (e.g. its deadline passed) are dropped.
+            groups: Dict[Hashable, List[_PendingRequest]] = {}
+            for request in batch:
+                if request.future.done():
+                    self.stats["dropped"] += 1
+                    continue
+                groups.setdefault(request.key, []).append(request)
+            for key, requests in groups.items():
+                try:
+                    results = await self.run_batch(key, [request.payload for request in requests])
+                    for request, result in zip(requests, results):
+                        if request.future.done():
+                            continue
+                        if isinstance(result, Exception):
+                            request.future.set_exception(result)
+                        else:
+                            request.future.set_result(result)
+                except Exception as e:
+                    self.stats["failed_batches"] += 1
+                    for request in requests:
+                        if not request.future.done():
+                            request.future.set_exception(e)
+
+            processed = sum(len(requests) for requests in groups.values())
+            if processed:
+                elapsed_ms = (time.monotonic() - started) * 1000
+                self._per_item_ms = self._ewma(self._per_item_ms, elapsed_ms / processed)
+        finally:
+            self._slots.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self.stats)
+        stats.update(
+            pending=len(self._pending),
+            max_pending=self.max_pending,
+            current_batch_limit=self.current_batch_limit(),
+            current_wait_ms=round(self.current_wait_ms(self.current_batch_limit()), 3),
+            arrival_rate_per_s=round(1 / self._interarrival_s, 1) if self._interarrival_s else 0.0,
+            per_item_ms=round(self._per_item_ms, 3) if self._per_item_ms else None,
+            batch_size_histogram=BATCH_SIZE.snapshot()["buckets"],
+            queue_delay_seconds_histogram=QUEUE_DELAY.snapshot()["buckets"],
+        )
+        return stats
+
+logger.debug("micro_batcher.py finished importing.")
@@ -0,0 +1,195 @@
+import logging
+logger = logging.getLogger(__name__)
+
+logger.debug("Importing model_registry.py...")
+
+# --- Imports ---
+# joblib (and with it sklearn) is imported only when a pickled pipeline is read or written
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Any, List, NamedTuple, Optional, Union
+
+from compact_model import CompactNBModel, export_compact_model
+
+# --- Configuration ---
+# Versioned classifier artifacts, so a retrained model can be deployed without
+# restarting the API:
+#   saved_models/
+#     CURRENT                                  name of the version to serve (replaced atomically)
+#     versions/<version>/email_classifier_pipeline.pkl
+#     versions/<version>/email_classifier_compact/   (when the pipeline supports it)
+# Without a CURRENT file the single legacy artifact (utils.MODEL_PATH or
+# COMPACT_MODEL_DIR) is served, as before.
+#   MODEL_REGISTRY_DIR:      registry root (default: saved_models)
+#   MODEL_WATCH_INTERVAL_S:  how often each serving process re-reads CURRENT and
+#                            loads a new version in the background; 0 disables
+#                            the watcher (default: 5)
+MODEL_REGISTRY_DIR = Path(os.environ.get("MODEL_REGISTRY_DIR", "saved_models"))
+MODEL_WATCH_INTERVAL_S = float(os.environ.get("MODEL_WATCH_INTERVAL_S", 5))
+
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+PICKLE_NAME = "email_classifier_pipeline.pkl"
+COMPACT_NAME = "email_classifier_compact"
+_VERSION_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,127}$")
+
+class LoadedModel(NamedTuple):
+    """A classifier and the version it was loaded as. Swapped as one object, never field by field."""
+    pipeline: Any  # sklearn Pipeline or CompactNBModel
+    version: str
+
+# --- Layout ---
+def validate_version(version: str) -> str:
+    """Returns `version` if it is a safe directory name, else raises ValueError."""
+    if not isinstance(version, str) or not _VERSION_RE.match(version):
+        raise ValueError(f"Invalid model version {version!r}: use letters, digits, '.', '_' and '-'")
+    return version
+
+def version_dir(version: str, registry_dir: Union[str, Path] = MODEL_REGISTRY_DIR) -> Path:
+    return Path(registry_dir) / VERSIONS_DIR / validate_version(version)
+
+def list_versions(registry_dir: Union[str, Path] = MODEL_REGISTRY_DIR) -> List[str]:
+    """Published versions, oldest first."""
+    root = Path(registry_dir) / VERSIONS_DIR
+    if not root.is_dir():
+        return []
+    entries = [entry for entry in root.iterdir() if entry.is_dir() and _VERSION_RE.match(entry.name)]
+    return [entry.name for entry in sorted(entries, key=lambda entry: (entry.stat().st_mtime_ns, entry.name))]
+
+def read_current(registry_dir: Union[str, Path] = MODEL_REGISTRY_DIR) -> Optional[str]:
+    """The version CURRENT points at, or None when the registry is not in use."""
+    try:
+        version = (Path(registry_dir) / CURRENT_FILE).read_text().strip()
+    except FileNotFoundError:
+        return None
+    return validate_version(version)
+
+def set_current(version: str, registry_dir: Union[str, Path] = MODEL_REGISTRY_DIR) -> None:
+    """
+    Points CURRENT at an already published version. The file is written next
+    to CURRENT and renamed over it, so readers see the old or the new name,
+    never a partial one.
+    """
+    if not version_dir(version, registry_dir).is_dir():
+        raise FileNotFoundError(f"Model version '{version}' is not published in {Path(registry_dir) / VERSIONS_DIR}")
+    registry_dir = Path(registry_dir)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{CURRENT_FILE}.", dir=registry_dir)
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(version + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)  # mkstemp creates it owner-only
+        os.replace(tmp_path, registry_dir / CURRENT_FILE)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+# --- Publishing ---
+def new_version_name() -> str:
+    """Sortable, unique name such as 20261016-142501-3f9a2c."""
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+def publish_pipeline(pipeline, registry_dir: Union[str, Path] = MODEL_REGISTRY_DIR,
+                     version: Optional[str] = None, activate: bool = True) -> str:
+    """
+    Saves a fitted pipeline as a new version: the joblib pickle plus, when the
+    pipeline supports it, the compact artifact (MODEL_FORMAT=compact). The
+    version directory is renamed into place complete. With `activate`,
+    CURRENT is then pointed at it. Returns the version name.
+    """
+    import joblib
+
+    version = validate_version(version or new_version_name())
+    target = version_dir(version, registry_dir)
+    if target.exists():
+        raise FileExistsError(f"Model version '{version}' already exists at {target}")
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=f".{version}.", dir=target.parent))
+    try:
+        joblib.dump(pipeline, tmp_dir / PICKLE_NAME)
+        try:
+            export_compact_model(pipeline, tmp_dir / COMPACT_NAME)
+        except ValueError as e:
+            logger.info(f"Version {version}: no compact artifact ({e}); it can only be served with MODEL_FORMAT=pickle.")
+        os.chmod(tmp_dir, 0o755)  # mkdtemp creates it owner-only
+        os.replace(tmp_dir, target)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    logger.info(f"Published model version {version} to {target}.")
+    if activate:
+        set_current(version, registry_dir)
+        logger.info(f"CURRENT now points at {version}.")
+    return version
+
+# --- Loading ---
+def _file_version(path: Path) -> str:
+    """Content hash of an unversioned pickle, so responses still name the model that served them."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return "sha256-" + digest.hexdigest()[:12]
+
+def load_artifact(pickle_path: Path, compact_dir: Path, model_format: str, version: Optional[str] = None) -> LoadedModel:
+    """
+    Loads one classifier artifact in `model_format` ("pickle" or "compact").
+    Without `version` it is named by its content (the compact model_version or
+    a hash of the pickle). Raises on any failure; the caller decides what to serve.
+    """
+    if model_format == "compact":
+        model = CompactNBModel.load(compact_dir)
+        return LoadedModel(model, version or model.model_version)
+    if model_format != "pickle":
+        raise ValueError(f"Unknown MODEL_FORMAT '{model_format}'. Expected one of: pickle, compact")
+    if not pickle_path.exists():
+        raise FileNotFoundError(f"Model pipeline not found at {pickle_path}")
+    import joblib  # Also imports sklearn, while unpickling
+
+    return LoadedModel(joblib.load(pickle_path), version or _file_version(pickle_path))
+
+def load_version(version: str, model_format: str, registry_dir: Union[str, Path] = MODEL_REGISTRY_DIR) -> LoadedModel:
+    """Loads a published version in `model_format`."""
+    directory = version_dir(version, registry_dir)
+    return load_artifact(directory / PICKLE_NAME, directory / COMPACT_NAME, model_format, version=version)
+
+# --- Command Line ---
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Manage the versioned classifier artifacts served by the API.")
+    parser.add_argument("--registry", type=Path, default=MODEL_REGISTRY_DIR, help=f"Registry root (default: {MODEL_REGISTRY_DIR})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List published versions; * marks CURRENT")
+    activate = commands.add_parser("activate", help="Point CURRENT at a published version (also used to roll back)")
+    activate.add_argument("version")
+    publish = commands.add_parser("publish", help="Publish a pickled pipeline (e.g. one saved by train.py) as a new version")
+    publish.add_argument("pipeline", type=Path)
+    publish.add_argument("--version", help="Version name (default: timestamp + random suffix)")
+    publish.add_argument("--no-activate", action="store_true", help="Publish without pointing CURRENT at it")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        current = read_current(args.registry)
+        for version in list_versions(args.registry):
+            print(f"{'*' if version == current else ' '} {version}")
+    elif args.command == "activate":
+        set_current(args.version, args.registry)
+        print(f"CURRENT -> {args.version}")
+    else:
+        import joblib
+
+        version = publish_pipeline(joblib.load(args.pipeline), args.registry, args.version, activate=not args.no_activate)
+        print(f"Published {version}{'' if args.no_activate else ' (CURRENT)'}")
+
+logger.debug("model_registry.py finished importing.")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    main()
@@ -1,26 +1,24 @@
-print("Importing models.py...") # Add print statement
+import logging
+logger = logging.getLogger(__name__)
 
-# --- Define/Import Pipeline Type FIRST ---
-try:
-    from sklearn.pipeline import Pipeline
-    print("models.py: Imported Pipeline from sklearn.")
-except ImportError:
-    Pipeline = object # type: ignore
-    print("models.py: Defined fallback Pipeline type.")
+logger.debug("Importing models.py...")
+
+# Serving-side classification only: training lives in train.py and the API in
+# api.py. Heavy libraries (sklearn, joblib) are imported where they are needed,
+# so importing this module costs little more than numpy.
 
-# --- Other Imports ---
-import joblib
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.naive_bayes import MultinomialNB
-from sklearn.model_selection import train_test_split
-from typing import Tuple, Any, Optional, List, Dict
+# --- Imports ---
+import os
+import weakref
 from pathlib import Path
-import re
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import spacy
-import pickle
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from compact_model import CompactNBModel
+from metrics import stage_timer
+from preprocessing import clean_text, clean_texts
+
+if TYPE_CHECKING:
+    from sklearn.pipeline import Pipeline
 
 # --- IMPORTANT: Ensure NO imports from utils.py here ---
 # Example of what NOT to have:
@@ -30,228 +28,119 @@ import pickle
 # --- Constants ---
 MODEL_DIR = Path("saved_models")
 MODEL_PATH = MODEL_DIR / "email_classifier_pipeline.pkl"
-MODEL_DIR.mkdir(parents=True, exist_ok=True)
-
-# --- FastAPI App ---
-app = FastAPI()
-
-# --- Pydantic Models for Request/Response ---
-class EmailInput(BaseModel):
-    email_body: str
 
-class MaskedEntity(BaseModel):
-    position: List[int]
-    classification: str
-    entity: str
-
-class ClassificationOutput(BaseModel):
-    input_email_body: str
-    list_of_masked_entities: List[MaskedEntity]
-    masked_email: str
-    category_of_the_email: str
-
-# --- Load Model at Startup ---
-# Load the model pipeline once when the application starts
-model_pipeline: Optional[Pipeline] = None
+# Score TF-IDF + MultinomialNB pipelines with CompactNBModel instead of Pipeline.predict (set to 0 to disable)
+NATIVE_SCORER_ENABLED = os.environ.get("NATIVE_SCORER", "1").strip().lower() not in ("0", "false", "no", "off")
 
 # --- Model Loading ---
-def load_model_pipeline() -> Optional[Pipeline]:
+def load_model_pipeline() -> Optional["Pipeline"]:
     """Loads the trained model pipeline."""
+    import joblib
+
     model_pipeline = None
     if MODEL_PATH.exists():
         try:
             model_pipeline = joblib.load(MODEL_PATH)
-            print(f"Model pipeline loaded successfully from {MODEL_PATH}")
+            logger.info(f"Model pipeline loaded successfully from {MODEL_PATH}")
         except Exception as e:
-            print(f"Error loading model pipeline from {MODEL_PATH}: {e}")
+            logger.error(f"Error loading model pipeline from {MODEL_PATH}: {e}")
     else:
-        print(f"Model pipeline not found at {MODEL_PATH}.")
-        print("Please train and save the model pipeline first.")
+        logger.error(f"Model pipeline not found at {MODEL_PATH}.")
+        logger.debug("Please train and save the model pipeline first.")
     return model_pipeline
 
 # --- Text Cleaning Function ---
 def clean_text_for_classification(text: str) -> str:
-    """Basic text cleaning."""
-    text = text.lower()
-    text = re.sub(r'<.*?>', '', text) # Remove HTML tags
-    text = re.sub(r'[^a-z\s]', '', text) # Remove non-alpha and non-whitespace
-    text = re.sub(r'\s+', ' ', text).strip() # Normalize whitespace
-    return text
+    """Basic text cleaning (shared with training, see preprocessing.py)."""
+    return clean_text(text)
 
-# --- Mask PII Function ---
-def mask_pii(text: str, nlp_model: spacy.language.Language) -> Tuple[str, List[Dict[str, Any]]]:
-    """
-    Finds and masks PII entities in text using the provided spaCy model.
-
-    Args:
-        text: The input email body.
-        nlp_model: The loaded spaCy language model.
+# --- Native Scorer ---
+# One scorer per fitted pipeline object; dropped with the pipeline when the model is replaced
+_native_scorers: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
 
-    Returns:
-        A tuple containing:
-            - The email body with PII entities replaced by placeholders (e.g., "[full_name]").
-            - A list of dictionaries, where each dictionary describes a masked entity
-              (e.g., {"position": [start, end], "classification": "entity_type", "entity": "original_text"}).
+def _scorer_for(pipeline):
+    """
+    Returns the native scorer for a fitted Pipeline (built on first use), or
+    the pipeline itself when the scorer is disabled or cannot represent it.
     """
-    print(f"Executing mask_pii for text: '{text[:50]}...'") # Add log
-    masked_text = text
-    entities = []
-    doc = nlp_model(text)
-    for ent in doc.ents:
-        if ent.label_ in ["PERSON", "EMAIL"]:
-            entity_info = {
-                "position": [ent.start_char, ent.end_char],
-                "classification": ent.label_.lower(),
-                "entity": ent.text
-            }
-            entities.append(entity_info)
-            masked_text = masked_text.replace(ent.text, f"[{ent.label_.lower()}]")
-    print(f"mask_pii result - entities: {entities}") # Add log
-    return masked_text, entities
+    if not NATIVE_SCORER_ENABLED or isinstance(pipeline, CompactNBModel):
+        return pipeline
+    scorer = _native_scorers.get(pipeline)
+    if scorer is None:
+        try:
+            scorer = CompactNBModel.from_pipeline(pipeline)
+        except ValueError as e:
+            logger.info(f"Native scorer unavailable, using Pipeline.predict: {e}")
+            scorer = False  # Not the pipeline itself: the value would keep the weak key alive
+        _native_scorers[pipeline] = scorer
+    return scorer or pipeline
+
+def score_category(text: str, pipeline: "Pipeline", top_k: int = 3) -> Dict[str, Any]:
+    """
+    Predicts the category with per-class probabilities and the `top_k` most
+    likely classes: {"label", "probabilities", "top_k"} (see CompactNBModel.score).
+    Applies cleaning before prediction.
+    """
+    with stage_timer("clean_text"):
+        cleaned_text = clean_text_for_classification(text)
+    with stage_timer("predict"):
+        scorer = _scorer_for(pipeline)
+        if isinstance(scorer, CompactNBModel):
+            return scorer.score(cleaned_text, top_k)
+        probabilities = scorer.predict_proba([cleaned_text])[0]
+    ranked = sorted(zip(scorer.classes_, probabilities), key=lambda item: -item[1])
+    return {
+        "label": str(ranked[0][0]),
+        "probabilities": {str(label): float(p) for label, p in zip(scorer.classes_, probabilities)},
+        "top_k": [{"label": str(label), "probability": float(p)} for label, p in ranked[:max(1, top_k)]],
+    }
 
 # --- Prediction Function ---
-def predict_category(text: str, pipeline: Pipeline) -> str:
+def predict_category(text: str, pipeline: "Pipeline") -> str:
     """
     Predicts the category of the text using the loaded classification pipeline.
     Applies cleaning before prediction.
     """
-    print(f"Executing predict_category for text: '{text[:50]}...'")
+    logger.debug("Executing predict_category for text: '%s...'", text[:50])
     try:
         # Clean the text first using the function now in this file
-        cleaned_text = clean_text_for_classification(text)
-        print(f"Cleaned text for prediction: '{cleaned_text[:50]}...'")
+        with stage_timer("clean_text"):
+            cleaned_text = clean_text_for_classification(text)
+        logger.debug("Cleaned text for prediction: '%s...'", cleaned_text[:50])
 
         # Assuming the pipeline has a .predict() method
-        prediction = pipeline.predict([cleaned_text]) # Predict on cleaned text
-        category = str(prediction[0]) if prediction else "Prediction failed"
+        with stage_timer("predict"):
+            prediction = _scorer_for(pipeline).predict([cleaned_text]) # Predict on cleaned text
+        category = str(prediction[0]) if len(prediction) else "Prediction failed"
     except Exception as e:
-        print(f"Error during prediction: {e}")
+        logger.error(f"Error during prediction: {e}")
         category = "Prediction Error"
-    print(f"predict_category result: {category}")
+    logger.debug("predict_category result: %s", category)
     return category
 
-# --- Training Function ---
-def train_model(data_path: Path, model_save_path: Path):
-    """Loads data, trains the model pipeline, and saves it."""
-
-    if not data_path.exists():
-        print(f"Error: Dataset not found at {data_path}")
-        print("Please make sure the CSV file is uploaded to your Codespace.")
-        return
-
-    print(f"Loading dataset from {data_path}...")
-    try:
-        df = pd.read_csv(data_path)
-    except Exception as e:
-        print(f"Error loading CSV: {e}")
-        return
-
-    # --- Data Validation ---
-    email_body_column = 'body'       # Column name for email text in your CSV
-    category_column = 'category'     # Column name for the category label in your CSV
-
-    if email_body_column not in df.columns:
-        print(f"Error: Email body column '{email_body_column}' not found in the dataset.")
-        print(f"Available columns: {df.columns.tolist()}")
-        return
-    if category_column not in df.columns:
-        print(f"Error: Category column '{category_column}' not found in the dataset.")
-        print(f"Available columns: {df.columns.tolist()}")
-        return
-
-    # Handle potential missing values
-    df.dropna(subset=[email_body_column, category_column], inplace=True)
-    if df.empty:
-        print("Error: No valid data remaining after handling missing values.")
-        return
-
-    print("Applying text cleaning...")
-    # Ensure the cleaning function exists and works
-    try:
-        df['cleaned_text'] = df[email_body_column].astype(str).apply(clean_text_for_classification)
-    except Exception as e:
-        print(f"Error during text cleaning: {e}")
-        return
-
-    print("Splitting data...")
-    X = df['cleaned_text']
-    y = df[category_column]
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y # Use stratify for balanced splits
-    )
-
-    # --- Model Pipeline ---
-    pipeline = Pipeline([
-        ('tfidf', TfidfVectorizer(stop_words='english', max_df=0.95, min_df=2)),
-        ('clf', MultinomialNB()) # Using Naive Bayes as a starting point
-    ])
-
-    print("Training model...")
-    try:
-        pipeline.fit(X_train, y_train)
-        print("Training complete.")
-    except Exception as e:
-        print(f"Error during model training: {e}")
-        return
-
-    # --- Evaluation ---
-    try:
-        accuracy = pipeline.score(X_test, y_test)
-        print(f"Model Accuracy on Test Set: {accuracy:.4f}")
-    except Exception as e:
-        print(f"Error during model evaluation: {e}")
-
-
-    # --- Save Model ---
-    print(f"Saving model pipeline to {model_save_path}...")
-    model_save_path.parent.mkdir(parents=True, exist_ok=True) # Ensure directory exists
+def predict_categories(texts: List[str], pipeline: "Pipeline") -> List[str]:
+    """
+    Predicts categories for many texts with a single pipeline.predict call.
+    Falls back to per-text prediction if the batched call fails, so one bad
+    text does not fail the others.
+    """
+    logger.debug("Executing predict_categories for %d texts", len(texts))
+    if not texts:
+        return []
     try:
-        joblib.dump(pipeline, model_save_path)
-        print("Model pipeline saved successfully.")
+        with stage_timer("clean_text_batch"):
+            cleaned_texts = clean_texts(texts)
+        with stage_timer("predict_batch"):
+            predictions = _scorer_for(pipeline).predict(cleaned_texts)
+        categories = [str(prediction) for prediction in predictions]
     except Exception as e:
-        print(f"Error saving model pipeline: {e}")
-
-# --- API Endpoints ---
-@app.get("/")
-def read_root():
-    return {"message": "Email Classification API is running. Use the /classify/ endpoint."}
-
-@app.post("/classify/", response_model=ClassificationOutput)
-async def classify_email(email_input: EmailInput):
-    if model_pipeline is None:
-        raise HTTPException(status_code=503, detail="Model not loaded. API is not ready.")
+        logger.error(f"Error during batch prediction, predicting one by one: {e}")
+        categories = [predict_category(text, pipeline) for text in texts]
+    return categories
 
-    input_email = email_input.email_body
-
-    # 1. Mask PII
-    masked_text, masked_entities_list = mask_pii(input_email)
-
-    # Convert masked_entities_list to list of MaskedEntity objects if needed
-    # (Depends on how mask_pii returns it, ensure structure matches Pydantic model)
-    formatted_entities = [MaskedEntity(**entity) for entity in masked_entities_list]
-
-    # 2. Predict Category using the masked text
-    predicted_category = predict_category(masked_text, model_pipeline)
-
-    # 3. Construct and return the response
-    response = ClassificationOutput(
-        input_email_body=input_email,
-        list_of_masked_entities=formatted_entities,
-        masked_email=masked_text,
-        category_of_the_email=predicted_category
-    )
-    return response
-
-# Example Usage (if you run this file directly for testing/training)
+# Example Usage (if you run this file directly for testing; train with train.py)
 if __name__ == "__main__":
     print("Running models.py directly...")
-    dummy_emails = [
-        "Subject: Billing Issue My account [full_name] was charged twice for order [order_id]. Please refund.",
-        "Subject: Help needed Cannot login. My email is [email]. Reset password link broken.",
-        "Subject: Account Management Request to close my account [account_num]. User [full_name]."
-        ]
-    dummy_labels = ["Billing Issues", "Technical Support", "Account Management"]
-
     print("Attempting to load model and predict...")
     model_pipeline = load_model_pipeline()
     if model_pipeline:
@@ -262,4 +151,4 @@ if __name__ == "__main__":
     else:
         print("Cannot perform prediction as model pipeline failed to load.")
 
-print("models.py finished importing.") # Add print statement
\ No newline at end of file
+logger.debug("models.py finished importing.")
\ No newline at end of file
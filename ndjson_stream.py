@@ -0,0 +1,124 @@
+import logging
+logger = logging.getLogger(__name__)
+
+logger.debug("Importing ndjson_stream.py...")
+
+# --- Imports ---
+import asyncio
+import json
+import os
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, Tuple
+
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+# --- Configuration ---
+# POST /classify_email/stream reads newline-delimited JSON records from the
+# request body as it arrives and streams one NDJSON result line per record back.
+# Memory stays bounded by the two limits below, whatever the upload size.
+#   NDJSON_STREAM_WINDOW:     records being processed (or finished but not yet sent)
+#                             at once per stream (default: 8)
+#   NDJSON_MAX_RECORD_BYTES:  longest accepted record line; longer ones get an
+#                             inline error and are skipped (default: 1 MiB)
+NDJSON_STREAM_WINDOW = max(1, int(os.environ.get("NDJSON_STREAM_WINDOW", 8)))
+NDJSON_MAX_RECORD_BYTES = int(os.environ.get("NDJSON_MAX_RECORD_BYTES", 1 << 20))
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# --- Request Body ---
+async def iter_ndjson_lines(
+    chunks: AsyncIterator[bytes], max_record_bytes: int = NDJSON_MAX_RECORD_BYTES
+) -> AsyncIterator[Tuple[Optional[bytes], Optional[str]]]:
+    """
+    Splits a byte stream into lines, yielding (line, None) per non-blank line
+    or (None, error) for a line longer than `max_record_bytes`. At most one
+    partial line (up to the limit) is buffered.
+    """
+    buffer = bytearray()
+    skipping = False  # Inside an oversized line: drop bytes until its newline
+    async for chunk in chunks:
+        start = 0
+        while True:
+            newline = chunk.find(b"\n", start)
+            piece = chunk[start:] if newline == -1 else chunk[start:newline]
+            if not skipping:
+                if len(buffer) + len(piece) > max_record_bytes:
+                    skipping = True
+                    buffer.clear()
+                    yield None, f"Record exceeds NDJSON_MAX_RECORD_BYTES ({max_record_bytes} bytes)"
+                else:
+                    buffer += piece
+            if newline == -1:
+                break
+            if not skipping and buffer.strip():
+                yield bytes(buffer), None
+            buffer.clear()
+            skipping = False
+            start = newline + 1
+    if not skipping and buffer.strip():
+        yield bytes(buffer), None
+
+# --- Ordered Processing ---
+async def stream_in_order(
+    items: AsyncIterator[Any], handle: Callable[[int, Any], Awaitable[dict]], window: int = NDJSON_STREAM_WINDOW
+) -> AsyncIterator[bytes]:
+    """
+    Runs `handle(index, item)` for each item, up to `window` at a time, and
+    yields the results as NDJSON lines in input order. Reading runs in its own
+    task, so a finished result is sent right away even while the next input
+    bytes are still in flight.
+    """
+    # Holds started tasks in input order; its bound is the backpressure on reading
+    started: asyncio.Queue = asyncio.Queue(maxsize=window)
+    read_error: list = []
+
+    async def read() -> None:
+        index = 0
+        try:
+            async for item in items:
+                task = asyncio.ensure_future(handle(index, item))
+                try:
+                    await started.put(task)
+                except BaseException:
+                    task.cancel()
+                    raise
+                index += 1
+        except ClientDisconnect:
+            logger.debug("NDJSON stream: client disconnected while uploading")
+        except Exception as e:
+            logger.error(f"NDJSON stream: error reading the request body: {e}")
+            read_error.append(e)
+        finally:
+            await started.put(None)
+
+    reader = asyncio.ensure_future(read())
+    try:
+        while (task := await started.get()) is not None:
+            yield (json.dumps(await task) + "\n").encode()
+        if read_error:
+            yield (json.dumps({"error": f"Error reading the request body: {read_error[0]}"}) + "\n").encode()
+    finally:
+        reader.cancel()
+        while not started.empty():
+            task = started.get_nowait()
+            if task is not None:
+                task.cancel()
+
+# --- Response ---
+class NDJSONStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse for endpoints that keep reading the request body while
+    the response streams. Under ASGI < 2.4 Starlette would also run a
+    disconnect listener calling receive() concurrently, which would swallow
+    body chunks; here the body reader itself sees the disconnect instead.
+    """
+    media_type = NDJSON_MEDIA_TYPE
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
@@ -0,0 +1,43 @@
+"""
+Text preprocessing shared by training (train.py) and serving (models.py), so
+the classifier always sees text cleaned the same way.
+
+The cleaning rules are: lower-case, drop HTML-like tags, keep only ASCII
+letters and whitespace, collapse whitespace runs to one space and trim.
+"""
+import re
+from typing import Iterable, List
+
+# --- Patterns ---
+_TAG_RE = re.compile(r'<.*?>')  # HTML tags (non-greedy, does not cross newlines)
+
+class _KeepLettersAndSpace(dict):
+    """
+    str.translate table: keeps a-z and whitespace (the same characters as
+    re's \\s), deletes everything else. Entries are filled in on first sight
+    of each code point, so the table only ever holds characters actually seen.
+    """
+    def __missing__(self, codepoint: int):
+        char = chr(codepoint)
+        value = codepoint if ('a' <= char <= 'z' or char.isspace()) else None
+        self[codepoint] = value
+        return value
+
+_TRANSLATE_TABLE = _KeepLettersAndSpace()
+
+# --- Cleaning ---
+def clean_text(text: str) -> str:
+    """Cleans one text for classification."""
+    text = text.lower()
+    if '<' in text:
+        text = _TAG_RE.sub('', text)  # Remove HTML tags
+    # Remove non-alpha and non-whitespace, then normalize whitespace
+    return ' '.join(text.translate(_TRANSLATE_TABLE).split())
+
+def clean_texts(texts: Iterable[str]) -> List[str]:
+    """Cleans many texts (e.g. a batch before a single pipeline.predict call)."""
+    return [clean_text(text) for text in texts]
+
+def clean_series(series):
+    """Cleans a pandas Series of texts; non-string values are converted with str() first."""
+    return series.astype(str).map(clean_text)
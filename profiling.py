@@ -0,0 +1,208 @@
+import logging
+logger = logging.getLogger(__name__)
+
+logger.debug("Importing profiling.py...")
+
+# --- Imports ---
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metrics import counter
+
+# --- Configuration ---
+# On-demand profiling of single /classify_email/ calls: an admin asks for it
+# (X-Profile: 1 or ?profile=1, with X-Admin-Token), or PROFILE_SAMPLE_RATE
+# picks a fraction of live traffic. A sampler thread records the call stack of
+# the thread running the inference call every PROFILE_INTERVAL_MS (wall clock),
+# and the profile is written to PROFILE_DIR. Nothing runs for unprofiled calls.
+#   PROFILE_DIR:         where profiles are written (default: profiles)
+#   PROFILE_SAMPLE_RATE: fraction of /classify_email/ calls profiled, 0-1 (default: 0)
+#   PROFILE_INTERVAL_MS: target time between stack samples (default: 2)
+#   PROFILE_FORMAT:      "speedscope" (JSON for https://www.speedscope.app) or
+#                        "collapsed" (one "root;...;leaf count" line per stack, for
+#                        flamegraph.pl / inferno) (default: speedscope)
+#   PROFILE_MAX_FILES:   newest profiles kept; older ones are deleted (default: 200)
+PROFILE_FORMATS = {"speedscope": ".speedscope.json", "collapsed": ".collapsed"}
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", "profiles"))
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", 2))
+PROFILE_FORMAT = os.environ.get("PROFILE_FORMAT", "speedscope").strip().lower()
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", 200))
+
+PROFILE_TRIGGERS = ("requested", "sampled")
+_PROFILE_NAME_RE = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9]{3}-[a-z]+-[0-9a-f]{8}(\.speedscope\.json|\.collapsed)$")
+
+# Frames of these functions are labelled with the value of one of their locals,
+# e.g. "scan_regex_pii[email]", so time is attributed to the pattern being scanned
+ANNOTATED_LOCALS = {"scan_regex_pii": "entity_type"}
+
+PROFILES_CAPTURED = counter("profiles_captured_total", "Request profiles written to PROFILE_DIR, by trigger.",
+                            labelnames=("trigger",))
+
+def should_sample(rate: float = PROFILE_SAMPLE_RATE) -> bool:
+    """True for a `rate` fraction of calls; a single comparison when sampling is off."""
+    return rate > 0 and random.random() < rate
+
+# --- Sampler ---
+Frame = Tuple[str, str, int]  # (name, file, first line)
+
+def _frame_key(frame) -> Frame:
+    code = frame.f_code
+    name = code.co_name
+    local_name = ANNOTATED_LOCALS.get(name)
+    if local_name is not None:
+        value = frame.f_locals.get(local_name)
+        if isinstance(value, str):
+            name = f"{name}[{value}]"
+    return name, code.co_filename, code.co_firstlineno
+
+class StackSampler:
+    """Samples the Python stack of one thread from a background thread until stopped."""
+
+    def __init__(self, thread_id: int, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval_s = max(0.0001, interval_ms / 1000)
+        self.samples: List[Tuple[Tuple[Frame, ...], float]] = []  # (stack root first, weight in ms)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self.started = self.stopped = 0.0
+
+    def __enter__(self) -> "StackSampler":
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.stopped = time.perf_counter()
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                stack.append(_frame_key(frame))
+                frame = frame.f_back
+            # The weight is the time since the previous sample: a sample can be
+            # late (e.g. while C code holds the GIL) and then stands for longer
+            self.samples.append((tuple(reversed(stack)), (now - last) * 1000))
+            last = now
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.stopped - self.started) * 1000
+
+# --- Output Formats ---
+def to_collapsed(samples: List[Tuple[Tuple[Frame, ...], float]]) -> str:
+    """Collapsed stacks weighted in microseconds: "root;...;leaf 1234" per distinct stack."""
+    totals: Dict[str, float] = {}
+    for stack, weight_ms in samples:
+        line = ";".join(f"{name} ({os.path.basename(file)}:{line})".replace(";", ",") for name, file, line in stack)
+        totals[line] = totals.get(line, 0.0) + weight_ms
+    return "".join(f"{line} {max(1, round(ms * 1000))}\n" for line, ms in sorted(totals.items()))
+
+def to_speedscope(samples: List[Tuple[Tuple[Frame, ...], float]], name: str, duration_ms: float) -> dict:
+    """A speedscope "sampled" profile (https://www.speedscope.app/file-format-schema.json) in milliseconds."""
+    frames: List[dict] = []
+    index: Dict[Frame, int] = {}
+    sample_indices, weights = [], []
+    for stack, weight_ms in samples:
+        row = []
+        for frame in stack:
+            if frame not in index:
+                index[frame] = len(frames)
+                frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+            row.append(index[frame])
+        sample_indices.append(row)
+        weights.append(round(weight_ms, 3))
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled", "name": name, "unit": "milliseconds",
+            "startValue": 0, "endValue": round(max(duration_ms, sum(weights)), 3),
+            "samples": sample_indices, "weights": weights,
+        }],
+        "name": name,
+        "exporter": "email-classifier profiling.py",
+    }
+
+# --- Capture ---
+def new_profile_name(trigger: str, profile_format: str = PROFILE_FORMAT) -> str:
+    if profile_format not in PROFILE_FORMATS:
+        raise ValueError(f"Unknown PROFILE_FORMAT '{profile_format}'. Expected one of: {', '.join(PROFILE_FORMATS)}")
+    now = time.time()
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"-{int(now % 1 * 1000):03d}"
+    return f"{stamp}-{trigger}-{uuid.uuid4().hex[:8]}{PROFILE_FORMATS[profile_format]}"
+
+def write_profile(sampler: StackSampler, name: str, directory: Path = PROFILE_DIR,
+                  max_files: int = PROFILE_MAX_FILES) -> Path:
+    """Writes the sampler's profile as `name` (renamed into place complete) and prunes old profiles."""
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / name
+    if name.endswith(PROFILE_FORMATS["collapsed"]):
+        content = to_collapsed(sampler.samples)
+    else:
+        content = json.dumps(to_speedscope(sampler.samples, name, sampler.duration_ms))
+    tmp_path = directory / f".{name}.tmp"
+    tmp_path.write_text(content)
+    os.replace(tmp_path, path)
+    if max_files > 0:
+        for old in list_profiles(directory)[max_files:]:
+            (directory / old["name"]).unlink(missing_ok=True)
+    return path
+
+def run_profiled(func: Callable[..., Any], args: tuple, kwargs: dict, trigger: str) -> Tuple[Any, Optional[str]]:
+    """
+    Runs `func(*args, **kwargs)` on the calling thread while sampling its stack,
+    writes the profile and returns (result, profile name). A failure to write
+    the profile is logged, never raised. Top-level, so process workers can run it.
+    """
+    name = new_profile_name(trigger)
+    with StackSampler(threading.get_ident()) as sampler:
+        result = func(*args, **kwargs)
+    try:
+        write_profile(sampler, name)
+    except OSError as e:
+        logger.error(f"Could not write profile {name} to {PROFILE_DIR}: {e}")
+        return result, None
+    PROFILES_CAPTURED.inc(trigger=trigger)
+    logger.info(f"Profile {name}: {len(sampler.samples)} samples over {sampler.duration_ms:.1f} ms.")
+    return result, name
+
+# --- Index ---
+def list_profiles(directory: Path = PROFILE_DIR) -> List[Dict[str, Any]]:
+    """Profiles in `directory`, newest first."""
+    if not directory.is_dir():
+        return []
+    profiles = []
+    for entry in directory.iterdir():
+        if _PROFILE_NAME_RE.match(entry.name):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue  # Pruned meanwhile
+            profiles.append({"name": entry.name, "bytes": stat.st_size, "created": stat.st_mtime,
+                             "trigger": entry.name.split("-")[3]})
+    return sorted(profiles, key=lambda profile: (profile["created"], profile["name"]), reverse=True)
+
+def profile_path(name: str, directory: Path = PROFILE_DIR) -> Path:
+    """Path of a listed profile; raises ValueError for a name that is not a profile file name."""
+    if not _PROFILE_NAME_RE.match(name):
+        raise ValueError(f"Invalid profile name {name!r}")
+    return directory / name
+
+logger.debug("profiling.py finished importing.")
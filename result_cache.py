@@ -0,0 +1,222 @@
+import logging
+logger = logging.getLogger(__name__)
+
+logger.debug("Importing result_cache.py...")
+
+# --- Imports ---
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# --- Configuration ---
+# The cache is opt-in. Keys are a hash of the email body plus a version string
+# (model artifact + regex patterns + spaCy profile), so any change to those makes
+# old entries unreachable: they are misses, and the LRU and TTL expire them.
+# Nothing is deleted on a version change, since API workers sharing
+# RESULT_CACHE_DB (or a reload back to an earlier model) may still use them.
+#   RESULT_CACHE_ENABLED:      "1"/"true" to enable (default: disabled)
+#   RESULT_CACHE_MAX_ENTRIES:  size of the in-memory LRU tier (default: 10000)
+#   RESULT_CACHE_TTL_SECONDS:  time-to-live for both tiers (default: 3600)
+#   RESULT_CACHE_DB:           optional SQLite file for an on-disk tier that survives restarts
+#   RESULT_CACHE_DB_MAX_ROWS:  rows kept in the on-disk tier; every RESULT_CACHE_DB_PRUNE_EVERY
+#                              stores, expired rows are deleted and then the rows expiring
+#                              soonest beyond this cap; 0 = no cap (default: 100000)
+#   RESULT_CACHE_DB_PRUNE_EVERY: stores between two prunes of the on-disk tier (default: 1000)
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "0").strip().lower() in ("1", "true", "yes")
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", 10000))
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get("RESULT_CACHE_TTL_SECONDS", 3600))
+RESULT_CACHE_DB = os.environ.get("RESULT_CACHE_DB") or None
+RESULT_CACHE_DB_MAX_ROWS = int(os.environ.get("RESULT_CACHE_DB_MAX_ROWS", 100000))
+RESULT_CACHE_DB_PRUNE_EVERY = max(1, int(os.environ.get("RESULT_CACHE_DB_PRUNE_EVERY", 1000)))
+
+def content_hash(text: str) -> str:
+    """SHA-256 of the UTF-8 encoded text."""
+    return hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()
+
+# --- Cache ---
+class ResultCache:
+    """
+    Two-tier cache of processing results: a bounded in-memory LRU with TTL and an
+    optional SQLite tier, pruned to `db_max_rows` every `db_prune_every` stores.
+    Values are stored as JSON strings so every hit returns a fresh copy. Thread-safe.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, db_path: Optional[str] = None,
+                 db_max_rows: int = RESULT_CACHE_DB_MAX_ROWS, db_prune_every: int = RESULT_CACHE_DB_PRUNE_EVERY):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.db_max_rows = max(0, db_max_rows)
+        self.db_prune_every = max(1, db_prune_every)
+        self._stores_since_prune = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, json_value)
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._db: Optional[sqlite3.Connection] = None
+        self.stats = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,      # Dropped because the LRU (memory) or RESULT_CACHE_DB_MAX_ROWS (disk) was full
+            "expirations": 0,    # Dropped because the TTL passed (memory on lookup, disk when pruned)
+            "invalidations": 0,  # Version changes seen (model or patterns changed)
+        }
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path: str) -> None:
+        try:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, version TEXT NOT NULL, expires_at REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_expires_at ON results (expires_at)")
+            self._prune_db()
+            logger.info(f"Result cache disk tier opened at {db_path}.")
+        except sqlite3.Error as e:
+            logger.error(f"Could not open result cache database at {db_path}, using memory only: {e}")
+            self._db = None
+
+    @staticmethod
+    def make_key(email_body: str, version: str, variant: str = "") -> str:
+        """Cache key for an email body under a given model/pattern version."""
+        return f"{version}:{variant}:{content_hash(email_body)}"
+
+    def _check_version(self, version: str) -> None:
+        """
+        Notes a version change. Entries of other versions are left to expire;
+        only expired disk rows are deleted. Caller holds the lock.
+        """
+        if version == self._version:
+            return
+        if self._version is not None:
+            self.stats["invalidations"] += 1
+            logger.info("Result cache version changed: model or patterns changed, earlier entries no longer match.")
+        self._version = version
+        if self._db is not None:
+            self._prune_db()
+
+    def get(self, key: str, version: str) -> Optional[Dict]:
+        """Returns a copy of the cached value, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] >= now:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return json.loads(entry[1])
+                del self._entries[key]
+                self.stats["expirations"] += 1
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT expires_at, value FROM results WHERE key = ?", (key,)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logger.error(f"Result cache disk read failed: {e}")
+                    row = None
+                if row is not None and row[0] >= now:
+                    self._store_in_memory(key, row[0], row[1])
+                    self.stats["hits"] += 1
+                    self.stats["disk_hits"] += 1
+                    return json.loads(row[1])
+
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, key: str, version: str, value: Dict) -> None:
+        """Stores a value in both tiers."""
+        expires_at = time.time() + self.ttl_seconds
+        serialized = json.dumps(value)
+        with self._lock:
+            self._check_version(version)
+            self._store_in_memory(key, expires_at, serialized)
+            self.stats["stores"] += 1
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO results (key, version, expires_at, value) VALUES (?, ?, ?, ?)",
+                        (key, version, expires_at, serialized),
+                    )
+                except sqlite3.Error as e:
+                    logger.error(f"Result cache disk write failed: {e}")
+                self._stores_since_prune += 1
+                if self._stores_since_prune >= self.db_prune_every:
+                    self._prune_db()
+
+    def _prune_db(self) -> None:
+        """
+        Deletes expired disk rows, then the rows expiring soonest beyond
+        db_max_rows. Caller holds the lock (or is the constructor).
+        """
+        self._stores_since_prune = 0
+        try:
+            expired = self._db.execute("DELETE FROM results WHERE expires_at < ?", (time.time(),)).rowcount
+            self.stats["expirations"] += max(0, expired)
+            if self.db_max_rows:
+                excess = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0] - self.db_max_rows
+                if excess > 0:
+                    evicted = self._db.execute(
+                        "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY expires_at LIMIT ?)",
+                        (excess,),
+                    ).rowcount
+                    self.stats["evictions"] += max(0, evicted)
+        except sqlite3.Error as e:
+            logger.error(f"Result cache disk prune failed: {e}")
+
+    def _store_in_memory(self, key: str, expires_at: float, serialized: str) -> None:
+        """Caller holds the lock."""
+        self._entries[key] = (expires_at, serialized)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                try:
+                    self._db.execute("DELETE FROM results")
+                except sqlite3.Error as e:
+                    logger.error(f"Result cache disk clear failed: {e}")
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+            return stats
+
+# --- Shared Instance ---
+_RESULT_CACHE: Optional[ResultCache] = None
+_RESULT_CACHE_LOCK = threading.Lock()
+
+def get_result_cache() -> Optional[ResultCache]:
+    """Returns the process-wide cache, or None when RESULT_CACHE_ENABLED is off."""
+    global _RESULT_CACHE
+    if not RESULT_CACHE_ENABLED:
+        return None
+    if _RESULT_CACHE is None:
+        with _RESULT_CACHE_LOCK:
+            if _RESULT_CACHE is None:
+                _RESULT_CACHE = ResultCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_SECONDS, RESULT_CACHE_DB)
+                logger.info(f"Result cache enabled (max {RESULT_CACHE_MAX_ENTRIES} entries, TTL {RESULT_CACHE_TTL_SECONDS}s).")
+    return _RESULT_CACHE
+
+def get_result_cache_stats() -> Dict[str, int]:
+    """Counters of the shared cache (empty when disabled)."""
+    cache = get_result_cache()
+    return cache.get_stats() if cache is not None else {}
+
+logger.debug("result_cache.py finished importing.")
@@ -0,0 +1,332 @@
+"""
+Production launcher: loads the models once, then forks the API workers.
+
+The master process imports the API, loads and warms up the spaCy model and the
+classifier, moves every object it created into the permanent GC generation
+(gc.freeze) and only then forks SERVE_WORKERS uvicorn workers on one shared
+listening socket. The workers inherit the warmed models copy-on-write, so the
+model memory is paid once per node instead of once per worker.
+
+The master supervises the workers:
+  - a worker that exits is replaced (with a backoff when workers keep crashing)
+  - SIGHUP: graceful restart. The master reloads the classifier if the model
+    registry's CURRENT changed, then replaces the workers one at a time, each
+    old worker finishing its in-flight requests after its replacement is up
+  - SIGUSR1: logs per-worker RSS / PSS / private memory (also every
+    SERVE_MEMORY_LOG_INTERVAL_S)
+  - SIGTERM / SIGINT: graceful shutdown (workers get SERVE_GRACEFUL_TIMEOUT_S)
+The master also polls the registry every MODEL_WATCH_INTERVAL_S and restarts
+the workers on the new version, so models stay shared after a hot reload.
+
+    python serve.py --workers 4 --port 8000
+
+Needs os.fork (Linux / macOS); elsewhere use `uvicorn api:app`.
+"""
+import argparse
+import gc
+import logging
+import os
+import select
+import signal
+import socket
+import sys
+import time
+from typing import Dict, List, Set
+
+logger = logging.getLogger("serve")
+
+# --- Configuration ---
+#   SERVE_HOST / PORT:              listen address (default: 0.0.0.0:8000, PORT as in app.py)
+#   SERVE_WORKERS:                  forked worker processes (default: 1). Not derived from
+#                                   os.cpu_count(): in a container that is the host's core
+#                                   count, and each worker adds its own private memory
+#   SERVE_GRACEFUL_TIMEOUT_S:       how long a stopping worker may finish in-flight requests
+#                                   before it is killed (default: 30)
+#   SERVE_WORKER_BOOT_TIMEOUT_S:    how long a graceful restart waits for a new worker to
+#                                   accept connections before stopping the old one (default: 60)
+#   SERVE_MEMORY_LOG_INTERVAL_S:    log per-worker memory this often, 0 = only on SIGUSR1 (default: 0)
+SERVE_HOST = os.environ.get("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.environ.get("PORT", 8000))
+SERVE_WORKERS = int(os.environ.get("SERVE_WORKERS", 1))
+SERVE_GRACEFUL_TIMEOUT_S = float(os.environ.get("SERVE_GRACEFUL_TIMEOUT_S", 30))
+SERVE_WORKER_BOOT_TIMEOUT_S = float(os.environ.get("SERVE_WORKER_BOOT_TIMEOUT_S", 60))
+SERVE_MEMORY_LOG_INTERVAL_S = float(os.environ.get("SERVE_MEMORY_LOG_INTERVAL_S", 0))
+
+SUPERVISE_TICK_S = 0.5
+CRASH_WINDOW_S = 10.0     # A worker exiting sooner than this after starting counts as a crash
+MAX_RESPAWN_DELAY_S = 30.0
+
+# --- Memory Reporting ---
+SMAPS_FIELDS = {"Rss:": "rss_mb", "Pss:": "pss_mb", "Shared_Clean:": "shared_clean_mb",
+                "Shared_Dirty:": "shared_dirty_mb", "Private_Clean:": "private_clean_mb",
+                "Private_Dirty:": "private_dirty_mb"}
+
+def process_memory(pid: int) -> Dict[str, float]:
+    """RSS, PSS and shared/private memory of `pid` in MB from /proc/<pid>/smaps_rollup ({} if unavailable)."""
+    values: Dict[str, float] = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key = line.split(None, 1)[0]
+                if key in SMAPS_FIELDS:
+                    values[SMAPS_FIELDS[key]] = round(int(line.split()[1]) / 1024, 1)
+    except (OSError, IndexError, ValueError):
+        return {}
+    return values
+
+def memory_report(master_pid: int, worker_pids: List[int]) -> List[Dict]:
+    """One row per process (master first) plus a "total" row; PSS sums to the real shared footprint."""
+    rows = [dict(role="master", pid=master_pid, **process_memory(master_pid))]
+    rows += [dict(role="worker", pid=pid, **process_memory(pid)) for pid in worker_pids]
+    total: Dict = {"role": "total", "pid": None}
+    for key in SMAPS_FIELDS.values():
+        if all(key in row for row in rows):
+            total[key] = round(sum(row[key] for row in rows), 1)
+    return rows + [total]
+
+def log_memory_report(rows: List[Dict], level: int = logging.INFO) -> None:
+    for row in rows:
+        logger.log(level, "memory %-6s pid=%-7s rss=%sMB pss=%sMB private_dirty=%sMB shared=%sMB",
+                   row["role"], row["pid"] or "-", row.get("rss_mb", "?"), row.get("pss_mb", "?"),
+                   row.get("private_dirty_mb", "?"),
+                   round(row.get("shared_clean_mb", 0) + row.get("shared_dirty_mb", 0), 1))
+
+# --- Master Setup ---
+def preload() -> None:
+    """Imports the API and loads + warms up both models in this (the master) process."""
+    # Read by api.py at import: the models belong to this master, which also watches the registry
+    os.environ["SERVE_PREFORKED"] = "1"
+    # Workers share the master's models from their threads; a process pool would load its own copies
+    os.environ.setdefault("INFERENCE_BACKEND", "thread")
+    started = time.perf_counter()
+    import uvicorn  # noqa: F401
+    import api  # noqa: F401  (everything a worker imports, imported once here)
+    from utils import warm_up
+
+    if not warm_up():
+        raise SystemExit("serve.py: model loading or the warm-up inference failed, see the log above.")
+    logger.info(f"Models loaded and warmed up in the master in {time.perf_counter() - started:.2f}s.")
+    freeze()
+
+def freeze() -> None:
+    """
+    Moves every object created so far into the permanent generation, so the
+    workers' garbage collector never writes to (and un-shares) the pages
+    holding the preloaded models.
+    """
+    gc.collect()
+    gc.freeze()
+    logger.info(f"gc.freeze(): {gc.get_freeze_count()} objects frozen.")
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+# --- Worker ---
+def run_worker(sock: socket.socket, ready_fd: int) -> None:
+    """Body of a forked worker: serves the preloaded app on the shared socket until told to stop."""
+    import uvicorn
+    import api
+
+    for sig in (signal.SIGHUP, signal.SIGUSR1, signal.SIGCHLD):
+        signal.signal(sig, signal.SIG_DFL)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        # uvicorn re-raises the stop signal after its graceful shutdown; ignore it so the worker exits 0
+        signal.signal(sig, signal.SIG_IGN)
+
+    class WorkerServer(uvicorn.Server):
+        async def startup(self, sockets=None) -> None:
+            await super().startup(sockets=sockets)
+            if self.started:
+                os.write(ready_fd, b"1")  # Tells the master this worker accepts connections
+
+    config = uvicorn.Config(api.app, log_config=None, timeout_graceful_shutdown=SERVE_GRACEFUL_TIMEOUT_S)
+    WorkerServer(config).run(sockets=[sock])
+
+# --- Supervisor ---
+class Master:
+    """Forks, supervises and restarts the workers of one preloaded app."""
+
+    def __init__(self, sock: socket.socket, workers: int):
+        self.sock = sock
+        self.target_workers = max(1, workers)
+        self.workers: Dict[int, Dict] = {}  # pid -> {"started": monotonic time, "ready_fd": read end of its pipe}
+        self.retiring: Set[int] = set()  # Workers told to stop by a graceful restart; not replaced when they exit
+        self.stopping = False
+        self.restart_requested = False
+        self.report_requested = False
+        self.crashes = 0
+        self.respawn_at = 0.0
+
+    # Signal handlers only set flags; the supervise loop does the work
+    def _on_stop(self, signum, frame) -> None:
+        self.stopping = True
+
+    def _on_hup(self, signum, frame) -> None:
+        self.restart_requested = True
+
+    def _on_usr1(self, signum, frame) -> None:
+        self.report_requested = True
+
+    def spawn(self) -> int:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                os.close(read_fd)
+                for worker in self.workers.values():
+                    os.close(worker["ready_fd"])
+                run_worker(self.sock, write_fd)
+            except BaseException:
+                logger.exception("Worker crashed.")
+                exit_code = 1
+            finally:
+                os._exit(exit_code)  # Never return into the master's loop (or run its atexit handlers)
+        os.close(write_fd)
+        self.workers[pid] = {"started": time.monotonic(), "ready_fd": read_fd}
+        logger.info(f"Worker {pid} started.")
+        return pid
+
+    def wait_ready(self, pid: int, timeout: float) -> bool:
+        """Waits until worker `pid` accepts connections (or exits, or `timeout` passes)."""
+        ready_fd = self.workers[pid]["ready_fd"]
+        readable, _, _ = select.select([ready_fd], [], [], timeout)
+        return bool(readable) and os.read(ready_fd, 1) == b"1"
+
+    def reap(self) -> None:
+        """Collects exited workers; one that dies soon after starting counts toward the respawn backoff."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            os.close(worker["ready_fd"])
+            code = os.waitstatus_to_exitcode(status)
+            if self.stopping or pid in self.retiring:
+                self.retiring.discard(pid)
+                logger.info(f"Worker {pid} stopped.")
+                continue
+            uptime = time.monotonic() - worker["started"]
+            if code != 0 or uptime < CRASH_WINDOW_S:
+                self.crashes += 1
+                delay = min(MAX_RESPAWN_DELAY_S, 0.5 * 2 ** (self.crashes - 1))
+                self.respawn_at = time.monotonic() + delay
+                logger.error(f"Worker {pid} exited with {code} after {uptime:.1f}s; respawning in {delay:.1f}s.")
+            else:
+                self.crashes = 0
+                logger.warning(f"Worker {pid} exited with {code}; respawning.")
+
+    def stop_worker(self, pid: int, sig: int = signal.SIGTERM) -> None:
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def reload_model(self) -> bool:
+        """Loads the registry's CURRENT version in the master if it changed. Returns True if it did."""
+        from utils import check_for_new_model
+
+        if check_for_new_model() is None:
+            return False
+        freeze()  # The new model's objects are shared with the next workers like the first ones
+        return True
+
+    def graceful_restart(self) -> None:
+        """Replaces the workers one by one, each old one stopping only once its replacement accepts connections."""
+        for old_pid in list(self.workers):
+            if self.stopping:
+                return
+            new_pid = self.spawn()
+            if not self.wait_ready(new_pid, SERVE_WORKER_BOOT_TIMEOUT_S):
+                logger.error(f"Worker {new_pid} did not start within {SERVE_WORKER_BOOT_TIMEOUT_S}s; "
+                             f"keeping worker {old_pid} and stopping the restart.")
+                self.stop_worker(new_pid, signal.SIGKILL)
+                return
+            self.retiring.add(old_pid)
+            self.stop_worker(old_pid)  # Finishes in-flight requests, then exits (reaped by the loop)
+        logger.info("Graceful restart complete.")
+
+    def shutdown(self) -> None:
+        logger.info(f"Stopping {len(self.workers)} worker(s)...")
+        for pid in self.workers:
+            self.stop_worker(pid)
+        deadline = time.monotonic() + SERVE_GRACEFUL_TIMEOUT_S + 5
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in self.workers:
+            logger.warning(f"Worker {pid} did not stop in time; killing it.")
+            self.stop_worker(pid, signal.SIGKILL)
+        while self.workers:
+            pid, _ = os.waitpid(-1, 0)
+            worker = self.workers.pop(pid, None)
+            if worker is not None:
+                os.close(worker["ready_fd"])
+
+    def run(self, watch_interval: float) -> None:
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_hup)
+        signal.signal(signal.SIGUSR1, self._on_usr1)
+        for _ in range(self.target_workers):
+            self.spawn()
+        next_watch = time.monotonic() + watch_interval
+        next_memory_log = time.monotonic() + SERVE_MEMORY_LOG_INTERVAL_S
+        while not self.stopping:
+            time.sleep(SUPERVISE_TICK_S)
+            self.reap()
+            now = time.monotonic()
+            while not self.stopping and len(self.workers) - len(self.retiring) < self.target_workers and now >= self.respawn_at:
+                self.spawn()
+            if self.restart_requested:
+                self.restart_requested = False
+                logger.info("SIGHUP: graceful restart.")
+                self.reload_model()
+                self.graceful_restart()
+            elif watch_interval > 0 and now >= next_watch:
+                next_watch = now + watch_interval
+                if self.reload_model():
+                    logger.info("New model version loaded; restarting the workers on it.")
+                    self.graceful_restart()
+            if self.report_requested:
+                self.report_requested = False
+                log_memory_report(memory_report(os.getpid(), list(self.workers)), logging.WARNING)
+            elif SERVE_MEMORY_LOG_INTERVAL_S > 0 and now >= next_memory_log:
+                next_memory_log = now + SERVE_MEMORY_LOG_INTERVAL_S
+                log_memory_report(memory_report(os.getpid(), list(self.workers)))
+        self.shutdown()
+
+# --- Command Line ---
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        raise SystemExit("serve.py needs os.fork; run `uvicorn api:app` on this platform.")
+    if os.environ.get("INFERENCE_BACKEND", "thread").strip().lower() == "process":
+        raise SystemExit("serve.py shares the master's models with its workers; use INFERENCE_BACKEND=thread or inline.")
+
+    preload()  # Also configures logging (api.py, LOG_LEVEL)
+    from model_registry import MODEL_WATCH_INTERVAL_S
+
+    sock = bind_socket(args.host, args.port)
+    logger.info(f"Listening on {args.host}:{args.port} with {args.workers} worker(s); master pid {os.getpid()}.")
+    Master(sock, args.workers).run(MODEL_WATCH_INTERVAL_S)
+    sock.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+# Parity of the native scorer (compact_model.CompactNBModel) with Pipeline.predict
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.pipeline import Pipeline
+
+from compact_model import CompactNBModel
+from preprocessing import clean_series
+
+TRAIN = [
+    ("I was charged twice for my subscription this month, please refund the payment.", "Billing"),
+    ("My invoice shows the wrong amount and the card was billed again.", "Billing"),
+    ("Can I get a refund for the duplicate charge on my credit card?", "Billing"),
+    ("The app crashes every time I open the settings page.", "Technical"),
+    ("I cannot log in, the password reset link returns an error.", "Technical"),
+    ("The website is down and the server keeps timing out.", "Technical"),
+    ("Please change the shipping address on my account.", "Account"),
+    ("How do I delete my account and remove my personal data?", "Account"),
+    ("I would like to update the email address on my profile.", "Account"),
+]
+UNSEEN = [
+    "Refund the charge on my card please!",
+    "The login page shows an error after the update.",
+    "Update my address and profile details.",
+    "completely unrelated words zebra quantum",
+    "",
+    "Café crème — naïve résumé 123 456",
+]
+
+def _fit(vectorizer) -> Pipeline:
+    texts, labels = zip(*TRAIN)
+    pipeline = Pipeline([("tfidf", vectorizer), ("clf", MultinomialNB())])
+    pipeline.fit(list(clean_series(pd.Series(texts))), list(labels))
+    return pipeline
+
+@pytest.mark.parametrize("vectorizer", [
+    TfidfVectorizer(),
+    TfidfVectorizer(stop_words="english", max_df=0.95, min_df=2),  # train.py's settings
+    TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True),
+    TfidfVectorizer(use_idf=False, norm=None, binary=True),
+], ids=["default", "train_py", "bigrams_sublinear", "binary_no_idf"])
+def test_native_predict_matches_pipeline(vectorizer):
+    pipeline = _fit(vectorizer)
+    scorer = CompactNBModel.from_pipeline(pipeline)
+    texts = list(clean_series(pd.Series([text for text, _ in TRAIN] + UNSEEN)))
+
+    assert list(scorer.predict(texts)) == list(pipeline.predict(texts))
+    np.testing.assert_allclose(scorer.predict_proba(texts), pipeline.predict_proba(texts), rtol=1e-9, atol=1e-12)
+
+def test_unsupported_pipeline_is_rejected():
+    pipeline = Pipeline([("hashing", HashingVectorizer(alternate_sign=False)), ("clf", MultinomialNB())])
+    texts, labels = zip(*TRAIN)
+    pipeline.fit(list(texts), list(labels))
+    with pytest.raises(ValueError):
+        CompactNBModel.from_pipeline(pipeline)
@@ -0,0 +1,45 @@
+# On-disk tier bounds of result_cache.ResultCache
+import sqlite3
+import time
+
+from result_cache import ResultCache
+
+def _disk_rows(path) -> int:
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+def test_disk_tier_is_capped_to_the_rows_expiring_last(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResultCache(max_entries=100, ttl_seconds=60, db_path=path, db_max_rows=5, db_prune_every=4)
+    keys = [ResultCache.make_key(f"email {i}", "v1") for i in range(12)]
+    for i, key in enumerate(keys):
+        cache.set(key, "v1", {"i": i})
+
+    # Pruned after stores 4, 8 and 12: down to the cap each time
+    assert _disk_rows(path) == 5
+    assert cache.get_stats()["evictions"] == 7
+
+    fresh = ResultCache(max_entries=100, ttl_seconds=60, db_path=path, db_max_rows=5)
+    assert fresh.get(keys[0], "v1") is None
+    assert fresh.get(keys[-1], "v1") == {"i": 11}
+
+def test_expired_disk_rows_are_pruned_while_running(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResultCache(max_entries=100, ttl_seconds=0.05, db_path=path, db_max_rows=0, db_prune_every=3)
+    cache.set(ResultCache.make_key("a", "v1"), "v1", {"i": 0})
+    cache.set(ResultCache.make_key("b", "v1"), "v1", {"i": 1})
+    time.sleep(0.1)
+    cache.set(ResultCache.make_key("c", "v1"), "v1", {"i": 2})  # Third store: prune
+
+    assert _disk_rows(path) == 1
+    assert cache.get_stats()["expirations"] == 2
+
+def test_other_version_entries_survive_a_version_change(tmp_path):
+    path = str(tmp_path / "cache.db")
+    old, new = ResultCache(10, 60, path), ResultCache(10, 60, path)
+    old_key, new_key = ResultCache.make_key("x", "v1"), ResultCache.make_key("x", "v2")
+    old.set(old_key, "v1", {"r": 1})
+    new.set(new_key, "v2", {"r": 2})
+
+    assert old.get(old_key, "v1") == {"r": 1}
+    assert new.get(new_key, "v2") == {"r": 2}
@@ -1,33 +1,41 @@
 # filepath: /workspaces/internship1/train.py
+import argparse
+import zlib
+import numpy as np
 import pandas as pd
 import joblib
 from sklearn.model_selection import train_test_split
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer, TfidfVectorizer
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.pipeline import Pipeline
 from pathlib import Path
+from typing import Iterator, Optional, Tuple
 
 # --- Local Imports ---
-# Ensure utils.py has the clean_text_for_classification function
-try:
-    from utils import clean_text_for_classification
-except ImportError:
-    print("Error: Could not import clean_text_for_classification from utils.")
-    print("Make sure utils.py exists and the function is defined.")
-    # Define a basic fallback if needed for testing, but fix the import
-    def clean_text_for_classification(text: str) -> str:
-        return text.lower().strip()
+# Same cleaning as serving (models.clean_text_for_classification), so there is no train/serve skew
+from preprocessing import clean_series
+from compact_model import CompactNBModel, export_compact_model
+from model_registry import MODEL_REGISTRY_DIR, publish_pipeline
 
 # --- Configuration ---
 # !! ADJUST THESE PATHS AND COLUMN NAMES !!
 DATASET_PATH = Path("combined_emails_with_natural_pii.csv")
 MODEL_DIR = Path("saved_models")
 MODEL_PATH = MODEL_DIR / "email_classifier_pipeline.pkl"
+COMPACT_MODEL_DIR = MODEL_DIR / "email_classifier_compact"  # Served with MODEL_FORMAT=compact
 email_body_column = 'email'      # <<< Ensure this is 'email'
 category_column = 'type'         # <<< Ensure this is 'type'
 
+# Streaming mode (train_model_streaming)
+STREAM_CHUNK_ROWS = 20000        # Rows read from the CSV at a time
+HASHING_N_FEATURES = 2 ** 18     # Hashed vocabulary size (NB keeps 2 float arrays of classes x features)
+HOLDOUT_PERCENT = 20             # Share of rows held out for evaluation
+
+# Native scorer parity check (check_native_scorer)
+NATIVE_CHECK_SAMPLE = 2000       # Test-set texts compared after training; 0 skips the check
+
 # --- Main Training Function ---
-def train_model(data_path: Path, model_save_path: Path):
+def train_model(data_path: Path, model_save_path: Path, native_check_sample: int = NATIVE_CHECK_SAMPLE):
     """Loads data, trains the model pipeline, and saves it."""
 
     if not data_path.exists():
@@ -39,7 +47,7 @@ def train_model(data_path: Path, model_save_path: Path):
     try:
         # Keep the on_bad_lines='skip' if it worked
         df = pd.read_csv(data_path, engine='python', on_bad_lines='skip')
-        print(f"Dataset loaded. Note: Bad lines may have been skipped.")
+        print("Dataset loaded. Note: Bad lines may have been skipped.")
     except Exception as e:
         print(f"Error loading CSV: {e}")
         return
@@ -63,7 +71,7 @@ def train_model(data_path: Path, model_save_path: Path):
     print("Applying text cleaning...")
     # Ensure the cleaning function exists and works
     try:
-        df['cleaned_text'] = df[email_body_column].astype(str).apply(clean_text_for_classification)
+        df['cleaned_text'] = clean_series(df[email_body_column])
     except Exception as e:
         print(f"Error during text cleaning: {e}")
         return
@@ -96,6 +104,11 @@ def train_model(data_path: Path, model_save_path: Path):
     except Exception as e:
         print(f"Error during model evaluation: {e}")
 
+    # Serving scores with the native scorer (models.predict_category); it must agree with
+    # Pipeline.predict. A sample of the test set keeps the check cheap on large datasets.
+    if native_check_sample > 0:
+        sample = X_test.sample(n=min(native_check_sample, len(X_test)), random_state=42)
+        check_native_scorer(pipeline, sample)
 
     # --- Save Model ---
     print(f"Saving model pipeline to {model_save_path}...")
@@ -105,10 +118,206 @@ def train_model(data_path: Path, model_save_path: Path):
         print("Model pipeline saved successfully.")
     except Exception as e:
         print(f"Error saving model pipeline: {e}")
+    return pipeline
+
+
+# --- Native Scorer Parity ---
+def check_native_scorer(pipeline, texts) -> bool:
+    """Compares CompactNBModel.from_pipeline labels with Pipeline.predict on `texts` (already cleaned)."""
+    try:
+        scorer = CompactNBModel.from_pipeline(pipeline)
+    except ValueError as e:
+        print(f"Native scorer not applicable, serving will use Pipeline.predict: {e}")
+        return True
+    texts = list(texts)
+    mismatches = int((scorer.predict(texts) != pipeline.predict(texts)).sum())
+    if mismatches:
+        print(f"Error: native scorer disagrees with Pipeline.predict on {mismatches}/{len(texts)} texts. "
+              "Serve with NATIVE_SCORER=0 until this is fixed.")
+        return False
+    print(f"Native scorer parity: identical labels on all {len(texts)} texts.")
+    return True
+
+# --- Compact Export ---
+def export_compact(pipeline, out_dir: Path) -> Optional[Path]:
+    """Writes the memory-mappable artifact served with MODEL_FORMAT=compact (see compact_model.py)."""
+    print(f"Exporting compact model to {out_dir}...")
+    try:
+        export_compact_model(pipeline, out_dir)
+        print("Compact model exported successfully.")
+        return out_dir
+    except ValueError as e:
+        print(f"Error: cannot export this pipeline in the compact format: {e}")
+    except OSError as e:
+        print(f"Error writing compact model: {e}")
+    return None
+
+# --- Model Registry ---
+def publish(pipeline, registry_dir: Path) -> Optional[str]:
+    """Publishes the pipeline as a new registry version and points CURRENT at it (see model_registry.py)."""
+    print(f"Publishing model to the registry in {registry_dir}...")
+    try:
+        version = publish_pipeline(pipeline, registry_dir)
+        print(f"Published version {version}; running APIs switch to it on their next MODEL_WATCH_INTERVAL_S poll.")
+        return version
+    except (OSError, ValueError) as e:
+        print(f"Error publishing model: {e}")
+    return None
+
+# --- Streaming Training ---
+def _is_holdout(text: str, holdout_percent: int) -> bool:
+    """Stable split by content hash: the same email always lands on the same side."""
+    return zlib.crc32(text.encode('utf-8')) % 100 < holdout_percent
+
+def _stream_chunks(data_path: Path, chunk_rows: int, holdout_percent: int) -> Iterator[Tuple[list, list, list, list]]:
+    """Yields (train_texts, train_labels, holdout_texts, holdout_labels) per CSV chunk, cleaned."""
+    reader = pd.read_csv(
+        data_path, engine='python', on_bad_lines='skip',
+        usecols=[email_body_column, category_column], chunksize=chunk_rows,
+    )
+    for chunk in reader:
+        chunk = chunk.dropna(subset=[email_body_column, category_column])
+        raw_texts = chunk[email_body_column].astype(str)
+        cleaned_texts = clean_series(raw_texts)
+        train_texts, train_labels, holdout_texts, holdout_labels = [], [], [], []
+        for raw, text, label in zip(raw_texts, cleaned_texts, chunk[category_column].astype(str)):
+            if _is_holdout(raw, holdout_percent):
+                holdout_texts.append(text)
+                holdout_labels.append(label)
+            else:
+                train_texts.append(text)
+                train_labels.append(label)
+        yield train_texts, train_labels, holdout_texts, holdout_labels
+
+def train_model_streaming(data_path: Path, model_save_path: Path, chunk_rows: int = STREAM_CHUNK_ROWS,
+                          n_features: int = HASHING_N_FEATURES, use_idf: bool = True,
+                          holdout_percent: int = HOLDOUT_PERCENT):
+    """
+    Trains out of core: memory is bounded by `chunk_rows`, not by the dataset size.
+
+    Pass 1 collects the class labels and, with `use_idf`, the document frequency
+    of every hashed feature. Pass 2 updates MultinomialNB with partial_fit chunk
+    by chunk. Pass 3 scores the held-out rows (picked by content hash). The saved
+    Pipeline (hashing -> optional TF-IDF -> NB) is served by load_model_pipeline
+    like the in-memory model.
+    """
+    if not data_path.exists():
+        print(f"Error: Dataset not found at {data_path}")
+        return
+    try:
+        columns = pd.read_csv(data_path, nrows=0).columns
+    except Exception as e:
+        print(f"Error loading CSV: {e}")
+        return
+    for column in (email_body_column, category_column):
+        if column not in columns:
+            print(f"Error: Column '{column}' not found in the dataset.")
+            print(f"Available columns: {columns.tolist()}")
+            return
+
+    # Stateless: nothing to fit, so every chunk is vectorised independently.
+    # alternate_sign=False keeps counts non-negative, which MultinomialNB requires.
+    hashing = HashingVectorizer(
+        n_features=n_features, stop_words='english', alternate_sign=False, norm=None if use_idf else 'l2'
+    )
+
+    print(f"Pass 1/3: scanning {data_path} for labels{' and document frequencies' if use_idf else ''}...")
+    classes = set()
+    doc_freq = np.zeros(n_features, dtype=np.int64)
+    n_train = n_holdout = 0
+    for train_texts, train_labels, holdout_texts, _ in _stream_chunks(data_path, chunk_rows, holdout_percent):
+        classes.update(train_labels)
+        n_train += len(train_texts)
+        n_holdout += len(holdout_texts)
+        if use_idf and train_texts:
+            counts = hashing.transform(train_texts)
+            doc_freq += np.bincount(counts.indices, minlength=n_features)
+    if n_train == 0:
+        print("Error: No valid training rows found.")
+        return
+    classes = np.array(sorted(classes))
+    print(f"Found {n_train} training rows, {n_holdout} held-out rows, {len(classes)} classes.")
+
+    tfidf = None
+    if use_idf:
+        # Same smoothed IDF as TfidfVectorizer: ln((1 + n) / (1 + df)) + 1
+        tfidf = TfidfTransformer()
+        tfidf.idf_ = np.log((1 + n_train) / (1 + doc_freq)) + 1
+        tfidf.n_features_in_ = n_features
+
+    def vectorize(texts):
+        counts = hashing.transform(texts)
+        return tfidf.transform(counts) if tfidf is not None else counts
+
+    print("Pass 2/3: training with partial_fit...")
+    clf = MultinomialNB()
+    for chunk_number, (train_texts, train_labels, _, _) in enumerate(
+        _stream_chunks(data_path, chunk_rows, holdout_percent), start=1
+    ):
+        if train_texts:
+            clf.partial_fit(vectorize(train_texts), train_labels, classes=classes)
+        print(f"  chunk {chunk_number} done")
+    print("Training complete.")
+
+    steps = [('hashing', hashing)] + ([('tfidf', tfidf)] if tfidf is not None else []) + [('clf', clf)]
+    pipeline = Pipeline(steps)
+
+    # --- Evaluation ---
+    if n_holdout:
+        print("Pass 3/3: evaluating on the held-out rows...")
+        correct = 0
+        for _, _, holdout_texts, holdout_labels in _stream_chunks(data_path, chunk_rows, holdout_percent):
+            if holdout_texts:
+                correct += int((pipeline.predict(holdout_texts) == np.array(holdout_labels)).sum())
+        print(f"Model Accuracy on Held-out Set: {correct / n_holdout:.4f}")
+
+    # --- Save Model ---
+    print(f"Saving model pipeline to {model_save_path}...")
+    model_save_path.parent.mkdir(parents=True, exist_ok=True) # Ensure directory exists
+    try:
+        joblib.dump(pipeline, model_save_path)
+        print("Model pipeline saved successfully.")
+    except Exception as e:
+        print(f"Error saving model pipeline: {e}")
+    return pipeline
 
 
 # --- Script Execution ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the email classifier.")
+    parser.add_argument("--data", type=Path, default=DATASET_PATH, help=f"Training CSV (default: {DATASET_PATH})")
+    parser.add_argument("--output", type=Path, default=MODEL_PATH, help=f"Where to save the pipeline (default: {MODEL_PATH})")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Out-of-core training (hashing vectorizer + partial_fit), for datasets larger than memory")
+    parser.add_argument("--chunk-rows", type=int, default=STREAM_CHUNK_ROWS, help="Streaming: rows per chunk")
+    parser.add_argument("--n-features", type=int, default=HASHING_N_FEATURES, help="Streaming: hashed feature space size")
+    parser.add_argument("--no-idf", action="store_true", help="Streaming: skip the IDF pass (l2-normalised term counts)")
+    parser.add_argument("--holdout-percent", type=int, default=HOLDOUT_PERCENT, help="Streaming: rows held out for evaluation")
+    parser.add_argument("--native-check-sample", type=int, default=NATIVE_CHECK_SAMPLE,
+                        help="Test-set texts on which the native scorer must match Pipeline.predict (0 skips the check)")
+    parser.add_argument("--export-compact", action="store_true",
+                        help="Also export the trained model as a memory-mappable artifact (MODEL_FORMAT=compact)")
+    parser.add_argument("--export-only", action="store_true",
+                        help="Don't train; export the pipeline saved at --output as a compact artifact")
+    parser.add_argument("--compact-dir", type=Path, default=COMPACT_MODEL_DIR,
+                        help=f"Compact artifact directory (default: {COMPACT_MODEL_DIR})")
+    parser.add_argument("--publish", action="store_true",
+                        help="Also publish the trained model as a new registry version and make it CURRENT")
+    parser.add_argument("--registry", type=Path, default=MODEL_REGISTRY_DIR,
+                        help=f"Model registry root for --publish (default: {MODEL_REGISTRY_DIR})")
+    args = parser.parse_args()
+
     # Make sure the MODEL_DIR exists before calling train_model if needed elsewhere
     MODEL_DIR.mkdir(parents=True, exist_ok=True)
-    train_model(DATASET_PATH, MODEL_PATH)
\ No newline at end of file
+    if args.export_only:
+        export_compact(joblib.load(args.output), args.compact_dir)
+    else:
+        if args.streaming:
+            pipeline = train_model_streaming(args.data, args.output, args.chunk_rows, args.n_features,
+                                             use_idf=not args.no_idf, holdout_percent=args.holdout_percent)
+        else:
+            pipeline = train_model(args.data, args.output, args.native_check_sample)
+        if pipeline is not None and args.export_compact:
+            export_compact(pipeline, args.compact_dir)
+        if pipeline is not None and args.publish:
+            publish(pipeline, args.registry)
\ No newline at end of file
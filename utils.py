@@ -1,73 +1,271 @@
-print("Importing utils.py...") # Add print statement for debugging
+from __future__ import annotations  # spaCy / sklearn types below are annotations only
 
-# --- Define/Import Pipeline Type FIRST ---
-try:
-    from sklearn.pipeline import Pipeline
-    print("utils.py: Imported Pipeline from sklearn.")
-except ImportError:
-    Pipeline = object # type: ignore
-    print("utils.py: Defined fallback Pipeline type.")
+import logging
+logger = logging.getLogger(__name__)
+
+logger.debug("Importing utils.py...")
 
 # --- Other Imports ---
+# spaCy, sklearn and joblib are imported when a model is loaded, not here: the
+# API process with INFERENCE_BACKEND=process never loads them itself.
 import re
-import spacy
-from typing import List, Dict, Tuple, Optional, Union
-import pickle
+import hashlib
+import json
+import threading
+import time
+from bisect import bisect_right
+from operator import itemgetter
+from typing import TYPE_CHECKING, Any, Iterator, List, Dict, Tuple, Optional, Union
 from pathlib import Path
 import os
-import joblib # Make sure joblib is imported
 
-# --- Import from models.py (AFTER Pipeline is defined) ---
+if TYPE_CHECKING:
+    import spacy
+    from sklearn.pipeline import Pipeline
+
+# --- Import from models.py ---
 try:
     # This should now work if models.py doesn't import utils
-    from models import predict_category
-    print("utils.py: Successfully imported predict_category from models.py")
+    from models import predict_category, predict_categories
+    logger.debug("utils.py: Successfully imported predict_category from models.py")
 except ImportError as e:
-    print(f"ERROR in utils.py: Could not import predict_category from models.py. Details: {e}")
+    logger.error(f"ERROR in utils.py: Could not import predict_category from models.py. Details: {e}")
     # Define dummy function if import fails
     def predict_category(text, pipeline): return "Classification failed"
+    def predict_categories(texts, pipeline): return ["Classification failed"] * len(texts)
+
+from result_cache import ResultCache, get_result_cache
+from metrics import PII_ENTITIES, counter, histogram, stage_timer
+from admission import DeadlineExceeded, check_deadline, deadline_exceeded
+from compact_model import CompactNBModel
+from model_registry import (
+    CURRENT_FILE, MODEL_REGISTRY_DIR, MODEL_WATCH_INTERVAL_S, LoadedModel, load_artifact, load_version, read_current,
+)
 
 # --- Model Loading ---
 MODEL_DIR = Path("saved_models")
 MODEL_PATH = MODEL_DIR / "email_classifier_pipeline.pkl"
 NLP_MODEL: Optional[spacy.language.Language] = None
-MODEL_PIPELINE: Optional[Pipeline] = None # Now Pipeline is defined
+# The classifier being served and its version (see model_registry.py); replaced as a whole on reload
+ACTIVE_MODEL: Optional[LoadedModel] = None
+# Loading can start from the startup warm-up and a first request at once; each model is loaded once
+_SPACY_LOAD_LOCK = threading.Lock()
+_PIPELINE_LOAD_LOCK = threading.Lock()
+
+# Classifier artifact format:
+#   MODEL_FORMAT:      "pickle" (default, joblib-pickled Pipeline at MODEL_PATH) or
+#                      "compact" (memory-mapped arrays exported by `train.py --export-compact`)
+#   COMPACT_MODEL_DIR: directory of the compact artifact
+# Both apply to the legacy single artifact; once MODEL_REGISTRY_DIR has a CURRENT
+# file, MODEL_FORMAT picks the artifact inside the current version instead.
+MODEL_FORMATS = ("pickle", "compact")
+MODEL_FORMAT = os.environ.get("MODEL_FORMAT", "pickle").strip().lower()
+COMPACT_MODEL_DIR = Path(os.environ.get("COMPACT_MODEL_DIR", MODEL_DIR / "email_classifier_compact"))
+
+# --- Batch Processing Configuration ---
+# Defaults for nlp.pipe in the batch path (override with environment variables)
+SPACY_BATCH_SIZE = int(os.environ.get("SPACY_BATCH_SIZE", 64))
+SPACY_N_PROCESS = int(os.environ.get("SPACY_N_PROCESS", 1))
+
+# --- spaCy Loading Profile ---
+# mask_pii only reads doc.ents, so by default the components it never uses are
+# excluded at load time (not just disabled), which saves both latency and memory.
+#   SPACY_MODEL:   model package name or path (default: en_core_web_sm)
+#   SPACY_PROFILE: "full"      - load every component of the model
+#                  "ner"       - load the model without SPACY_EXCLUDE components (default)
+#                  "blank_ner" - blank tokenizer for the model's language + its NER component only
+#   SPACY_EXCLUDE: comma-separated components excluded by the "ner"/"blank_ner" profiles
+SPACY_PROFILES = ("full", "ner", "blank_ner")
+DEFAULT_SPACY_EXCLUDE = ["tok2vec", "tagger", "parser", "senter", "attribute_ruler", "lemmatizer"]
+SPACY_MODEL_NAME = os.environ.get("SPACY_MODEL", "en_core_web_sm")
+SPACY_PROFILE = os.environ.get("SPACY_PROFILE", "ner").strip().lower()
+SPACY_EXCLUDE = [
+    component.strip()
+    for component in os.environ.get("SPACY_EXCLUDE", ",".join(DEFAULT_SPACY_EXCLUDE)).split(",")
+    if component.strip()
+]
+
+def build_spacy_pipeline(model_name: str, profile: str, exclude: List[str]) -> spacy.language.Language:
+    """Loads `model_name` according to one of SPACY_PROFILES."""
+    import spacy
+
+    if profile == "full":
+        return spacy.load(model_name)
+    if profile == "ner":
+        return spacy.load(model_name, exclude=exclude)
+    if profile == "blank_ner":
+        source = spacy.load(model_name, exclude=exclude)
+        nlp = spacy.blank(source.lang)
+        nlp.add_pipe("ner", source=source)
+        return nlp
+    raise ValueError(f"Unknown SPACY_PROFILE '{profile}'. Expected one of: {', '.join(SPACY_PROFILES)}")
+
+def _load_spacy_with_profile(model_name: str, profile: str, exclude: List[str]) -> spacy.language.Language:
+    """
+    Loads the model with the requested profile. If a reduced profile cannot run
+    (e.g. the model's NER listens to an excluded tok2vec), falls back to "full".
+    """
+    if profile == "full":
+        return build_spacy_pipeline(model_name, "full", exclude)
+    try:
+        nlp = build_spacy_pipeline(model_name, profile, exclude)
+        nlp("Warm-up check for Jane Doe.")  # Make sure NER still runs without the excluded components
+        return nlp
+    except (ValueError, OSError):
+        raise  # Bad profile name / model not installed: let the caller handle it
+    except Exception as e:
+        logger.error(f"spaCy profile '{profile}' failed for '{model_name}' ({e}). Falling back to the full pipeline.")
+        return build_spacy_pipeline(model_name, "full", exclude)
 
 def load_spacy_model() -> Optional[spacy.language.Language]:
-    """Loads the spaCy model."""
+    """Loads the spaCy model using the configured SPACY_MODEL / SPACY_PROFILE."""
     global NLP_MODEL
-    if NLP_MODEL is None:
-        try:
-            NLP_MODEL = spacy.load("en_core_web_sm")
-            print("spaCy model 'en_core_web_sm' loaded successfully.")
-        except OSError:
-            print("Error loading spaCy model 'en_core_web_sm'. Make sure it's downloaded.")
-            # Attempt to download if not found (might fail in restricted envs)
+    if NLP_MODEL is not None:
+        return NLP_MODEL
+    with _SPACY_LOAD_LOCK:
+        if NLP_MODEL is None:
             try:
-                print("Attempting to download spaCy model...")
-                spacy.cli.download("en_core_web_sm")
-                NLP_MODEL = spacy.load("en_core_web_sm")
-                print("spaCy model 'en_core_web_sm' downloaded and loaded successfully.")
-            except Exception as download_e:
-                print(f"Failed to download or load spaCy model: {download_e}")
-                NLP_MODEL = None  # Ensure it remains None if loading fails
+                NLP_MODEL = _load_spacy_with_profile(SPACY_MODEL_NAME, SPACY_PROFILE, SPACY_EXCLUDE)
+                logger.info(f"spaCy model '{SPACY_MODEL_NAME}' loaded successfully (profile '{SPACY_PROFILE}', pipes: {NLP_MODEL.pipe_names}).")
+            except ValueError as e:
+                logger.error(f"Error loading spaCy model: {e}")
+                NLP_MODEL = None
+            except OSError:
+                logger.error(f"Error loading spaCy model '{SPACY_MODEL_NAME}'. Make sure it's downloaded.")
+                # Attempt to download if not found (might fail in restricted envs)
+                try:
+                    import spacy.cli
+
+                    logger.info("Attempting to download spaCy model...")
+                    spacy.cli.download(SPACY_MODEL_NAME)
+                    NLP_MODEL = _load_spacy_with_profile(SPACY_MODEL_NAME, SPACY_PROFILE, SPACY_EXCLUDE)
+                    logger.info(f"spaCy model '{SPACY_MODEL_NAME}' downloaded and loaded successfully.")
+                except Exception as download_e:
+                    logger.error(f"Failed to download or load spaCy model: {download_e}")
+                    NLP_MODEL = None  # Ensure it remains None if loading fails
     return NLP_MODEL
 
-def load_model_pipeline() -> Optional[Pipeline]:  # Now Pipeline is defined
-    """Loads the classification pipeline from the .pkl file."""
-    global MODEL_PIPELINE
-    if MODEL_PIPELINE is None:
-        if not MODEL_PATH.exists():
-            print(f"Model pipeline not found at {MODEL_PATH}. Please train and save the model pipeline first.")
-            return None
+def _load_configured_model() -> LoadedModel:
+    """The version CURRENT points at when the registry is in use, else the legacy artifact."""
+    version = read_current(MODEL_REGISTRY_DIR)
+    if version is not None:
+        return load_version(version, MODEL_FORMAT, MODEL_REGISTRY_DIR)
+    return load_artifact(MODEL_PATH, COMPACT_MODEL_DIR, MODEL_FORMAT)
+
+def load_active_model() -> Optional[LoadedModel]:
+    """
+    Returns the (pipeline, version) being served, loading it on first use.
+    Callers read it once per request and use that object throughout, so a
+    reload swapping in a new version never changes a request mid-flight.
+    """
+    global ACTIVE_MODEL
+    if ACTIVE_MODEL is not None:
+        return ACTIVE_MODEL
+    with _PIPELINE_LOAD_LOCK:
+        if ACTIVE_MODEL is None:
+            try:
+                ACTIVE_MODEL = _load_configured_model()
+                logger.info(f"Model {ACTIVE_MODEL.version} loaded ({MODEL_FORMAT}).")
+            except Exception as e:
+                logger.error(f"Error loading the classification model ({MODEL_FORMAT}): {e}. "
+                             "Please train and save the model pipeline first.")
+                ACTIVE_MODEL = None  # Ensure it remains None if loading fails
+    return ACTIVE_MODEL
+
+def load_model_pipeline() -> Optional[Union[Pipeline, CompactNBModel]]:
+    """Loads the classification pipeline from the .pkl file (or the compact artifact, see MODEL_FORMAT)."""
+    model = load_active_model()
+    return model.pipeline if model is not None else None
+
+# --- Model Hot Reload ---
+# A new version is loaded and warmed up on the calling thread (the watcher or
+# the admin endpoint, never a request) while requests keep using the old one;
+# it is then swapped in with a single assignment. See model_registry.py.
+MODEL_RELOADS = counter("model_reloads_total", "Classifier reloads, by outcome.", labelnames=("outcome",))
+_model_watcher: Optional[threading.Thread] = None
+_failed_version: Optional[str] = None  # CURRENT target whose last load failed; not retried until CURRENT changes
+
+def set_active_model(pipeline, version: str) -> LoadedModel:
+    """Serves `pipeline` as `version` from now on."""
+    global ACTIVE_MODEL
+    ACTIVE_MODEL = LoadedModel(pipeline, version)
+    return ACTIVE_MODEL
+
+def reload_model(version: Optional[str] = None) -> LoadedModel:
+    """
+    Loads `version` (default: what CURRENT points at), checks it classifies
+    the warm-up email and swaps it in. Returns the model now being served.
+    Raises if the new version cannot be loaded; the old one stays active.
+    """
+    global _failed_version
+    with _PIPELINE_LOAD_LOCK:
+        if version is None:
+            version = read_current(MODEL_REGISTRY_DIR)
+            if version is None:
+                raise FileNotFoundError(f"No {CURRENT_FILE} file in {MODEL_REGISTRY_DIR}; nothing to reload")
+        active = ACTIVE_MODEL
+        if active is not None and active.version == version:
+            return active
+        started = time.perf_counter()
         try:
-            # Use joblib.load instead of pickle.load
-            MODEL_PIPELINE = joblib.load(MODEL_PATH)
-            print("Model pipeline loaded successfully using joblib.")
+            model = load_version(version, MODEL_FORMAT, MODEL_REGISTRY_DIR)
+            # Builds the native scorer and pages the arrays in before the first request sees it
+            if predict_category(WARM_UP_EMAIL, model.pipeline) in PREDICTION_FAILURES:
+                raise RuntimeError("the warm-up email could not be classified")
         except Exception as e:
-            print(f"Error loading model pipeline from {MODEL_PATH} using joblib: {e}")
-            MODEL_PIPELINE = None  # Ensure it remains None if loading fails
-    return MODEL_PIPELINE
+            _failed_version = version
+            MODEL_RELOADS.inc(outcome="failed")
+            logger.error(f"Reload of model {version} failed, still serving "
+                         f"{active.version if active is not None else 'nothing'}: {e}")
+            raise
+        _failed_version = None
+        swapped = set_active_model(model.pipeline, model.version)
+        MODEL_RELOADS.inc(outcome="succeeded")
+        logger.info(f"Model {swapped.version} loaded in {time.perf_counter() - started:.2f}s and swapped in "
+                    f"(was {active.version if active is not None else 'none'}).")
+        return swapped
+
+def check_for_new_model() -> Optional[LoadedModel]:
+    """Reloads when CURRENT names a version other than the active one. Returns the new model, if any."""
+    try:
+        version = read_current(MODEL_REGISTRY_DIR)
+    except (OSError, ValueError) as e:
+        logger.error(f"Cannot read {MODEL_REGISTRY_DIR / CURRENT_FILE}: {e}")
+        return None
+    active = ACTIVE_MODEL
+    if version is None or version == _failed_version or (active is not None and active.version == version):
+        return None
+    try:
+        return reload_model(version)
+    except Exception:
+        return None  # Logged by reload_model
+
+def _watch_model(interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        check_for_new_model()
+
+def start_model_watcher(interval: float = MODEL_WATCH_INTERVAL_S) -> bool:
+    """Starts the daemon thread polling CURRENT every `interval` seconds (once per process)."""
+    global _model_watcher
+    if interval <= 0 or _model_watcher is not None:
+        return False
+    _model_watcher = threading.Thread(target=_watch_model, args=(interval,), name="model-watcher", daemon=True)
+    _model_watcher.start()
+    logger.info(f"Watching {MODEL_REGISTRY_DIR / CURRENT_FILE} for new model versions every {interval}s.")
+    return True
+
+def get_model_stats() -> Dict[str, Optional[str]]:
+    """Version served by this process and the one CURRENT points at."""
+    try:
+        current = read_current(MODEL_REGISTRY_DIR)
+    except (OSError, ValueError):
+        current = None
+    return {
+        "active_version": ACTIVE_MODEL.version if ACTIVE_MODEL is not None else None,
+        "current_version": current,
+        "failed_version": _failed_version,
+    }
 
 # --- PII Detection Regex Patterns ---
 # Define regex patterns for PII entities not easily caught by NER
@@ -83,115 +281,662 @@ REGEX_PATTERNS = {
     "dob": r'\b(\d{1,2}[-/]\d{1,2}[-/]\d{2,4}|\d{4}[-/]\d{1,2}[-/]\d{1,2})\b'  # Basic DOB patterns
 }
 
+# --- Linear-Time Email Matching ---
+# Python's re backtracks, so a pattern's worst case depends on how it is
+# written. The digit patterns (credit_debit_no included) only repeat bounded
+# groups, so each attempt does bounded work and a scan is linear in the text
+# length (benchmarks/bench_regex_redos.py checks this). The email pattern is
+# not: finditer tries it at every word boundary, and in a long run of
+# local-part characters with no '@' after it ("1-1-1-...", "a.b.c...", common
+# in pasted logs) every attempt reads to the end of the run, which is
+# quadratic (~0.9 s for 20k characters).
+_EMAIL_LOCAL_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789._%+-")  # Local part of REGEX_PATTERNS["email"]
+_WORD_BOUNDARY_RE = re.compile(r'\b')
+
+class AnchoredEmailPattern:
+    """
+    Finds exactly the matches of re.compile(REGEX_PATTERNS["email"]).finditer
+    in linear time. The local part can't contain '@', so every start inside
+    the run of local-part characters before an '@' ends its local part at that
+    '@' and continues with the same domain: they all match or all fail. Only
+    the run's first word boundary (the leftmost start) is tried, once per '@'.
+    """
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.regex = re.compile(pattern)
+
+    def finditer(self, text: str) -> Iterator[re.Match]:
+        pos = 0  # Like finditer, the next match starts at or after the previous one's end
+        at = text.find("@")
+        while at != -1:
+            start = at
+            while start > pos and text[start - 1] in _EMAIL_LOCAL_CHARS:
+                start -= 1
+            while start < at and _WORD_BOUNDARY_RE.match(text, start) is None:
+                start += 1
+            if start < at:
+                match = self.regex.match(text, start)
+                if match is not None:
+                    yield match
+                    pos = match.end()
+            at = text.find("@", max(at + 1, pos))
+
+# --- Compiled PII Scanner ---
+# All patterns are compiled once at import. Dict order is the priority order:
+# spaCy PERSON spans win over every regex, and an earlier pattern wins over a
+# later one when their matches overlap.
+COMPILED_PATTERNS = {entity_type: re.compile(pattern) for entity_type, pattern in REGEX_PATTERNS.items()}
+COMPILED_PATTERNS["email"] = AnchoredEmailPattern(REGEX_PATTERNS["email"])
+
+# A pattern can only match if its required character class occurs in the text;
+# this lets emails without digits (or without '@') skip those scans entirely.
+_DIGIT_RE = re.compile(r'\d')
+_AT_SIGN_RE = re.compile(r'@')
+PATTERN_PREREQUISITES = {
+    entity_type: (_AT_SIGN_RE if entity_type == "email" else _DIGIT_RE)
+    for entity_type in REGEX_PATTERNS
+}
+
+class SpanIndex:
+    """
+    Sorted, non-overlapping (start, end, entity_type, original_value) spans.
+
+    Candidates are merged in with a sorted sweep, so resolving overlaps costs
+    O(spans + candidates) per pattern instead of the old any(...) scan over
+    every span found so far for every match.
+    """
+
+    def __init__(self):
+        self.spans: List[Tuple[int, int, str, str]] = []
+
+    def add_many(self, candidates: List[Tuple[int, int, str, str]]) -> int:
+        """
+        Adds candidate spans that do not overlap any span already in the index.
+        `candidates` must be sorted by start and must not overlap each other
+        (true for `re.finditer` matches and for `doc.ents`).
+        Returns the number of spans added.
+        """
+        spans = self.spans
+        accepted = []
+        j, n = 0, len(spans)
+        for candidate in candidates:
+            start, end = candidate[0], candidate[1]
+            if start >= end:
+                continue
+            # Existing spans that end before this candidate can't overlap it or any later one
+            while j < n and spans[j][1] <= start:
+                j += 1
+            if j < n and spans[j][0] < end:
+                continue  # Overlaps a higher-priority span
+            accepted.append(candidate)
+        if accepted:
+            # Both runs are already sorted, so this merge is linear
+            self.spans = sorted(spans + accepted, key=itemgetter(0))
+        return len(accepted)
+
+# --- Regex Time Budget ---
+# Every pattern scans in linear time, but a multi-megabyte paste still takes a
+# while. Past the budget the scan stops and the lower-priority patterns are
+# skipped (higher-priority results are unaffected); such results are not cached.
+#   REGEX_TIME_BUDGET_MS: most time one email's regex scan may take (default: 0 = no limit)
+REGEX_TIME_BUDGET_MS = float(os.environ.get("REGEX_TIME_BUDGET_MS", 0))
+_REGEX_BUDGET_CHECK_EVERY = 64  # Matches between clock reads within one pattern
+
+REGEX_BUDGET_EXHAUSTED = counter(
+    "regex_time_budget_exhausted_total",
+    "Emails whose regex scan stopped at REGEX_TIME_BUDGET_MS, by the first pattern cut short.",
+    labelnames=("pattern",),
+)
+_regex_scan_state = threading.local()  # Per-thread count of scans cut short, see regex_scans_cut_short
+
+def regex_scans_cut_short() -> int:
+    """How many regex scans on this thread stopped at the time budget (compare before/after masking)."""
+    return getattr(_regex_scan_state, "cut_short", 0)
+
+def _regex_budget_exhausted(entity_type: str, text: str) -> None:
+    _regex_scan_state.cut_short = regex_scans_cut_short() + 1
+    REGEX_BUDGET_EXHAUSTED.inc(pattern=entity_type)
+    logger.debug("Regex time budget reached at '%s' on a %d-character email; later patterns skipped", entity_type, len(text))
+
+def scan_regex_pii(text: str, span_index: SpanIndex, budget_ms: Optional[float] = None) -> SpanIndex:
+    """
+    Runs every compiled PII pattern over `text` in priority order and adds
+    each match that does not overlap an already accepted span. Stops once
+    `budget_ms` (default: REGEX_TIME_BUDGET_MS) is spent, keeping the matches
+    found so far.
+    """
+    budget_ms = REGEX_TIME_BUDGET_MS if budget_ms is None else budget_ms
+    deadline = time.perf_counter() + budget_ms / 1000 if budget_ms > 0 else None
+    for entity_type, compiled in COMPILED_PATTERNS.items():
+        if deadline is not None and time.perf_counter() > deadline:
+            _regex_budget_exhausted(entity_type, text)
+            break
+        if PATTERN_PREREQUISITES[entity_type].search(text) is None:
+            continue
+        # Add basic context checks if needed (e.g., for CVV)
+        # if entity_type == "cvv_no" and not is_likely_cvv(text, match): continue
+        candidates = []
+        for match in compiled.finditer(text):
+            candidates.append((match.start(), match.end(), entity_type, match.group(0)))
+            if deadline is not None and len(candidates) % _REGEX_BUDGET_CHECK_EVERY == 0 and time.perf_counter() > deadline:
+                span_index.add_many(candidates)
+                _regex_budget_exhausted(entity_type, text)
+                return span_index
+        span_index.add_many(candidates)
+    return span_index
+
+# --- Masked Text Rendering ---
+class OffsetMap:
+    """
+    Maps character positions between the masked text and the original text.
+
+    Stored as one (masked_start, masked_end, original_start, original_end)
+    segment per placeholder; text between placeholders is copied unchanged,
+    so positions there only shift by the running length difference.
+    Positions inside a placeholder/entity map to the start of its counterpart.
+    """
+
+    def __init__(self, segments: List[Tuple[int, int, int, int]]):
+        self.segments = segments
+        self._masked_starts = [segment[0] for segment in segments]
+        self._original_starts = [segment[2] for segment in segments]
+
+    @staticmethod
+    def _map(position: int, starts: List[int], segments, src: int, dst: int) -> int:
+        i = bisect_right(starts, position) - 1
+        if i < 0:
+            return position  # Before the first placeholder nothing has moved
+        segment = segments[i]
+        if position < segment[src + 1]:
+            return segment[dst]  # Inside a placeholder/entity
+        return segment[dst + 1] + (position - segment[src + 1])
+
+    def to_original(self, masked_position: int) -> int:
+        """Returns the original-text position for a masked-text position."""
+        return self._map(masked_position, self._masked_starts, self.segments, 0, 2)
+
+    def to_masked(self, original_position: int) -> int:
+        """Returns the masked-text position for an original-text position."""
+        return self._map(original_position, self._original_starts, self.segments, 2, 0)
+
+    def to_list(self) -> List[List[int]]:
+        """JSON-friendly form: [[masked_start, masked_end, original_start, original_end], ...]."""
+        return [list(segment) for segment in self.segments]
+
+def render_masked_text(text: str, found_spans: List[Tuple[int, int, str, str]]) -> Tuple[str, List[Dict], OffsetMap]:
+    """
+    Builds the masked text in one pass from sorted, non-overlapping spans.
+
+    Returns:
+        A tuple containing:
+        - masked_email (str): `text` with every span replaced by "[entity_type]".
+        - list_of_masked_entities (List[Dict]): position/classification/entity per span,
+          with positions in ORIGINAL coordinates.
+        - offset_map (OffsetMap): mapping between masked and original positions.
+    """
+    pieces = []
+    list_of_masked_entities = []
+    segments = []
+    cursor = 0         # Position in the original text
+    masked_length = 0  # Length of the masked text built so far
+    for start, end, entity_type, original_value in found_spans:
+        placeholder = f"[{entity_type}]"
+        pieces.append(text[cursor:start])
+        masked_length += start - cursor
+        pieces.append(placeholder)
+        segments.append((masked_length, masked_length + len(placeholder), start, end))
+        masked_length += len(placeholder)
+        cursor = end
+
+        list_of_masked_entities.append({
+            "position": [start, end],  # Use ORIGINAL indices
+            "classification": entity_type,
+            "entity": original_value
+        })
+    pieces.append(text[cursor:])
+
+    return "".join(pieces), list_of_masked_entities, OffsetMap(segments)
+
+# --- NER Pre-Gate ---
+# mask_pii only keeps PERSON entities with more than one whitespace-separated
+# token, so an email without two adjacent capitalized words (allowing name
+# particles like "de la") can't produce one. The gate checks that cheaply and
+# lets mask_pii skip the spaCy pass for such emails.
+#   NER_GATE_MODE:       "off"    - always run NER (default)
+#                        "on"     - skip NER when the gate finds no possible name
+#                        "shadow" - always run NER, but count how often skipping
+#                                   would have changed the output (accuracy guard)
+#   NER_GATE_GAZETTEER:  optional path to a file of first names (one per line);
+#                        any of them appearing in the text, in any case, opens the gate
+NER_GATE_MODES = ("off", "on", "shadow")
+NER_GATE_MODE = os.environ.get("NER_GATE_MODE", "off").strip().lower()
+NER_GATE_GAZETTEER_PATH = os.environ.get("NER_GATE_GAZETTEER")
+
+# Candidate capitals are matched with a cheap superset class (ASCII capitals or
+# any non-ASCII char) and confirmed with str.isupper(); a full Unicode uppercase
+# class is much slower in `re`. The second word sits in a lookahead so a failed
+# candidate does not swallow the next word.
+_CAPITAL_CANDIDATE = "[A-Z\u00c0-\U0010ffff]"
+_NAME_PARTICLES = r"(?:(?:al|bin|da|das|de|del|della|den|der|di|dos|du|ibn|la|le|st\.?|van|von)\s+){0,3}"
+_CAPITALIZED_BIGRAM_RE = re.compile(
+    rf"(?<!\w)({_CAPITAL_CANDIDATE})[\w'\u2019.-]*(?=\s+[\"'(]?{_NAME_PARTICLES}({_CAPITAL_CANDIDATE}))"
+)
+_WORD_RE = re.compile(r"\w+")
+
+# Outcomes counted by the gate:
+#   checked:           texts evaluated by the gate
+#   closed:            gate found no possible multi-token name
+#   ner_skipped:       NER pass actually skipped ("on" mode)
+#   shadow_mismatches: "shadow" mode: gate closed but NER found a full_name
+NER_GATE_OUTCOMES = ("checked", "closed", "ner_skipped", "shadow_mismatches")
+NER_GATE_EVENTS = counter("ner_gate_total", "NER pre-gate decisions, by outcome.", labelnames=("outcome",))
+
+def _load_gazetteer(path: Optional[str]) -> frozenset:
+    """Loads the optional first-name gazetteer (lower-cased)."""
+    if not path:
+        return frozenset()
+    try:
+        with open(path, encoding="utf-8") as f:
+            names = frozenset(line.strip().lower() for line in f if line.strip())
+        logger.info(f"NER gate gazetteer loaded with {len(names)} names from {path}.")
+        return names
+    except OSError as e:
+        logger.error(f"Could not load NER gate gazetteer from {path}: {e}")
+        return frozenset()
+
+NER_GATE_GAZETTEER = _load_gazetteer(NER_GATE_GAZETTEER_PATH)
+
+def _resolve_ner_gate_mode(ner_gate: Optional[str]) -> str:
+    mode = (ner_gate or NER_GATE_MODE).lower()
+    if mode not in NER_GATE_MODES:
+        raise ValueError(f"Unknown NER gate mode '{mode}'. Expected one of: {', '.join(NER_GATE_MODES)}")
+    return mode
+
+def _count_ner_gate(**increments: int) -> None:
+    for outcome, value in increments.items():
+        if value:
+            NER_GATE_EVENTS.inc(value, outcome=outcome)
+
+def may_contain_person(text: str) -> bool:
+    """Cheap lexical check: can spaCy possibly find a multi-token PERSON in `text`?"""
+    for match in _CAPITALIZED_BIGRAM_RE.finditer(text):
+        first, second = match.group(1), match.group(2)
+        if (first.isupper() or first.istitle()) and (second.isupper() or second.istitle()):
+            return True
+    if NER_GATE_GAZETTEER:
+        return not NER_GATE_GAZETTEER.isdisjoint(_WORD_RE.findall(text.lower()))
+    return False
+
+def get_ner_gate_stats() -> Dict[str, int]:
+    """Returns a snapshot of the NER gate counters."""
+    return {outcome: int(NER_GATE_EVENTS.value(outcome=outcome)) for outcome in NER_GATE_OUTCOMES}
+
+# --- Long-Document NER ---
+# Emails longer than NER_WINDOW_CHARS (quoted threads, pasted logs) are not
+# passed to spaCy in one piece: they are cut into overlapping windows that end
+# on paragraph, sentence or word boundaries, and the windows run through
+# nlp.pipe as one batch. Each window keeps the entities starting in its half of
+# every overlap, so a name on a seam is found once and in full, and positions
+# are shifted back to the original text. The regex scan always covers the whole email.
+#   NER_WINDOW_CHARS:         window size and the length above which windowing starts
+#                             (default: 10000; capped at nlp.max_length)
+#   NER_WINDOW_OVERLAP_CHARS: characters shared by neighbouring windows (default: 300)
+#   NER_CHAR_BUDGET:          most characters of one email that go through NER; the
+#                             rest is masked by the regex scan only (default: 0 = no limit)
+NER_WINDOW_CHARS = int(os.environ.get("NER_WINDOW_CHARS", 10000))
+NER_WINDOW_OVERLAP_CHARS = int(os.environ.get("NER_WINDOW_OVERLAP_CHARS", 300))
+NER_CHAR_BUDGET = int(os.environ.get("NER_CHAR_BUDGET", 0))
+
+NER_WINDOWS = histogram("ner_windows_per_email", "NER windows per windowed (long) email.", buckets=(2, 3, 5, 10, 20, 50, 100))
+NER_BUDGET_EXHAUSTED = counter("ner_char_budget_exhausted_total", "Emails whose NER pass stopped at NER_CHAR_BUDGET.")
+
+# Window ends, best first; each is searched in the second half of the window
+_WINDOW_BREAK_RES = (
+    re.compile(r"\n[ \t]*\n"),         # Paragraph
+    re.compile(r"[.!?][\"')\]]*\s"),  # Sentence
+    re.compile(r"\s"),                 # Word
+)
+
+def _window_limit(nlp: spacy.language.Language) -> int:
+    return max(1, min(NER_WINDOW_CHARS, nlp.max_length)) if NER_WINDOW_CHARS > 0 else nlp.max_length
+
+def _last_break(text: str, lo: int, hi: int) -> int:
+    """End of the last (best kind of) boundary in text[lo:hi], or `hi` if there is none."""
+    for pattern in _WINDOW_BREAK_RES:
+        end = -1
+        for match in pattern.finditer(text, lo, hi):
+            end = match.end()
+        if end > lo:
+            return end
+    return hi
+
+def _first_break(text: str, lo: int, hi: int) -> int:
+    """End of the first (best kind of) boundary in text[lo:hi], or `lo` if there is none."""
+    for pattern in _WINDOW_BREAK_RES:
+        match = pattern.search(text, lo, hi)
+        if match is not None and match.end() < hi:
+            return match.end()
+    return lo
+
+def plan_ner_windows(text: str, window_chars: int, overlap_chars: int = NER_WINDOW_OVERLAP_CHARS,
+                     char_budget: int = NER_CHAR_BUDGET) -> List[Tuple[int, int]]:
+    """
+    Splits `text` into (start, end) windows of at most `window_chars` that
+    overlap by up to `overlap_chars`. Stops once `char_budget` characters
+    (0 = no limit) are covered, so the tail of the text may be left out.
+    """
+    overlap_chars = max(0, min(overlap_chars, window_chars // 2))
+    windows: List[Tuple[int, int]] = []
+    start, used = 0, 0  # `used` counts overlaps twice: it is what NER actually processes
+    while start < len(text) and (char_budget <= 0 or used < char_budget):
+        size = window_chars if char_budget <= 0 else min(window_chars, char_budget - used)
+        if start + size >= len(text):
+            end = len(text)
+        else:
+            end = _last_break(text, start + size // 2, start + size)
+        windows.append((start, end))
+        used += end - start
+        if end >= len(text):
+            break
+        # Next window starts on a boundary inside the overlap, always moving forward
+        start = max(start + 1, _first_break(text, max(start + 1, end - overlap_chars), end))
+    return windows
+
+def merge_window_spans(windows: List[Tuple[int, int]],
+                       spans_per_window: List[List[Tuple[int, int, str, str]]]) -> List[Tuple[int, int, str, str]]:
+    """
+    Combines per-window spans (already in original offsets): a window keeps the
+    spans starting between the midpoints of its overlaps with its neighbours,
+    and of spans that still overlap the longer one wins. Result is sorted.
+    """
+    merged: List[Tuple[int, int, str, str]] = []
+    for i, ((start, end), spans) in enumerate(zip(windows, spans_per_window)):
+        lo = (start + windows[i - 1][1]) // 2 if i > 0 else start
+        hi = (windows[i + 1][0] + end) // 2 if i + 1 < len(windows) else end
+        for span in spans:
+            if not lo <= span[0] < hi:
+                continue
+            if merged and span[0] < merged[-1][1]:
+                if span[1] - span[0] > merged[-1][1] - merged[-1][0]:
+                    merged[-1] = span
+                continue
+            merged.append(span)
+    return merged
+
+def needs_windowing(text: str, nlp: spacy.language.Language) -> bool:
+    """True when `text` is too long (or over NER_CHAR_BUDGET) for a single NER pass."""
+    return len(text) > _window_limit(nlp) or 0 < NER_CHAR_BUDGET < len(text)
+
+def ner_person_spans_windowed(text: str, nlp: spacy.language.Language) -> List[Tuple[int, int, str, str]]:
+    """full_name spans of a long text from windowed NER (see the section comment above)."""
+    windows = plan_ner_windows(text, _window_limit(nlp), NER_WINDOW_OVERLAP_CHARS, NER_CHAR_BUDGET)
+    if windows and windows[-1][1] < len(text):
+        NER_BUDGET_EXHAUSTED.inc()
+        logger.debug("NER budget reached: characters %d-%d are masked by regex only", windows[-1][1], len(text))
+    NER_WINDOWS.observe(len(windows))
+    with stage_timer("ner"):
+        docs = nlp.pipe([text[start:end] for start, end in windows], batch_size=SPACY_BATCH_SIZE)
+        spans_per_window = [find_person_spans(doc, offset=start) for (start, _), doc in zip(windows, docs)]
+    return merge_window_spans(windows, spans_per_window)
+
+def ner_person_spans(text: str, nlp: spacy.language.Language) -> List[Tuple[int, int, str, str]]:
+    """full_name spans of `text`, windowing long texts."""
+    if needs_windowing(text, nlp):
+        return ner_person_spans_windowed(text, nlp)
+    return find_person_spans(run_ner(text, nlp))
+
 # --- PII Masking Function (Defined within utils.py) ---
-def mask_pii(text: str, nlp: spacy.language.Language) -> Tuple[str, List[Dict]]:
+def run_ner(text: str, nlp: spacy.language.Language) -> spacy.tokens.Doc:
+    """Runs the spaCy pipeline on one text, timed as the "ner" stage."""
+    with stage_timer("ner"):
+        return nlp(text)
+
+def find_person_spans(doc: spacy.tokens.Doc, offset: int = 0) -> List[Tuple[int, int, str, str]]:
+    """
+    Returns the full_name spans (multi-word PERSON entities) of a spaCy Doc,
+    shifted by `offset` when the Doc covers a window starting there.
+    """
+    person_spans = []
+    for ent in doc.ents:
+        if ent.label_ == "PERSON":
+            # Simple PERSON check, might need refinement (e.g., filter short names)
+            if len(ent.text.split()) > 1:  # Basic check for multi-word names
+                person_spans.append((offset + ent.start_char, offset + ent.end_char, "full_name", ent.text))
+    return person_spans
+
+def detect_person_spans(text: str, nlp: spacy.language.Language, ner_gate: Optional[str] = None) -> List[Tuple[int, int, str, str]]:
+    """Runs spaCy NER on `text` (subject to the NER gate) and returns its full_name spans."""
+    mode = _resolve_ner_gate_mode(ner_gate)
+    if mode == "off":
+        return ner_person_spans(text, nlp)
+
+    gate_open = may_contain_person(text)
+    _count_ner_gate(checked=1, closed=0 if gate_open else 1, ner_skipped=1 if not gate_open and mode == "on" else 0)
+    if not gate_open and mode == "on":
+        return []
+
+    person_spans = ner_person_spans(text, nlp)
+    if not gate_open and person_spans:
+        _count_ner_gate(shadow_mismatches=1)
+    return person_spans
+
+def mask_text_with_person_spans(
+    text: str,
+    person_spans: List[Tuple[int, int, str, str]],
+    return_offset_map: bool = False,
+    deadline: Optional[float] = None,
+) -> Union[Tuple[str, List[Dict]], Tuple[str, List[Dict], OffsetMap]]:
+    """Adds regex PII to the given full_name spans and renders the masked text."""
+    check_deadline(deadline, "regex_scan")
+    span_index = SpanIndex()  # Stores (start, end, entity_type, original_value)
+    span_index.add_many(person_spans)
+
+    # Use the compiled regex scanner for other PII types
+    with stage_timer("regex_scan"):
+        scan_regex_pii(text, span_index)
+
+    # Spans are kept sorted by start position by the index,
+    # so the masked text can be assembled in a single pass
+    with stage_timer("mask_assembly"):
+        masked_text, list_of_masked_entities, offset_map = render_masked_text(text, span_index.spans)
+    for _, _, entity_type, _ in span_index.spans:
+        PII_ENTITIES.inc(type=entity_type)
+
+    if return_offset_map:
+        return masked_text, list_of_masked_entities, offset_map
+    return masked_text, list_of_masked_entities
+
+def mask_pii(
+    text: str,
+    nlp: spacy.language.Language,
+    doc: Optional[spacy.tokens.Doc] = None,
+    return_offset_map: bool = False,
+    ner_gate: Optional[str] = None,
+    deadline: Optional[float] = None,
+) -> Union[Tuple[str, List[Dict]], Tuple[str, List[Dict], OffsetMap]]:
     """
     Detects and masks PII in the input text using spaCy NER and Regex.
 
     Args:
         text: The input email body string.
         nlp: The spaCy language model.
+        doc: Optional pre-computed spaCy Doc for `text` (e.g. from `nlp.pipe`).
+             When given, the NER pass (and the NER gate) is skipped.
+        return_offset_map: Also return the OffsetMap between masked and original text.
+        ner_gate: NER gate mode for this call ("off", "on" or "shadow");
+                  defaults to NER_GATE_MODE.
+        deadline: Optional time.monotonic() deadline, checked before the NER
+                  and regex stages (raises DeadlineExceeded once passed).
 
     Returns:
         A tuple containing:
         - masked_email (str): The email body with PII replaced by placeholders.
         - list_of_masked_entities (List[Dict]): A list of dictionaries,
           each detailing a masked entity (position, classification, original value).
+        - offset_map (OffsetMap): Only when `return_offset_map` is True.
     """
-    masked_text = text
-    list_of_masked_entities = []
-    found_spans = []  # To store (start, end, entity_type, original_value)
-
     # 1. Use spaCy for Named Entity Recognition (PERSON for full_name)
-    doc = nlp(text)
-    for ent in doc.ents:
-        if ent.label_ == "PERSON":
-            # Simple PERSON check, might need refinement (e.g., filter short names)
-            if len(ent.text.split()) > 1:  # Basic check for multi-word names
-                found_spans.append((ent.start_char, ent.end_char, "full_name", ent.text))
-
-    # 2. Use Regex for other PII types
-    for entity_type, pattern in REGEX_PATTERNS.items():
-        for match in re.finditer(pattern, text):
-            # Basic check for overlap with already found spans (can be improved)
-            is_overlapping = any(
-                max(found[0], match.start()) < min(found[1], match.end())
-                for found in found_spans
-            )
-            if not is_overlapping:
-                # Add basic context checks if needed (e.g., for CVV)
-                # if entity_type == "cvv_no" and not is_likely_cvv(text, match): continue
-                found_spans.append((match.start(), match.end(), entity_type, match.group(0)))
-
-    # 3. Sort spans by start position to handle masking correctly
-    found_spans.sort(key=lambda x: x[0])
-
-    # 4. Perform masking and create the entity list
-    offset = 0  # Keep track of index changes due to replacements
-    for start, end, entity_type, original_value in found_spans:
-        adjusted_start = start + offset
-        adjusted_end = end + offset
-        placeholder = f"[{entity_type}]"
+    if doc is None:
+        check_deadline(deadline, "ner")
+        person_spans = detect_person_spans(text, nlp, ner_gate)
+    else:
+        person_spans = find_person_spans(doc)
 
-        # Replace the PII with the placeholder in the masked_text
-        masked_text = masked_text[:adjusted_start] + placeholder + masked_text[adjusted_end:]
+    # 2. Regex PII and masking
+    return mask_text_with_person_spans(text, person_spans, return_offset_map, deadline)
 
-        # Update the offset for subsequent replacements
-        offset += len(placeholder) - (end - start)
+# --- Batch PII Masking ---
+def mask_pii_batch(
+    texts: List[str],
+    nlp: spacy.language.Language,
+    batch_size: int = SPACY_BATCH_SIZE,
+    n_process: int = SPACY_N_PROCESS,
+    ner_gate: Optional[str] = None,
+    return_offset_map: bool = False,
+) -> List[Union[tuple, Exception]]:
+    """
+    Masks PII in many texts, running spaCy NER over all of them with `nlp.pipe`.
+    Texts closed by the NER gate (in "on" mode) are left out of the pipe, and
+    long texts get windowed NER of their own (see ner_person_spans_windowed).
 
-        # Add details to the list_of_masked_entities
-        list_of_masked_entities.append({
-            "position": [start, end],  # Use ORIGINAL indices
-            "classification": entity_type,
-            "entity": original_value
-        })
+    Returns one item per input text, in input order: either the tuple from
+    `mask_pii` (with the OffsetMap when `return_offset_map` is True), or the
+    Exception raised while masking that text.
+    """
+    mode = _resolve_ner_gate_mode(ner_gate)
+    if mode == "off":
+        gate_open = [True] * len(texts)
+    else:
+        gate_open = [may_contain_person(text) for text in texts]
+        closed = gate_open.count(False)
+        _count_ner_gate(checked=len(texts), closed=closed, ner_skipped=closed if mode == "on" else 0)
+    needs_ner = [is_open or mode != "on" for is_open in gate_open]
 
-    # Sort the final list by original start position for consistency
-    list_of_masked_entities.sort(key=lambda x: x["position"][0])
+    ner_indices = [i for i, needed in enumerate(needs_ner) if needed and not needs_windowing(texts[i], nlp)]
+    docs: List[Optional[spacy.tokens.Doc]] = [None] * len(texts)
+    try:
+        with stage_timer("ner_batch"):
+            piped = nlp.pipe([texts[i] for i in ner_indices], batch_size=batch_size, n_process=n_process)
+            for i, doc in zip(ner_indices, piped):
+                docs[i] = doc
+    except Exception as e:
+        # One bad text aborts nlp.pipe for the whole batch; fall back to
+        # running NER on each text on its own so the others still succeed.
+        logger.error(f"nlp.pipe failed for batch of {len(ner_indices)}, masking one by one: {e}")
+        docs = [None] * len(texts)
 
-    return masked_text, list_of_masked_entities
+    results: List[Union[tuple, Exception]] = []
+    for text, doc, needed, is_open in zip(texts, docs, needs_ner, gate_open):
+        try:
+            if doc is not None:
+                person_spans = find_person_spans(doc)
+            elif needed:
+                person_spans = ner_person_spans(text, nlp)
+            else:
+                person_spans = []
+            if not is_open and person_spans:
+                _count_ner_gate(shadow_mismatches=1)
+            results.append(mask_text_with_person_spans(text, person_spans, return_offset_map))
+        except Exception as e:
+            results.append(e)
+    return results
+
+# --- Result Cache Keys ---
+def result_cache_version(model_version: str) -> str:
+    """
+    Fingerprint of everything that determines a processing result: the
+    classifier version that serves it, REGEX_PATTERNS, the spaCy model/profile
+    and the long-document NER settings.
+    Cached results from a different fingerprint are never served.
+    """
+    fingerprint = json.dumps([
+        model_version,
+        REGEX_PATTERNS,
+        SPACY_MODEL_NAME,
+        SPACY_PROFILE,
+        SPACY_EXCLUDE,
+        NER_WINDOW_CHARS,
+        NER_WINDOW_OVERLAP_CHARS,
+        NER_CHAR_BUDGET,
+    ])
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
+
+def _result_cache_variant(ner_gate: Optional[str]) -> str:
+    # Only "on" can change the output; "off" and "shadow" share entries
+    return "gated" if _resolve_ner_gate_mode(ner_gate) == "on" else "full"
+
+def _from_cached(cached: dict, include_offset_map: bool) -> dict:
+    if not include_offset_map:
+        cached.pop("offset_map", None)
+    return cached
 
 # --- Main Processing Function (Defined within utils.py) ---
-def process_email_request(email_body: str) -> dict:
+def process_email_request(email_body: str, include_offset_map: bool = False, ner_gate: Optional[str] = None,
+                          deadline: Optional[float] = None) -> dict:
     """
     Processes the input email body for PII masking and classification.
     Loads models on first call if not already loaded.
+    With `include_offset_map`, the response also carries the masked <-> original
+    offset map (see OffsetMap.to_list) under "offset_map". `ner_gate` overrides
+    NER_GATE_MODE for this request. "model_version" names the classifier
+    version that produced the category. Raises DeadlineExceeded when the
+    time.monotonic() `deadline` passes before the NER, regex or predict stage.
     """
-    print("Processing email request...")  # Add log
+    logger.debug("Processing email request...")
     nlp = load_spacy_model()
-    pipeline = load_model_pipeline()
+    model = load_active_model()  # Used for the whole request, even if a reload swaps in a new version
 
     if nlp is None:
         return {"error": "spaCy model not loaded.", "input_email_body": email_body}
-    if pipeline is None:
+    if model is None:
         return {"error": "Classification pipeline not loaded.", "input_email_body": email_body}
 
+    cache = get_result_cache()
+    if cache is not None:
+        cache_version = result_cache_version(model.version)
+        cache_key = ResultCache.make_key(email_body, cache_version, _result_cache_variant(ner_gate))
+        cached = cache.get(cache_key, cache_version)
+        if cached is not None:
+            logger.debug("Result served from cache.")
+            return _from_cached(cached, include_offset_map)
+
     try:
+        cut_short = regex_scans_cut_short()
         # 1. Mask PII using the loaded spaCy model
         # Ensure mask_pii expects the nlp model as an argument if needed
-        masked_email_body, entities = mask_pii(email_body, nlp)  # Pass nlp model
-        print(f"PII Masking complete. Found {len(entities)} entities.")  # Add log
+        masked_email_body, entities, offset_map = mask_pii(
+            email_body, nlp, return_offset_map=True, ner_gate=ner_gate, deadline=deadline
+        )  # Pass nlp model
+        logger.debug("PII Masking complete. Found %d entities.", len(entities))
 
         # Convert entities to the required dict format if necessary
         # Assuming mask_pii already returns entities as list of dicts
         # with 'position', 'classification', 'entity' keys.
 
         # 2. Classify the masked email using the loaded pipeline
-        predicted_class = predict_category(masked_email_body, pipeline)
-        print(f"Classification complete. Predicted class: {predicted_class}")  # Add log
+        check_deadline(deadline, "predict")
+        predicted_class = predict_category(masked_email_body, model.pipeline)
+        logger.debug("Classification complete. Predicted class: %s", predicted_class)
 
         # 3. Construct the response dictionary
         response = {
             "input_email_body": email_body,
             "list_of_masked_entities": entities,  # Ensure this matches expected format
             "masked_email": masked_email_body,
-            "category_of_the_email": predicted_class
+            "category_of_the_email": predicted_class,
+            "model_version": model.version,
+            "offset_map": offset_map.to_list()
         }
-        print("Response constructed successfully.")  # Add log
-        return response
+        if cache is not None and regex_scans_cut_short() == cut_short:  # A budget-limited scan is not cached
+            cache.set(cache_key, cache_version, response)
+        logger.debug("Response constructed successfully.")
+        return _from_cached(response, include_offset_map)
 
+    except DeadlineExceeded:
+        raise  # Not a processing error; the API answers 504
     except Exception as e:
-        print(f"Error during email processing: {e}")  # Log the specific error
+        logger.error(f"Error during email processing: {e}")  # Log the specific error
         # Consider logging the full traceback for debugging
         # import traceback
         # print(traceback.format_exc())
@@ -200,4 +945,145 @@ def process_email_request(email_body: str) -> dict:
             "input_email_body": email_body
         }
 
-print("utils.py finished importing.") # Add print statement
+# --- Batch Processing Function ---
+def _drop_expired(indices: List[int], deadlines: Optional[List[Optional[float]]], stage: str,
+                  results: List[Any]) -> List[int]:
+    """The `indices` whose own deadline has not passed; the others get DeadlineExceeded(stage) as their result."""
+    if deadlines is None:
+        return indices
+    now = time.monotonic()
+    live = []
+    for i in indices:
+        if deadlines[i] is not None and now >= deadlines[i]:
+            results[i] = deadline_exceeded(stage)
+        else:
+            live.append(i)
+    return live
+
+def process_email_batch(
+    email_bodies: List[str],
+    batch_size: Optional[int] = None,
+    n_process: Optional[int] = None,
+    ner_gate: Optional[str] = None,
+    deadline: Optional[float] = None,
+    deadlines: Optional[List[Optional[float]]] = None,
+) -> List[Union[dict, DeadlineExceeded]]:
+    """
+    Processes many email bodies at once: PII masking via `nlp.pipe` and a single
+    vectorized `predict` call for classification. `ner_gate` overrides
+    NER_GATE_MODE for the whole batch. Raises DeadlineExceeded when the
+    time.monotonic() `deadline` passes before masking or before predict.
+
+    Returns one result per input, in input order. Each result has the same shape
+    as `process_email_request`; an email that fails gets its own error dict
+    instead of failing the whole batch. `deadlines` gives each email its own
+    deadline (coalesced single-email requests): an email whose deadline passes
+    before a stage is left out of it and gets the DeadlineExceeded as its result.
+    """
+    logger.debug("Processing email batch of %d...", len(email_bodies))
+    nlp = load_spacy_model()
+    model = load_active_model()  # One version for the whole batch
+
+    if nlp is None:
+        return [{"error": "spaCy model not loaded.", "input_email_body": body} for body in email_bodies]
+    if model is None:
+        return [{"error": "Classification pipeline not loaded.", "input_email_body": body} for body in email_bodies]
+
+    results: List[Optional[dict]] = [None] * len(email_bodies)
+    cache = get_result_cache()
+    if cache is not None:
+        cache_version = result_cache_version(model.version)
+        cache_variant = _result_cache_variant(ner_gate)
+
+    # 1. Mask PII for every valid, uncached email in one nlp.pipe pass
+    valid_indices = []
+    for i, body in enumerate(email_bodies):
+        if not isinstance(body, str):
+            results[i] = {
+                "error": f"email_body must be a string, got {type(body).__name__}",
+                "input_email_body": body
+            }
+            continue
+        if cache is not None:
+            cached = cache.get(ResultCache.make_key(body, cache_version, cache_variant), cache_version)
+            if cached is not None:
+                results[i] = _from_cached(cached, include_offset_map=False)
+                continue
+        valid_indices.append(i)
+
+    if valid_indices:
+        check_deadline(deadline, "ner")
+        valid_indices = _drop_expired(valid_indices, deadlines, "ner", results)
+    cut_short = regex_scans_cut_short()
+    masked = mask_pii_batch(
+        [email_bodies[i] for i in valid_indices],
+        nlp,
+        batch_size=batch_size or SPACY_BATCH_SIZE,
+        n_process=n_process or SPACY_N_PROCESS,
+        ner_gate=ner_gate,
+        return_offset_map=cache is not None,
+    )
+
+    masked_by_index = {}
+    for i, outcome in zip(valid_indices, masked):
+        if isinstance(outcome, Exception):
+            results[i] = {
+                "error": f"An error occurred during processing: {str(outcome)}",
+                "input_email_body": email_bodies[i]
+            }
+        else:
+            masked_by_index[i] = outcome
+
+    if cache is not None and regex_scans_cut_short() != cut_short:
+        cache = None  # Some scan in this batch hit the regex time budget; don't cache its results
+
+    # 2. Classify all masked emails with a single predict call
+    masked_indices = _drop_expired(list(masked_by_index), deadlines, "predict", results)
+    if masked_indices:
+        masked_bodies = [masked_by_index[i][0] for i in masked_indices]
+        check_deadline(deadline, "predict")
+        categories = predict_categories(masked_bodies, model.pipeline)
+        for i, masked_body, category in zip(masked_indices, masked_bodies, categories):
+            results[i] = {
+                "input_email_body": email_bodies[i],
+                "list_of_masked_entities": masked_by_index[i][1],
+                "masked_email": masked_body,
+                "category_of_the_email": category,
+                "model_version": model.version
+            }
+            if cache is not None:
+                cache_key = ResultCache.make_key(email_bodies[i], cache_version, cache_variant)
+                cache.set(cache_key, cache_version, dict(results[i], offset_map=masked_by_index[i][2].to_list()))
+
+    logger.debug("Batch processing complete for %d emails.", len(email_bodies))
+    return results
+
+# --- Warm-Up ---
+WARM_UP_EMAIL = (
+    "Hello, my name is Jane Doe and my email is jane.doe@example.com. I was charged twice "
+    "on card 4111 1111 1111 1111 and my phone is 555-123-4567. Please refund the second payment."
+)
+PREDICTION_FAILURES = ("Prediction Error", "Prediction failed", "Classification failed")
+
+def warm_up() -> bool:
+    """
+    Loads both models and runs one email through NER, the regex scan and the
+    classifier (bypassing the result cache), so the first real request pays
+    no lazy initialisation. Returns True when every stage worked.
+    """
+    nlp = load_spacy_model()
+    pipeline = load_model_pipeline()
+    if nlp is None or pipeline is None:
+        logger.error("Warm-up failed: %s not loaded.", "spaCy model" if nlp is None else "classification pipeline")
+        return False
+    try:
+        masked_email_body, _ = mask_pii(WARM_UP_EMAIL, nlp, ner_gate="off")
+    except Exception as e:
+        logger.error(f"Warm-up failed during PII masking: {e}")
+        return False
+    if predict_category(masked_email_body, pipeline) in PREDICTION_FAILURES:
+        logger.error("Warm-up failed during classification.")
+        return False
+    return True
+
+logger.debug("utils.py finished importing.")